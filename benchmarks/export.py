@@ -0,0 +1,226 @@
+#! /usr/bin/python3
+
+# Export throughput of the gltf2 object model on synthetic scenes, from building the Document to writing a GLB.
+#
+#   python benchmarks/export.py --quick
+#   python benchmarks/export.py --save benchmarks/baseline.json
+#   python benchmarks/export.py --compare benchmarks/baseline.json --tolerance 1.5
+#
+# Every scene is generated for each size n (1e2 to 1e6 by default, up to 1e4 with --quick), and the time per object is
+# printed alongside the totals, so that sizes where scaling stops being linear stand out. Peak memory is measured with
+# tracemalloc in a separate pass, since tracing slows down allocation-heavy phases. At 1e6, heavy_animation needs more
+# than 6 GiB of memory; pass --sizes or --cases to leave it out on smaller machines.
+#
+# Times are only comparable on the same machine, so no baseline is committed: save one from the base revision with
+# --save, then run --compare from the change under test with the same sizes. Sizes missing from the baseline are skipped.
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pygltf import gltf2 as gltf
+
+
+PHASES = ("build", "togltf", "json", "write")
+
+KEYFRAMES = 30
+
+SIZES = [100, 1000, 10000, 100000, 1000000]
+
+# Largest size run with --quick.
+QUICK_SIZE = 10000
+
+# Phases faster than this in the baseline are too noisy to compare.
+MIN_TIME = 0.01
+
+
+def small_meshes(n):
+    # n single-triangle meshes, each drawn by its own node.
+    document = gltf.Document()
+    builder = gltf.BufferBuilder(document)
+    positions = builder.add_array(np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]], np.float32), gltf.BufferTarget.ARRAY_BUFFER)
+    indices = builder.add_array(np.array([0, 1, 2], np.uint16), gltf.BufferTarget.ELEMENT_ARRAY_BUFFER, bounds=False)
+    nodes = []
+    for i in range(n):
+        mesh = gltf.Mesh([gltf.Primitive({gltf.Attribute.POSITION: positions}, indices, None)], name="Mesh {}".format(i))
+        document.add_mesh(mesh)
+        node = gltf.Node(name="Node {}".format(i), mesh=mesh, translation=[float(i), 0.0, 0.0])
+        document.add_node(node)
+        nodes.append(node)
+    document.add_scene(gltf.Scene(nodes=nodes))
+    return document
+
+def huge_mesh(n):
+    # One mesh of n triangles on a grid, with positions, normals and texture coordinates.
+    side = max(int(np.sqrt(n / 2)), 1) + 1
+    x, y = np.meshgrid(np.arange(side, dtype=np.float32), np.arange(side, dtype=np.float32))
+    vertices = np.zeros(side * side, [("POSITION", np.float32, 3), ("NORMAL", np.float32, 3), ("TEXCOORD_0", np.float32, 2)])
+    vertices["POSITION"][:, 0], vertices["POSITION"][:, 1] = x.ravel(), y.ravel()
+    vertices["NORMAL"][:, 2] = 1.0
+    vertices["TEXCOORD_0"] = vertices["POSITION"][:, :2] / side
+    grid = np.arange(side * side, dtype=np.uint32).reshape(side, side)
+    a, b, c, d = grid[:-1, :-1].ravel(), grid[:-1, 1:].ravel(), grid[1:, :-1].ravel(), grid[1:, 1:].ravel()
+    indices = np.stack([a, b, d, a, d, c], axis=1).ravel()[:3 * n]
+
+    document = gltf.Document()
+    builder = gltf.BufferBuilder(document)
+    attributes = {gltf.Attribute(key): value for key, value in builder.add_structured_array(vertices).items()}
+    indices = builder.add_array(indices, gltf.BufferTarget.ELEMENT_ARRAY_BUFFER, bounds=False)
+    mesh = gltf.Mesh([gltf.Primitive(attributes, indices, None)])
+    document.add_mesh(mesh)
+    node = gltf.Node(mesh=mesh)
+    document.add_node(node)
+    document.add_scene(gltf.Scene(nodes=[node]))
+    return document
+
+def deep_hierarchy(n):
+    # A chain of n nodes, each the only child of the previous one.
+    document = gltf.Document()
+    nodes = [gltf.Node(name="Node {}".format(i), translation=[0.0, 1.0, 0.0]) for i in range(n)]
+    for parent, child in zip(nodes, nodes[1:]):
+        parent.children = [child]
+    document.add_nodes(nodes)
+    document.add_scene(gltf.Scene(nodes=nodes[:1]))
+    return document
+
+def wide_hierarchy(n):
+    # One root with n children.
+    document = gltf.Document()
+    children = [gltf.Node(name="Node {}".format(i), translation=[float(i), 0.0, 0.0]) for i in range(n)]
+    root = gltf.Node(name="Root", children=children)
+    document.add_node(root)
+    document.add_nodes(children)
+    document.add_scene(gltf.Scene(nodes=[root]))
+    return document
+
+def heavy_animation(n):
+    # n animated nodes, each with its own translation and rotation tracks over shared keyframe times.
+    document = gltf.Document()
+    builder = gltf.BufferBuilder(document)
+    times = builder.add_array(np.linspace(0.0, 1.0, KEYFRAMES, dtype=np.float32))
+    rotation = np.zeros((KEYFRAMES, 4), np.float32)
+    rotation[:, 3] = 1.0
+    nodes, channels, samplers = [], [], []
+    for i in range(n):
+        node = gltf.Node(name="Node {}".format(i))
+        document.add_node(node)
+        nodes.append(node)
+        translation = np.zeros((KEYFRAMES, 3), np.float32)
+        translation[:, 0] = np.linspace(0.0, float(i), KEYFRAMES)
+        for path, values in ((gltf.TargetPath.TRANSLATION, translation), (gltf.TargetPath.ROTATION, rotation)):
+            output = builder.add_array(values, bounds=False)
+            channels.append(gltf.AnimationChannel(len(samplers), gltf.AnimationChannelTarget(node, path)))
+            samplers.append(gltf.AnimationSampler(times, output, interpolation=gltf.Interpolation.LINEAR))
+    document.add_animation(gltf.Animation(channels, samplers))
+    document.add_scene(gltf.Scene(nodes=nodes))
+    return document
+
+CASES = {
+    "small_meshes": small_meshes,
+    "huge_mesh": huge_mesh,
+    "deep_hierarchy": deep_hierarchy,
+    "wide_hierarchy": wide_hierarchy,
+    "heavy_animation": heavy_animation,
+}
+
+def phases(generate, n, path):
+    # Runs the export pipeline once, yielding each phase name after it completes. The write phase is save_glb, which
+    # encodes the JSON chunk again through iter_json.
+    document = generate(n)
+    yield "build"
+    data = document.togltf()
+    yield "togltf"
+    json.dumps(data, separators=(",", ":"))
+    yield "json"
+    document.save_glb(path)
+    yield "write"
+
+def timings(generate, n, path):
+    result = {}
+    gc.collect()
+    start = time.perf_counter()
+    for phase in phases(generate, n, path):
+        now = time.perf_counter()
+        result[phase], start = now - start, now
+    return result
+
+def peaks(generate, n, path):
+    # Peak traced memory of each phase, relative to the memory in use when the phase started.
+    result = {}
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    for phase in phases(generate, n, path):
+        current, peak = tracemalloc.get_traced_memory()
+        result[phase] = peak - base
+        tracemalloc.reset_peak()
+        base = current
+    tracemalloc.stop()
+    return result
+
+def measure(name, n, repeat, path):
+    times = [timings(CASES[name], n, path) for _ in range(repeat)]
+    result = {phase: min(item[phase] for item in times) for phase in PHASES}
+    result["peak"] = max(peaks(CASES[name], n, path).values())
+    result["bytes"] = os.path.getsize(path)
+    return result
+
+def compare(results, baseline, tolerance):
+    # Returns the (key, quantity, ratio) of every time or peak that grew by more than tolerance over the baseline.
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for quantity in PHASES + ("peak",):
+            old, new = baseline[key][quantity], result[quantity]
+            if old > (MIN_TIME if quantity in PHASES else 0) and new / old > tolerance:
+                regressions.append((key, quantity, new / old))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--sizes", nargs="+", type=lambda value: int(float(value)), default=SIZES)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the fastest is kept")
+    parser.add_argument("--quick", action="store_true", help="only run the sizes up to 1e4, once each")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="largest accepted ratio over the baseline")
+    args = parser.parse_args()
+    if args.quick:
+        args.sizes, args.repeat = [n for n in args.sizes if n <= QUICK_SIZE], 1
+
+    results = {}
+    print("{:<16} {:>8} {:>9} {:>9} {:>9} {:>9} {:>10} {:>10}".format("case", "n", *PHASES, "us/object", "peak MiB"))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "benchmark.glb")
+        for name in args.cases:
+            for n in args.sizes:
+                result = results["{}/{}".format(name, n)] = measure(name, n, args.repeat, path)
+                total = sum(result[phase] for phase in PHASES)
+                print("{:<16} {:>8} {:>8.3f}s {:>8.3f}s {:>8.3f}s {:>8.3f}s {:>10.2f} {:>10.1f}".format(
+                    name, n, *(result[phase] for phase in PHASES), 1e6 * total / n, result["peak"] / 2 ** 20))
+
+    if args.save:
+        with open(args.save, "w") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as fp:
+            regressions = compare(results, json.load(fp), args.tolerance)
+        for key, quantity, ratio in regressions:
+            print("REGRESSION {} {}: {:.2f}x baseline".format(key, quantity, ratio))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
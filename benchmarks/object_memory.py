@@ -0,0 +1,65 @@
+#! /usr/bin/python3
+
+# Per-object memory of the gltf2 object model, with __slots__ (current) and with a per-instance __dict__ (before).
+#
+#   python benchmarks/object_memory.py --count 100000
+
+import argparse
+import os
+import re
+import sys
+import tracemalloc
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pygltf import gltf2 as gltf
+
+
+def unslotted():
+    # The same module with every __slots__ declaration removed, i.e. with a per-instance __dict__ as before.
+    with open(gltf.__file__) as fp:
+        source = re.sub(r"^\s*__slots__ = .*$", "", fp.read(), flags=re.M)
+    module = types.ModuleType("gltf2_unslotted")
+    exec(compile(source, gltf.__file__, "exec"), module.__dict__)
+    return module
+
+def factories(module):
+    buffer = module.Buffer(1024)
+    buffer_view = module.BufferView(buffer, 0, 1024)
+    accessor = module.Accessor(buffer_view, None, 1, module.AccessorType.VEC3)
+    texture = module.Texture()
+    return {
+        "Node": lambda: module.Node(translation=[0.0, 0.0, 0.0]),
+        "Accessor": lambda: module.Accessor(buffer_view, None, 1, module.AccessorType.VEC3),
+        "BufferView": lambda: module.BufferView(buffer, 0, 1024),
+        "Primitive": lambda: module.Primitive({module.Attribute.POSITION: accessor}, None, None),
+        "TextureInfo": lambda: module.TextureInfo(texture),
+    }
+
+def measure(factory, count):
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    objects = [factory() for _ in range(count)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return (after - before) / count
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args()
+
+    slotted = factories(gltf)
+    dicted = factories(unslotted())
+
+    print("{:<12} {:>10} {:>10} {:>8}".format("class", "__dict__", "__slots__", "ratio"))
+    for name in slotted:
+        old = measure(dicted[name], args.count)
+        new = measure(slotted[name], args.count)
+        print("{:<12} {:>9.0f}B {:>9.0f}B {:>7.2f}x".format(name, old, new, old / new))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#! /usr/bin/python3
+
+# Converts numpy dumps to glTF in parallel, one input per worker task.
+#
+#   python -m pygltf meshes/*.npz --output out --format glb
+#   python -m pygltf --manifest inputs.txt --jobs 16
+#
+# A .npz holds one mesh: its structured arrays contribute one attribute per field, its other arrays one attribute each,
+# and an array named "indices" holds the triangle indices. A .npy holds a structured array of unindexed triangles.
+# Field and array names are glTF attribute names ("POSITION") or the lower case names of the README ("position").
+
+import argparse
+import concurrent.futures
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+from . import gltf2 as gltf
+
+
+ATTRIBUTE_BY_NAME = {
+    "position":  gltf.Attribute.POSITION,
+    "normal":    gltf.Attribute.NORMAL,
+    "tangent":   gltf.Attribute.TANGENT,
+    "texCoord":  gltf.Attribute.TEXCOORD_0,
+    "texCoord0": gltf.Attribute.TEXCOORD_0,
+    "texCoord1": gltf.Attribute.TEXCOORD_1,
+    "color":     gltf.Attribute.COLOR_0,
+    "joints":    gltf.Attribute.JOINTS_0,
+    "weights":   gltf.Attribute.WEIGHTS_0,
+}
+
+FORMATS = ("glb", "gltf")
+
+
+def attribute(name):
+    if name in ATTRIBUTE_BY_NAME:
+        return ATTRIBUTE_BY_NAME[name]
+    try:
+        return gltf.Attribute(name)
+    except ValueError:
+        # Application-specific attributes must start with an underscore.
+        return gltf.Attribute.custom(name if name.startswith("_") else "_" + name)
+
+def load_arrays(path):
+    if path.endswith(".npy"):
+        return {"vertices": np.load(path, mmap_mode="r")}
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+def single_precision(array):
+    # glTF has no double precision, so float64 arrays and fields are stored as float32.
+    if not array.dtype.fields:
+        return array.astype(np.float32) if array.dtype == np.float64 else array
+    fields = {key: array.dtype.fields[key][0] for key in array.dtype.names}
+    if all(dtype.base != np.float64 for dtype in fields.values()):
+        return array
+    result = np.empty(len(array), [(key, np.float32 if dtype.base == np.float64 else dtype.base, dtype.shape) for key, dtype in fields.items()])
+    for key in fields:
+        result[key] = array[key]
+    return result
+
+def index_array(indices):
+    indices = np.asarray(indices).ravel()
+    if indices.dtype.kind not in "ui" or (len(indices) and indices.min() < 0):
+        raise ValueError("Indices must be non-negative integers, got {}.".format(indices.dtype))
+    return indices.astype(np.uint16 if not len(indices) or indices.max() < np.iinfo(np.uint16).max else np.uint32, copy=False)
+
+def convert(source, target, format="glb"):
+    # Builds and writes the document for one input. Runs in a worker process, so it only takes and returns paths and
+    # numbers. Returns the time taken and the number of vertices and indices.
+    start = time.perf_counter()
+    arrays = load_arrays(source)
+    name = os.path.splitext(os.path.basename(source))[0]
+    document = gltf.Document()
+    builder = gltf.BufferBuilder(document)
+
+    attributes = {}
+    indices = None
+    for key, array in arrays.items():
+        array = single_precision(array)
+        if key == "indices":
+            indices = builder.add_array(index_array(array), gltf.BufferTarget.ELEMENT_ARRAY_BUFFER, bounds=False, name="Indices")
+        elif array.dtype.fields:
+            for field, accessor in builder.add_structured_array(array, name="{key}").items():
+                attributes[attribute(field)] = accessor
+        else:
+            attributes[attribute(key)] = builder.add_array(array, gltf.BufferTarget.ARRAY_BUFFER, name=key)
+    if gltf.Attribute.POSITION not in attributes:
+        raise ValueError("No position attribute in {}.".format(source))
+
+    mesh = gltf.Mesh([gltf.Primitive(attributes, indices, None)], name=name)
+    document.add_mesh(mesh)
+    node = gltf.Node(name=name, mesh=mesh)
+    document.add_node(node)
+    document.scene = gltf.Scene(nodes=[node], name=name)
+    document.add_scene(document.scene)
+
+    if format == "glb":
+        document.save_glb(target)
+    else:
+        bin_path = os.path.splitext(target)[0] + ".bin"
+        builder.buffer.uri = os.path.basename(bin_path)
+        with open(bin_path, "wb") as fp:
+            fp.write(builder.data)
+        with open(target, "w") as fp:
+            document.write_json(fp)
+    return time.perf_counter() - start, attributes[gltf.Attribute.POSITION].count, indices.count if indices else 0
+
+def expand(patterns):
+    # Patterns that match nothing are kept, so that the missing file is reported rather than silently skipped.
+    for pattern in patterns:
+        yield from sorted(glob.glob(pattern, recursive=True)) or [pattern]
+
+def read_manifest(path):
+    # One input per line, relative to the manifest; blank lines and lines starting with # are ignored.
+    base = os.path.dirname(path)
+    with open(path) as fp:
+        for line in fp:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield os.path.join(base, line)
+
+def output_path(source, output, format):
+    directory = os.path.dirname(source) if output is None else output
+    return os.path.join(directory, os.path.splitext(os.path.basename(source))[0] + "." + format)
+
+def run(sources, output=None, format="glb", jobs=None, out=sys.stdout, err=sys.stderr):
+    # Converts sources on a process pool, reporting each file as it finishes. Keeps at most a few tasks per worker in
+    # flight, so the manifest is never expanded into futures all at once. A worker that dies fails the files in flight
+    # and the pool is replaced. Returns the number of failures.
+    jobs = (os.cpu_count() or 1) if jobs is None else jobs
+    if output is not None:
+        os.makedirs(output, exist_ok=True)
+    start = time.perf_counter()
+    done, failed = 0, 0
+    executor = concurrent.futures.ProcessPoolExecutor(jobs)
+    try:
+        pending, broken = {}, False
+        sources = iter(sources)
+        while True:
+            if broken and not pending:
+                executor.shutdown()
+                executor, broken = concurrent.futures.ProcessPoolExecutor(jobs), False
+            for source in () if broken else sources:
+                pending[executor.submit(convert, source, output_path(source, output, format), format)] = source
+                if len(pending) >= 4 * jobs:
+                    break
+            if not pending:
+                break
+            finished, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                source = pending.pop(future)
+                try:
+                    elapsed, vertices, indices = future.result()
+                except Exception as error:
+                    broken |= isinstance(error, concurrent.futures.process.BrokenProcessPool)
+                    failed += 1
+                    print("FAILED {}: {}: {}".format(source, type(error).__name__, error), file=err)
+                else:
+                    done += 1
+                    print("{:8.3f}s {:>10} vertices {:>10} indices  {}".format(elapsed, vertices, indices, source), file=out)
+    finally:
+        executor.shutdown()
+    print("{} converted, {} failed in {:.3f}s with {} workers".format(done, failed, time.perf_counter() - start, jobs), file=out)
+    return failed
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m pygltf", description="Convert .npz and .npy mesh dumps to glTF.")
+    parser.add_argument("inputs", nargs="*", help="input files or glob patterns")
+    parser.add_argument("--manifest", action="append", default=[], help="file listing one input per line")
+    parser.add_argument("--output", "-o", help="output directory, next to each input by default")
+    parser.add_argument("--format", "-f", choices=FORMATS, default="glb", help="write .glb, or .gltf with a .bin")
+    parser.add_argument("--jobs", "-j", type=int, help="worker processes, the number of CPUs by default")
+    args = parser.parse_args(args)
+
+    sources = [source for path in args.manifest for source in read_manifest(path)] + list(expand(args.inputs))
+    if not sources:
+        parser.error("no inputs given")
+    return 1 if run(sources, args.output, args.format, args.jobs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
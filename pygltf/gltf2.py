@@ -1,6 +1,22 @@
 import enum
+import io
+import json
+import mmap
+import os
+import struct
+import base64
+import urllib.parse
 
 import collections
+import concurrent.futures
+import contextlib
+import logging
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # https://github.com/KhronosGroup/glTF/tree/master/specification/2.0
 
@@ -83,6 +99,12 @@ class Interpolation(enum.Enum):
     STEP        = "STEP"
     CUBICSPLINE = "CUBICSPLINE"
 
+class TargetPath(enum.Enum):
+    TRANSLATION = "translation"
+    ROTATION    = "rotation"
+    SCALE       = "scale"
+    WEIGHTS     = "weights"
+
 class Filter(enum.Enum):
     NEAREST = 9728 
     LINEAR = 9729
@@ -96,12 +118,250 @@ class Wrap(enum.Enum):
     MIRRORED_REPEAT = 33648 
     REPEAT = 10497
 
+# Component Type Values to (little-endian) NumPy Type Strings:
+
+DTYPE_BY_COMPONENT_TYPE = {
+    5120: "<i1",
+    5121: "<u1",
+    5122: "<i2",
+    5123: "<u2",
+    5124: "<i4",
+    5125: "<u4",
+    5126: "<f4",
+}
+
+COMPONENT_TYPE_BY_DTYPE = {
+    ("i", 1): ComponentType.BYTE,
+    ("u", 1): ComponentType.UNSIGNED_BYTE,
+    ("i", 2): ComponentType.SHORT,
+    ("u", 2): ComponentType.UNSIGNED_SHORT,
+    ("u", 4): ComponentType.UNSIGNED_INT,
+    ("f", 4): ComponentType.FLOAT,
+}
+
+SHAPE_BY_ACCESSOR_TYPE = {
+    AccessorType.SCALAR: (),
+    AccessorType.VEC2:   (2,),
+    AccessorType.VEC3:   (3,),
+    AccessorType.VEC4:   (4,),
+    AccessorType.MAT2:   (2, 2),
+    AccessorType.MAT3:   (3, 3),
+    AccessorType.MAT4:   (4, 4),
+}
+
+ACCESSOR_TYPE_BY_SHAPE = {
+    (1,): AccessorType.SCALAR,
+    (1, 1): AccessorType.SCALAR,
+    **{shape: type for type, shape in SHAPE_BY_ACCESSOR_TYPE.items()},
+}
+
+TRS_DEFAULTS = {
+    "translation": (0.0, 0.0, 0.0),
+    "rotation":    (0.0, 0.0, 0.0, 1.0),
+    "scale":       (1.0, 1.0, 1.0),
+}
+
 
 def askey(name):
     return name.replace(" ", "_").lower()
 
+def asenum(cls, value):
+    try:
+        return cls(value)
+    except ValueError:
+        return cls.custom(value)
+
+def objectargs(data):
+    return {key: data[key] for key in ["name", "extensions", "extras"] if key in data}
+
+
+# Binary glTF (GLB) Container:
+# https://github.com/KhronosGroup/glTF/tree/master/specification/2.0#glb-file-format-specification
+
+GLB_MAGIC = 0x46546C67
+GLB_VERSION = 2
+GLB_CHUNK_JSON = 0x4E4F534A
+GLB_CHUNK_BIN = 0x004E4942
+
+def padding(length, alignment=4):
+    return -length % alignment
+
+def mapfile(path):
+    with open(path, "rb") as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return memoryview(b"")
+        return memoryview(mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ))
+
+def loaduri(uri, base=None):
+    if uri.startswith("data:"):
+        header, _, payload = uri.partition(",")
+        return memoryview(base64.b64decode(payload) if header.endswith(";base64") else urllib.parse.unquote_to_bytes(payload))
+    return mapfile(os.path.join(base or "", urllib.parse.unquote(uri)))
+
+def rebased_uri(uri, base, target):
+    # uri, relative to the directory base, made relative to the directory target; None stands for the working directory.
+    # Data URIs, URLs and absolute paths are kept.
+    if not uri or (base or "") == (target or "") or urllib.parse.urlsplit(uri).scheme or os.path.isabs(urllib.parse.unquote(uri)):
+        return uri
+    path = os.path.relpath(os.path.join(base or "", urllib.parse.unquote(uri)), target or os.curdir)
+    return urllib.parse.quote(path.replace(os.sep, "/"))
+
+def shifted_indices(value, key, offset):
+    # A copy of a JSON value with offset added to every integer stored under key, at any depth.
+    if isinstance(value, dict):
+        return {name: item + offset if name == key and type(item) is int else shifted_indices(item, key, offset) for name, item in value.items()}
+    if isinstance(value, list):
+        return [shifted_indices(item, key, offset) for item in value]
+    return value
+
+def element_strides(dtype, shape):
+    # Matrix columns are stored column-major and start on 4-byte boundaries.
+    dtype = np.dtype(dtype)
+    if len(shape) == 2:
+        rows, columns = shape
+        column = rows * dtype.itemsize + padding(rows * dtype.itemsize)
+        return column * columns, (dtype.itemsize, column)
+    return dtype.itemsize * (shape[0] if shape else 1), (dtype.itemsize,) * len(shape)
+
+def strided_view(data, byteOffset, count, dtype, shape, byteStride=None):
+    # np.ndarray releases the buffer of data right away, np.frombuffer keeps it exported: while the view lives, a
+    # bytearray cannot be resized under it (see BufferBuilder.append).
+    if data is None:
+        raise ValueError("Buffer data is not loaded.")
+    itemsize, strides = element_strides(dtype, shape)
+    byteStride = itemsize if byteStride is None else byteStride
+    return np.ndarray((count,) + shape, dtype, buffer=np.frombuffer(data, np.uint8), offset=byteOffset, strides=(byteStride,) + strides)
+
+def normalize(array):
+    info = np.iinfo(array.dtype)
+    result = array.astype(np.float32) / np.float32(info.max)
+    if info.min < 0:
+        np.maximum(result, -1.0, out=result)
+    return result
+
+def trs_matrices(translation, rotation, scale):
+    # Vectorized T * R * S for (n, 3) translations, (n, 4) unit quaternions (x, y, z, w) and (n, 3) scales.
+    x, y, z, w = np.asarray(rotation, np.float64).T
+    result = np.zeros((len(x), 4, 4))
+    result[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    result[:, 0, 1] = 2 * (x * y - z * w)
+    result[:, 0, 2] = 2 * (x * z + y * w)
+    result[:, 1, 0] = 2 * (x * y + z * w)
+    result[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    result[:, 1, 2] = 2 * (y * z - x * w)
+    result[:, 2, 0] = 2 * (x * z - y * w)
+    result[:, 2, 1] = 2 * (y * z + x * w)
+    result[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    result[:, :3, :3] *= np.asarray(scale, np.float64)[:, None, :]
+    result[:, :3, 3] = translation
+    result[:, 3, 3] = 1
+    return result
+
+def decompose(matrices):
+    # Inverse of trs_matrices for (n, 4, 4) affine matrices. Returns translations, rotations, scales and a mask of the
+    # matrices that are exactly TRS up to tolerance; sheared ones are not.
+    matrices = np.asarray(matrices, np.float64)
+    translation = matrices[:, :3, 3].copy()
+    linear = matrices[:, :3, :3]
+    scale = np.linalg.norm(linear, axis=1)
+    scale[:, 0] *= np.where(np.linalg.det(linear) < 0, -1.0, 1.0)
+    m = linear / np.where(scale == 0.0, 1.0, scale)[:, None, :]
+    valid = np.all(scale != 0.0, axis=1) & np.all(np.abs(m @ np.swapaxes(m, 1, 2) - np.eye(3)) < 1e-5, axis=(1, 2))
+    # Shepperd's method, each quaternion computed from its largest component.
+    trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+    largest = np.argmax(np.stack([trace, m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]], axis=1), axis=1)
+    candidates = np.empty((4, len(m), 4))
+    s = np.sqrt(np.maximum(1.0 + trace, 1e-12)) * 2.0
+    candidates[0] = np.stack([m[:, 2, 1] - m[:, 1, 2], m[:, 0, 2] - m[:, 2, 0], m[:, 1, 0] - m[:, 0, 1], 0.25 * s * s], axis=1) / s[:, None]
+    s = np.sqrt(np.maximum(1.0 + m[:, 0, 0] - m[:, 1, 1] - m[:, 2, 2], 1e-12)) * 2.0
+    candidates[1] = np.stack([0.25 * s * s, m[:, 0, 1] + m[:, 1, 0], m[:, 0, 2] + m[:, 2, 0], m[:, 2, 1] - m[:, 1, 2]], axis=1) / s[:, None]
+    s = np.sqrt(np.maximum(1.0 + m[:, 1, 1] - m[:, 0, 0] - m[:, 2, 2], 1e-12)) * 2.0
+    candidates[2] = np.stack([m[:, 0, 1] + m[:, 1, 0], 0.25 * s * s, m[:, 1, 2] + m[:, 2, 1], m[:, 0, 2] - m[:, 2, 0]], axis=1) / s[:, None]
+    s = np.sqrt(np.maximum(1.0 + m[:, 2, 2] - m[:, 0, 0] - m[:, 1, 1], 1e-12)) * 2.0
+    candidates[3] = np.stack([m[:, 0, 2] + m[:, 2, 0], m[:, 1, 2] + m[:, 2, 1], 0.25 * s * s, m[:, 1, 0] - m[:, 0, 1]], axis=1) / s[:, None]
+    rotation = candidates[largest, np.arange(len(m))]
+    rotation /= np.linalg.norm(rotation, axis=1, keepdims=True)
+    return translation, rotation, scale, valid
+
+def local_matrices(nodes):
+    translation = np.array([node.translation or (0.0, 0.0, 0.0) for node in nodes], np.float64).reshape(-1, 3)
+    rotation = np.array([node.rotation or (0.0, 0.0, 0.0, 1.0) for node in nodes], np.float64).reshape(-1, 4)
+    scale = np.array([node.scale or (1.0, 1.0, 1.0) for node in nodes], np.float64).reshape(-1, 3)
+    result = trs_matrices(translation, rotation, scale)
+    for index, node in enumerate(nodes):
+        if node.matrix:
+            result[index] = np.reshape(node.matrix, (4, 4)).T
+    return result
+
+def propagate(parent, levels, local, world, dirty=None):
+    # Computes world = world[parent] @ local one hierarchy level at a time, restricted to dirty rows and their descendants.
+    dirty = np.ones(len(local), bool) if dirty is None else dirty.copy()
+    for level in levels:
+        inherited = level[parent[level] >= 0]
+        dirty[inherited] |= dirty[parent[inherited]]
+        level = level[dirty[level]]
+        roots, inherited = level[parent[level] < 0], level[parent[level] >= 0]
+        world[roots] = local[roots]
+        world[inherited] = world[parent[inherited]] @ local[inherited]
+    return world
+
+def slerp(a, b, u):
+    # Spherical interpolation of (..., 4) quaternions along the shortest arc.
+    dot = np.sum(a * b, axis=-1, keepdims=True)
+    b = np.where(dot < 0, -b, b)
+    theta = np.arccos(np.clip(np.abs(dot), 0.0, 1.0))
+    sin = np.sin(theta)
+    small = sin < 1e-6
+    sin = np.where(small, 1.0, sin)
+    wa = np.where(small, 1 - u, np.sin((1 - u) * theta) / sin)
+    wb = np.where(small, u, np.sin(u * theta) / sin)
+    result = wa * a + wb * b
+    return result / np.linalg.norm(result, axis=-1, keepdims=True)
+
+def interpolate(keys, values, time, interpolation, rotation=False):
+    # values is (keyframes, 1, width), or (keyframes, 3, width) holding in-tangent, value and out-tangent for CUBICSPLINE.
+    count = len(keys)
+    if count == 1:
+        return np.repeat(values[:, values.shape[1] // 2], len(time), axis=0)
+    index = np.clip(np.searchsorted(keys, time, side="right") - 1, 0, count - 2)
+    delta = (keys[index + 1] - keys[index])[:, None]
+    u = np.clip((time[:, None] - keys[index][:, None]) / delta, 0.0, 1.0)
+    if interpolation == Interpolation.STEP:
+        return values[np.where(u[:, 0] >= 1.0, index + 1, index), 0]
+    if interpolation == Interpolation.CUBICSPLINE:
+        u2, u3 = u * u, u * u * u
+        result = ((2 * u3 - 3 * u2 + 1) * values[index, 1] + (u3 - 2 * u2 + u) * delta * values[index, 2]
+            + (-2 * u3 + 3 * u2) * values[index + 1, 1] + (u3 - u2) * delta * values[index + 1, 0])
+        if rotation:
+            result = result.reshape(len(time), -1, 4)
+            result = (result / np.linalg.norm(result, axis=-1, keepdims=True)).reshape(len(time), -1)
+        return result
+    a, b = values[index, 0], values[index + 1, 0]
+    if rotation:
+        return slerp(a.reshape(len(time), -1, 4), b.reshape(len(time), -1, 4), u[:, :, None]).reshape(len(time), -1)
+    return a + (b - a) * u
+
+def writev(fp, views):
+    # Writes a sequence of byte memoryviews without joining them, resuming after partial writes.
+    try:
+        fd = fp.fileno()
+        limit = os.sysconf("SC_IOV_MAX")
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        for view in views:
+            fp.write(view)
+        return
+    fp.flush()
+    views = collections.deque(view for view in views if view.nbytes)
+    while views:
+        written = os.writev(fd, [views[index] for index in range(min(limit, len(views)))])
+        while views and written >= views[0].nbytes:
+            written -= views.popleft().nbytes
+        if written:
+            views[0] = views[0][written:]
+
 
 class Object(object):
+    __slots__ = ("name", "extensions", "extras", "cache")
     def __init__(self, *args, **kwargs):
         self.name = kwargs.get("name")
         self.extensions = kwargs.get("extensions")
@@ -117,7 +377,176 @@ class Object(object):
         return result
 
 
+# Incremental serialization, see Document.incremental. The first time the glTF of an object is cached, the object and
+# the nested objects its glTF includes (primitives, texture infos, ...) switch to a tracked subclass with the same
+# layout, whose attribute assignments drop the cache; objects never serialized incrementally pay nothing. The cache
+# slot holds (generation, glTF, separators, JSON text) for top-level objects and the list of top-level objects
+# including it for nested ones. Changing the key of a tracked object starts a new generation, since any other object
+# may refer to it by key.
+
+generation = 0
+
+UNTRACKED = frozenset(["cache", "revision", "worldCache"])
+
+TRACKED = {}
+
+def new_generation():
+    global generation
+    generation += 1
+
+def tracked_setattr(self, name, value):
+    if name == "key" and getattr(self, "key", value) != value:
+        new_generation()
+    object.__setattr__(self, name, value)
+    if name not in UNTRACKED:
+        invalidate(self)
+
+def tracked(cls):
+    # The tracked subclass of cls, registered in this module so that tracked objects still pickle.
+    if cls.__setattr__ is tracked_setattr:
+        return cls
+    result = TRACKED.get(cls)
+    if result is None:
+        name = "Tracked" + cls.__name__
+        result = TRACKED[cls] = globals()[name] = type(name, (cls,), {"__slots__": (), "__setattr__": tracked_setattr, "__module__": __name__})
+    return result
+
+def nested_objects(value):
+    # The nested objects in the slots of value, directly or in lists and dicts, and recursively those in them.
+    cls = type(value)
+    names = NESTED_SLOTS.get(cls)
+    if names is None:
+        names = NESTED_SLOTS[cls] = next((NESTED_SLOTS[base] for base in cls.__mro__ if base in NESTED_SLOTS), ())
+    for name in names:
+        item = getattr(value, name, None)
+        items = item.values() if isinstance(item, dict) else item if isinstance(item, list) else (item,)
+        for item in items:
+            if isinstance(item, NESTED_TYPES):
+                yield item
+                yield from nested_objects(item)
+
+def track(value):
+    if type(value).__setattr__ is not tracked_setattr:
+        value.__class__ = tracked(type(value))
+    for item in nested_objects(value):
+        item.__class__ = tracked(type(item))
+        owners = getattr(item, "cache", None)
+        if owners is None:
+            object.__setattr__(item, "cache", [value])
+        elif value not in owners:
+            owners.append(value)
+
+def invalidate(value):
+    # Drops the cached glTF of a top-level object, or of the top-level objects whose glTF includes a nested one.
+    cache = getattr(value, "cache", None)
+    if cache is None:
+        return
+    if isinstance(value, NESTED_TYPES):
+        for owner in cache:
+            object.__setattr__(owner, "cache", None)
+    else:
+        object.__setattr__(value, "cache", None)
+
+def cached_gltf(value):
+    cache = getattr(value, "cache", None)
+    if cache is None or cache[0] != generation:
+        track(value)
+        cache = (generation, value.togltf(), None, None)
+        object.__setattr__(value, "cache", cache)
+    return cache[1]
+
+def cached_json(value, encode, separators):
+    cache = getattr(value, "cache", None)
+    if cache is None or cache[0] != generation:
+        track(value)
+        result = value.togltf()
+    elif cache[2] != separators:
+        result = cache[1]
+    else:
+        return cache[3]
+    cache = (generation, result, separators, encode(result))
+    object.__setattr__(value, "cache", cache)
+    return cache[3]
+
+
+# Top-level arrays in the order they are serialized.
+
+GLTF_ARRAYS = [
+    "buffers",
+    "bufferViews",
+    "accessors",
+    "animations",
+    "cameras",
+    "images",
+    "materials",
+    "meshes",
+    "nodes",
+    "samplers",
+    "scenes",
+    "skins",
+    "textures",
+]
+
+# Integers under a key in the extensions of objects of an array that index another array, renumbered by Document.merge:
+# the textureInfo indices of KHR_materials_*, the image sources of KHR_texture_basisu and similar, and the buffers of
+# EXT_meshopt_compression.
+EXTENSION_REFERENCES = {
+    "bufferViews": ("buffer", "buffers"),
+    "materials":   ("index", "textures"),
+    "textures":    ("source", "images"),
+}
+
+
+class Instrumentation(object):
+    # Passes export metrics to sinks, callables taking (metric, value, tags). Metrics are "phase.<name>" in seconds,
+    # "count.<array>" in objects and "bytes.<part>" in bytes. Assign one to Document.instrumentation to cover every
+    # document, including Document.load, or to a single document, see Document.instrumented.
+    def __init__(self, *sinks):
+        self.sinks = list(sinks)
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        return sink
+    def emit(self, metric, value, **tags):
+        for sink in self.sinks:
+            sink(metric, value, tags)
+    @contextlib.contextmanager
+    def phase(self, name, **tags):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.emit("phase." + name, time.perf_counter() - start, **tags)
+    def counts(self, document):
+        for name in GLTF_ARRAYS:
+            count = len(getattr(document, name))
+            if name == "nodes":
+                count += sum(len(table) for table in document.nodeTables)
+            if count:
+                self.emit("count." + name, count)
+
+NO_PHASE = contextlib.nullcontext()
+
+def phase(instrumentation, name, **tags):
+    # Times a block if instrumentation is enabled; otherwise costs a single comparison.
+    return NO_PHASE if instrumentation is None else instrumentation.phase(name, **tags)
+
+def log_sink(logger=None, level=logging.INFO):
+    # A sink writing one record per metric to logger, the "pygltf" logger by default.
+    logger = logging.getLogger("pygltf") if logger is None else logger
+    def sink(metric, value, tags):
+        if logger.isEnabledFor(level):
+            logger.log(level, "%s %s%s", metric, value, "".join(" {}={}".format(key, tag) for key, tag in tags.items()))
+    return sink
+
+
 class Document(object):
+    # Opt-in metrics, see Instrumentation.
+    instrumentation = None
+    # With incremental set, togltf and iter_json reuse the output of objects not assigned to since the previous export.
+    # In-place changes to lists and dicts, such as mesh.primitives.append(...), are not seen: pass the changed object
+    # to invalidate afterwards, as the passes in optimize do. Objects must be added before an export that refers to them.
+    incremental = False
+    
     @classmethod
     def from_mesh(cls, mesh, material=None):
         materials = [] if material is None else [material]
@@ -142,6 +571,8 @@ class Document(object):
     
     def __init__(self, *args, **kwargs):
         self.asset        = {"version": "2.0"}
+        self.extensionsUsed     = kwargs.get('extensionsUsed', [])
+        self.extensionsRequired = kwargs.get('extensionsRequired', [])
         self.accessors    = []
         self.animations   = []
         self.buffers      = []
@@ -155,7 +586,11 @@ class Document(object):
         self.scenes       = []
         self.skins        = []
         self.textures     = []
+        self.nodeTables   = []
         self.scene        = kwargs.get('scene', None)
+        self.incremental  = kwargs.get('incremental', False)
+        # Directory that relative uris are resolved against, the working directory when None. Set by load.
+        self.base         = kwargs.get('base', None)
         
         self.add_accessors(kwargs.get('accessors', []))
         self.add_animations(kwargs.get('animations', []))
@@ -170,6 +605,7 @@ class Document(object):
         self.add_scenes(kwargs.get('scenes', []))
         self.add_skins(kwargs.get('skins', []))
         self.add_textures(kwargs.get('textures', []))
+        self.add_node_tables(kwargs.get('nodeTables', []))
     
     def add_accessor(self, value):
         value.key = len(self.accessors)
@@ -198,6 +634,14 @@ class Document(object):
     def add_node(self, value):
         value.key = len(self.nodes)
         self.nodes.insert(value.key, value)
+        for table in self.nodeTables:
+            table.key += 1
+        if self.nodeTables:
+            new_generation()
+    def add_node_table(self, value):
+        # Table rows are numbered after all regular nodes.
+        value.key = len(self.nodes) + sum(len(table) for table in self.nodeTables)
+        self.nodeTables.append(value)
     def add_sampler(self, value):
         value.key = len(self.samplers)
         self.samplers.insert(value.key, value)
@@ -211,6 +655,26 @@ class Document(object):
         value.key = len(self.textures)
         self.textures.insert(value.key, value)
     
+    def add_instances(self, builder, mesh, translation=None, rotation=None, scale=None, name=None):
+        # Adds one node that draws mesh once per row of (n, 3) translation, (n, 4) rotation and (n, 3) scale arrays with
+        # EXT_mesh_gpu_instancing; the arrays are packed with builder. Instance transforms apply before the node's own.
+        instances = {}
+        for key, value in (("TRANSLATION", translation), ("ROTATION", rotation), ("SCALE", scale)):
+            if value is not None:
+                instances[key] = builder.add_array(np.asarray(value, np.float32), bounds=False, name=name and "{} {}".format(name, key.lower()))
+        if len({accessor.count for accessor in instances.values()}) != 1:
+            raise ValueError("Expected instance arrays of one length.")
+        result = Node(mesh=mesh, instances=instances, name=name)
+        self.add_node(result)
+        self.use_extension("EXT_mesh_gpu_instancing", required=True)
+        return result
+    
+    def use_extension(self, name, required=False):
+        if name not in self.extensionsUsed:
+            self.extensionsUsed.append(name)
+        if required and name not in self.extensionsRequired:
+            self.extensionsRequired.append(name)
+    
     def add_accessors(self, values):
         for value in values:
             self.add_accessor(value)
@@ -250,51 +714,399 @@ class Document(object):
     def add_textures(self, values):
         for value in values:
             self.add_texture(value)
+    def add_node_tables(self, values):
+        for value in values:
+            self.add_node_table(value)
+    
+    def compact_buffers(self):
+        # Rewrites every buffer with data to hold only the byte ranges its bufferViews use, in offset order. Overlapping
+        # views keep sharing their bytes, and each range keeps its offset modulo 4. Builders of a rewritten buffer append
+        # after its new end. Returns the number of bytes dropped.
+        views = collections.defaultdict(list)
+        for bufferView in self.bufferViews:
+            views[bufferView.buffer].append(bufferView)
+        # Buffers without bufferViews are left to the caller.
+        saved = 0
+        for buffer in self.buffers:
+            if buffer.data is None or not views[buffer]:
+                continue
+            source = memoryview(buffer.data).cast("B")
+            data = bytearray()
+            stop = -1
+            for bufferView in sorted(views[buffer], key=lambda bufferView: bufferView.byteOffset or 0):
+                offset = bufferView.byteOffset or 0
+                if offset >= stop:
+                    data += bytes((offset - len(data)) % 4)
+                    shift = len(data) - offset
+                if offset + bufferView.byteLength > stop:
+                    data += source[max(stop, offset):offset + bufferView.byteLength]
+                    stop = offset + bufferView.byteLength
+                bufferView.byteOffset = offset + shift
+            saved += buffer.byteLength - len(data)
+            buffer.data = data
+            buffer.byteLength = len(data)
+            if buffer.uri and buffer.uri.startswith("data:"):
+                buffer.uri = "data:application/octet-stream;base64," + base64.b64encode(data).decode("ascii")
+        return saved
+    
+    def prune(self):
+        # Drops every object that no scene reaches, renumbers the keys of the rest and compacts the buffers to the
+        # bufferViews left. Animation channels are kept while their node is reached, node tables while any of their
+        # rows is. Keys inside extension dicts are not rewritten. Returns the number of objects removed per array and
+        # the number of buffer bytes saved.
+        if "EXT_meshopt_compression" in self.extensionsUsed:
+            raise ValueError("Prune before compressing, compressed streams are not bufferViews.")
+        reached = set()
+        stack = [node for scene in self.scenes for node in scene.nodes]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, NodeRef):
+                node = node.table
+            if node in reached:
+                continue
+            reached.add(node)
+            if isinstance(node, NodeTable):
+                reached.update(node.meshes)
+                reached.update(node.cameras)
+                continue
+            stack.extend(node.children)
+            stack.extend(node.lods or ())
+            reached.update((node.mesh, node.camera))
+            if node.instances:
+                reached.update(node.instances.values())
+            if node.skin is not None and node.skin not in reached:
+                reached.update((node.skin, node.skin.inverseBindMatrices))
+                stack.extend(node.skin.joints)
+                if node.skin.skeleton is not None:
+                    stack.append(node.skin.skeleton)
+        
+        for animation in self.animations:
+            channels = [channel for channel in animation.channels if channel.target.node is None
+                or (channel.target.node.table if isinstance(channel.target.node, NodeRef) else channel.target.node) in reached]
+            if not channels:
+                continue
+            reached.add(animation)
+            if len(channels) < len(animation.channels):
+                samplers = {}
+                for channel in channels:
+                    channel.sampler = samplers.setdefault(channel.sampler, len(samplers))
+                animation.samplers = [animation.samplers[index] for index in samplers]
+                animation.channels = channels
+            for sampler in animation.samplers:
+                reached.update((sampler.input, sampler.output))
+        for mesh in self.meshes:
+            if mesh in reached:
+                for primitive in mesh.primitives:
+                    reached.update(primitive.attributes.values())
+                    reached.update((primitive.indices, primitive.material))
+                    for target in primitive.targets or ():
+                        reached.update(target.values())
+        for material in self.materials:
+            if material in reached:
+                pbr = material.pbrMetallicRoughness
+                infos = (material.normalTexture, material.occlusionTexture, material.emissiveTexture) + \
+                    ((pbr.baseColorTexture, pbr.metallicRoughnessTexture) if pbr else ())
+                reached.update(info.index for info in infos if info)
+        for texture in self.textures:
+            if texture in reached:
+                reached.update((texture.sampler, texture.source))
+        for image in self.images:
+            if image in reached:
+                reached.add(image.bufferView)
+        for accessor in self.accessors:
+            if accessor in reached:
+                reached.add(accessor.bufferView)
+                if accessor.sparse:
+                    reached.update((accessor.sparse.indices.bufferView, accessor.sparse.values.bufferView))
+        for bufferView in self.bufferViews:
+            if bufferView in reached:
+                reached.add(bufferView.buffer)
+        
+        result = {}
+        for name in ("accessors", "animations", "buffers", "bufferViews", "cameras", "images", "materials", "meshes", "nodes", "samplers", "skins", "textures"):
+            values = [value for value in getattr(self, name) if value in reached]
+            for key, value in enumerate(values):
+                value.key = key
+            result[name] = len(getattr(self, name)) - len(values)
+            setattr(self, name, values)
+        tables = [table for table in self.nodeTables if table in reached]
+        result["nodeTables"] = len(self.nodeTables) - len(tables)
+        self.nodeTables = []
+        self.add_node_tables(tables)
+        result["bytes"] = self.compact_buffers()
+        return result
+    
+    def merge(self, *documents, merge_scenes=False):
+        # Appends every object of documents, renumbering keys as it goes. Objects and buffers are moved rather than
+        # copied, so each input buffer stays a separate buffer and the documents must not be used afterwards. With
+        # merge_scenes, the root nodes of each document's default scene join the default scene of this one instead of
+        # its scenes being added. Relative buffer and image uris are rebased from each document's base to this one's.
+        # Keys inside extension dicts are renumbered only where EXTENSION_REFERENCES names them, other extensions
+        # referring to objects by key are left as they are.
+        extensions = [dict.fromkeys(self.extensionsUsed), dict.fromkeys(self.extensionsRequired)]
+        tables = self.nodeTables
+        target = None
+        if merge_scenes:
+            if self.scene is None:
+                if not self.scenes:
+                    self.add_scene(Scene())
+                self.scene = self.scenes[0]
+            target = self.scene
+        for document in documents:
+            if document is self:
+                raise ValueError("Cannot merge a document into itself.")
+            for value in document.buffers + document.images:
+                value.uri = rebased_uri(value.uri, document.base, self.base)
+            for name, (key, array) in EXTENSION_REFERENCES.items():
+                offset = len(getattr(self, array))
+                for value in getattr(document, name) if offset else ():
+                    if value.extensions:
+                        value.extensions = shifted_indices(value.extensions, key, offset)
+            for name in GLTF_ARRAYS:
+                values = getattr(document, name)
+                if name == "scenes" and merge_scenes:
+                    scene = document.scene or (values[0] if values else None)
+                    if scene is not None:
+                        target.nodes.extend(scene.nodes)
+                    continue
+                objects = getattr(self, name)
+                for key, value in enumerate(values, len(objects)):
+                    value.key = key
+                objects.extend(values)
+            tables.extend(document.nodeTables)
+            extensions[0].update(dict.fromkeys(document.extensionsUsed))
+            extensions[1].update(dict.fromkeys(document.extensionsRequired))
+            if self.scene is None:
+                self.scene = document.scene
+        # Table rows are numbered after all regular nodes.
+        self.nodeTables = []
+        self.add_node_tables(tables)
+        self.extensionsUsed, self.extensionsRequired = list(extensions[0]), list(extensions[1])
+        if target is not None:
+            invalidate(target)
+    
+    def invalidate(self, value=None):
+        # Drops the cached output of value after an in-place change, or of every object when value is None.
+        if value is None:
+            new_generation()
+        else:
+            invalidate(value)
+    
+    def iter_gltf(self, name):
+        if self.incremental:
+            yield from map(cached_gltf, getattr(self, name))
+        else:
+            for value in getattr(self, name):
+                yield value.togltf()
+        if name == "nodes":
+            for table in self.nodeTables:
+                yield from table.iter_gltf()
+    
+    def iter_encoded(self, name, encode, separators):
+        if not self.incremental:
+            yield from map(encode, self.iter_gltf(name))
+            return
+        for value in getattr(self, name):
+            yield cached_json(value, encode, separators)
+        if name == "nodes":
+            for table in self.nodeTables:
+                yield from map(encode, table.iter_gltf())
+    
+    @contextlib.contextmanager
+    def instrumented(self, *sinks):
+        # Reports the metrics of this document to sinks for the duration of the block.
+        previous, self.instrumentation = self.__dict__.get("instrumentation"), Instrumentation(*sinks)
+        try:
+            yield self.instrumentation
+        finally:
+            if previous is None:
+                del self.instrumentation
+            else:
+                self.instrumentation = previous
     
     def togltf(self):
         result = {}
-        result["asset"] = self.asset
-        if self.buffers:
-            result["buffers"]     = [buffer.togltf()      for buffer      in self.buffers]
-        if self.bufferViews:
-            result["bufferViews"] = [bufferView.togltf()  for bufferView  in self.bufferViews]
-        if self.accessors:
-            result["accessors"]   = [accessor.togltf()    for accessor    in self.accessors]
-        if self.animations:
-            result["animations"]  = [animation.togltf()   for animation   in self.animations]
-        if self.cameras:
-            result["cameras"]     = [camera.togltf()      for camera      in self.cameras]
-        if self.images:
-            result["images"]      = [image.togltf()       for image       in self.images]
-        if self.materials:
-            result["materials"]   = [material.togltf()    for material    in self.materials]
-        if self.meshes:
-            result["meshes"]      = [mesh.togltf()        for mesh        in self.meshes]
-        if self.nodes:
-            result["nodes"]       = [node.togltf()        for node        in self.nodes]
-        if self.samplers:
-            result["samplers"]    = [sampler.togltf()     for sampler     in self.samplers]
-        if self.scenes:
-            result["scenes"]      = [scene.togltf()       for scene       in self.scenes]
-        if self.skins:
-            result["skins"]       = [skin.togltf()        for skin        in self.skins]
-        if self.textures:
-            result["textures"]    = [texture.togltf()     for texture     in self.textures]
+        with phase(self.instrumentation, "togltf"):
+            result["asset"] = self.asset
+            if self.extensionsUsed:
+                result["extensionsUsed"] = self.extensionsUsed
+            if self.extensionsRequired:
+                result["extensionsRequired"] = self.extensionsRequired
+            for name in GLTF_ARRAYS:
+                values = list(self.iter_gltf(name))
+                if values:
+                    result[name] = values
+            if self.scene:
+                result["scene"] = self.scene.key
+        if self.instrumentation is not None:
+            self.instrumentation.counts(self)
+        return result
+    
+    def iter_json(self, separators=None):
+        # Yields the same text as json.dumps(self.togltf()), but encodes the top-level arrays one object at a time.
+        item_separator, key_separator = (", ", ": ") if separators is None else separators
+        encode = json.JSONEncoder(separators=(item_separator, key_separator)).encode
+        yield "{" + encode("asset") + key_separator + encode(self.asset)
+        if self.extensionsUsed:
+            yield item_separator + encode("extensionsUsed") + key_separator + encode(self.extensionsUsed)
+        if self.extensionsRequired:
+            yield item_separator + encode("extensionsRequired") + key_separator + encode(self.extensionsRequired)
+        for name in GLTF_ARRAYS:
+            values = self.iter_encoded(name, encode, (item_separator, key_separator))
+            value = next(values, None)
+            if value is not None:
+                yield item_separator + encode(name) + key_separator + "[" + value
+                for value in values:
+                    yield item_separator + value
+                yield "]"
         if self.scene:
-            result["scene"] = self.scene.key
+            yield item_separator + encode("scene") + key_separator + encode(self.scene.key)
+        yield "}"
+    
+    @classmethod
+    def fromgltf(cls, data):
+        # Arrays are read in dependency order, so every reference is a single list lookup.
+        result = cls()
+        result.asset = data.get("asset", result.asset)
+        result.extensionsUsed = data.get("extensionsUsed", [])
+        result.extensionsRequired = data.get("extensionsRequired", [])
+        result.add_buffers(Buffer.fromgltf(item, result) for item in data.get("buffers", []))
+        result.add_buffer_views(BufferView.fromgltf(item, result) for item in data.get("bufferViews", []))
+        result.add_accessors(Accessor.fromgltf(item, result) for item in data.get("accessors", []))
+        result.add_images(Image.fromgltf(item, result) for item in data.get("images", []))
+        result.add_samplers(Sampler.fromgltf(item, result) for item in data.get("samplers", []))
+        result.add_textures(Texture.fromgltf(item, result) for item in data.get("textures", []))
+        result.add_materials(Material.fromgltf(item, result) for item in data.get("materials", []))
+        result.add_meshes(Mesh.fromgltf(item, result) for item in data.get("meshes", []))
+        result.add_cameras(Camera.fromgltf(item, result) for item in data.get("cameras", []))
+        result.add_nodes(Node.fromgltf(item, result) for item in data.get("nodes", []))
+        result.add_skins(Skin.fromgltf(item, result) for item in data.get("skins", []))
+        for node, item in zip(result.nodes, data.get("nodes", [])):
+            if "children" in item:
+                node.children = [result.nodes[index] for index in item["children"]]
+            if "skin" in item:
+                node.skin = result.skins[item["skin"]]
+            if "MSFT_lod" in item.get("extensions", {}):
+                node.lods = [result.nodes[index] for index in item["extensions"]["MSFT_lod"]["ids"]]
+        result.add_animations(Animation.fromgltf(item, result) for item in data.get("animations", []))
+        result.add_scenes(Scene.fromgltf(item, result) for item in data.get("scenes", []))
+        if "scene" in data:
+            result.scene = result.scenes[data["scene"]]
         return result
+    
+    @classmethod
+    def load(cls, path):
+        # Buffer payloads are memory-mapped rather than read, see Accessor.as_array.
+        with phase(cls.instrumentation, "load"):
+            data = mapfile(path)
+            if data.nbytes >= 12 and struct.unpack_from("<I", data)[0] == GLB_MAGIC:
+                length, type = struct.unpack_from("<II", data, 12)
+                if type != GLB_CHUNK_JSON:
+                    raise ValueError("Expected JSON chunk, got 0x{:08X}.".format(type))
+                result = cls.fromgltf(json.loads(data[20:20 + length].tobytes().decode("utf-8")))
+                offset = 20 + length
+                if offset + 8 <= data.nbytes and result.buffers and result.buffers[0].uri is None:
+                    length, type = struct.unpack_from("<II", data, offset)
+                    if type != GLB_CHUNK_BIN:
+                        raise ValueError("Expected BIN chunk, got 0x{:08X}.".format(type))
+                    result.buffers[0].data = data[offset + 8:offset + 8 + length]
+            else:
+                result = cls.fromgltf(json.loads(data.tobytes().decode("utf-8")))
+            base = result.base = os.path.dirname(path)
+            for buffer in result.buffers:
+                if buffer.uri:
+                    buffer.data = loaduri(buffer.uri, base)
+        if cls.instrumentation is not None:
+            cls.instrumentation.counts(result)
+        return result
+    
+    def write_json(self, fp, separators=None):
+        with phase(self.instrumentation, "json"):
+            fp.writelines(self.iter_json(separators))
+        if self.instrumentation is not None:
+            self.instrumentation.counts(self)
+    
+    @contextlib.contextmanager
+    def packed(self):
+        # For the duration of the block, every other buffer with data and no uri, such as those of merged documents,
+        # is laid out after the first buffer as part of it: their bufferViews are rebased and they are left out of
+        # buffers. Yields the data of the first buffer followed by theirs, with padding, without copying any of it.
+        first = self.buffers[0] if self.buffers else None
+        result = [] if first is None or first.data is None else [first.data]
+        length = sum(memoryview(data).nbytes for data in result)
+        packed = {}
+        for buffer in self.buffers[1:] if result else ():
+            if buffer.data is not None and buffer.uri is None:
+                result.append(bytes(padding(length)))
+                length += padding(length)
+                packed[buffer] = length
+                result.append(buffer.data)
+                length += memoryview(buffer.data).nbytes
+        if not packed:
+            yield result
+            return
+        buffers, byteLength = self.buffers, first.byteLength
+        moved = [(bufferView, bufferView.buffer, bufferView.byteOffset) for bufferView in self.bufferViews if bufferView.buffer in packed]
+        try:
+            self.buffers = [buffer for buffer in buffers if buffer not in packed]
+            for key, buffer in enumerate(self.buffers):
+                buffer.key = key
+            for bufferView, buffer, byteOffset in moved:
+                bufferView.buffer, bufferView.byteOffset = first, packed[buffer] + (byteOffset or 0)
+            yield result
+        finally:
+            for bufferView, buffer, byteOffset in moved:
+                bufferView.buffer, bufferView.byteOffset = buffer, byteOffset
+            self.buffers, first.byteLength = buffers, byteLength
+            for key, buffer in enumerate(buffers):
+                buffer.key = key
+    
+    def save_glb(self, path, buffers=None):
+        # Writes a GLB whose BIN chunk is the concatenation of buffers (any buffer-protocol objects). By default these
+        # are the data of the first buffer and of the buffers packed into it, see packed.
+        with self.packed() if buffers is None else contextlib.nullcontext(buffers) as buffers:
+            views = [memoryview(buffer).cast("B") for buffer in buffers]
+            length = sum(view.nbytes for view in views)
+            
+            if views:
+                if not self.buffers:
+                    self.add_buffer(Buffer())
+                self.buffers[0].byteLength = length
+                self.buffers[0].uri = None
+            
+            with phase(self.instrumentation, "json"):
+                data = "".join(self.iter_json(separators=(",", ":"))).encode("utf-8")
+                data += b" " * padding(len(data))
+        
+        chunks = [memoryview(struct.pack("<II", len(data), GLB_CHUNK_JSON)), memoryview(data)]
+        if views:
+            views.append(memoryview(bytes(padding(length))))
+            chunks.append(memoryview(struct.pack("<II", length + padding(length), GLB_CHUNK_BIN)))
+            chunks.extend(views)
+        total = 12 + sum(chunk.nbytes for chunk in chunks)
+        header = memoryview(struct.pack("<III", GLB_MAGIC, GLB_VERSION, total))
+        
+        with phase(self.instrumentation, "write"), open(path, "wb") as fp:
+            writev(fp, [header] + chunks)
+        if self.instrumentation is not None:
+            self.instrumentation.counts(self)
+            self.instrumentation.emit("bytes.json", len(data))
+            if views:
+                self.instrumentation.emit("bytes.buffer", length, buffer=self.buffers[0].key)
+            self.instrumentation.emit("bytes.file", total)
 
 glTF = Document
 
 
 class Accessor(Object):
+    __slots__ = ("key", "bufferView", "byteOffset", "componentType", "normalized", "count", "type", "max", "min", "sparse")
     def __init__(self, bufferView, byteOffset=None, count=0, type=AccessorType.SCALAR, componentType=ComponentType.FLOAT, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.key  = -1
         self.bufferView = bufferView
         self.byteOffset = byteOffset
         self.componentType = componentType
-        self.normalized = False
+        self.normalized = kwargs.get("normalized", False)
         self.count = count
         self.type = type
         self.max = kwargs.get("max")
@@ -302,8 +1114,11 @@ class Accessor(Object):
         self.sparse = kwargs.get("sparse")
     def togltf(self):
         result = super().togltf()
-        result["bufferView"] = self.bufferView.key
+        if self.bufferView:
+            result["bufferView"] = self.bufferView.key
         result["componentType"] = self.componentType.value
+        if self.normalized:
+            result["normalized"] = self.normalized
         result["count"] = self.count
         result["type"] = self.type.value
         if self.byteOffset is not None:
@@ -315,9 +1130,32 @@ class Accessor(Object):
         if self.sparse:
             result["sparse"] = self.sparse.togltf()
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        bufferView = document.bufferViews[data["bufferView"]] if "bufferView" in data else None
+        sparse = AccessorSparse.fromgltf(data["sparse"], document) if "sparse" in data else None
+        return cls(bufferView, data.get("byteOffset"), data["count"], AccessorType(data["type"]), asenum(ComponentType, data["componentType"]),
+            normalized=data.get("normalized", False), max=data.get("max"), min=data.get("min"), sparse=sparse, **objectargs(data))
+    def as_array(self, normalized=True):
+        # A view into the buffer data when possible; sparse and normalized accessors have to be materialized.
+        dtype = DTYPE_BY_COMPONENT_TYPE[self.componentType.value]
+        shape = SHAPE_BY_ACCESSOR_TYPE[self.type]
+        if self.bufferView is None:
+            result = np.zeros((self.count,) + shape, dtype)
+        else:
+            bufferView = self.bufferView
+            byteOffset = (bufferView.byteOffset or 0) + (self.byteOffset or 0)
+            result = strided_view(bufferView.buffer.data, byteOffset, self.count, dtype, shape, bufferView.byteStride)
+        if self.sparse:
+            result = result.copy()
+            result[self.sparse.indices.as_array(self.sparse.count)] = self.sparse.values.as_array(self.sparse.count, dtype, shape)
+        if self.normalized and normalized:
+            result = normalize(result)
+        return result
 
 
 class AccessorSparse(object):
+    __slots__ = ("count", "indices", "values", "cache")
     def __init__(self, count, indices, values, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.count = count
@@ -329,11 +1167,17 @@ class AccessorSparse(object):
         result["indices"] = self.indices.togltf()
         result["values"] = self.values.togltf()
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        indices = AccessorSparseIndices.fromgltf(data["indices"], document)
+        values = AccessorSparseValues.fromgltf(data["values"], document)
+        return cls(data["count"], indices, values)
 
 Accessor.Sparse = AccessorSparse
 
 
 class AccessorSparseIndices(object):
+    __slots__ = ("bufferView", "byteOffset", "componentType", "cache")
     def __init__(self, bufferView, byteOffset=None, componentType=ComponentType.UNSIGNED_BYTE, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.bufferView = bufferView
@@ -346,11 +1190,18 @@ class AccessorSparseIndices(object):
         if self.byteOffset is not None:
             result["byteOffset"] = self.byteOffset
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        return cls(document.bufferViews[data["bufferView"]], data.get("byteOffset"), asenum(ComponentType, data["componentType"]))
+    def as_array(self, count):
+        byteOffset = (self.bufferView.byteOffset or 0) + (self.byteOffset or 0)
+        return strided_view(self.bufferView.buffer.data, byteOffset, count, DTYPE_BY_COMPONENT_TYPE[self.componentType.value], ())
 
 Accessor.Sparse.Indices = AccessorSparseIndices
 
 
 class AccessorSparseValues(object):
+    __slots__ = ("bufferView", "byteOffset", "cache")
     def __init__(self, bufferView, byteOffset=None, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.bufferView = bufferView
@@ -361,11 +1212,18 @@ class AccessorSparseValues(object):
         if self.byteOffset is not None:
             result["byteOffset"] = self.byteOffset
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        return cls(document.bufferViews[data["bufferView"]], data.get("byteOffset"))
+    def as_array(self, count, dtype, shape):
+        byteOffset = (self.bufferView.byteOffset or 0) + (self.byteOffset or 0)
+        return strided_view(self.bufferView.buffer.data, byteOffset, count, dtype, shape)
         
 Accessor.Sparse.Values = AccessorSparseValues
 
 
 class Animation(Object):
+    __slots__ = ("key", "channels", "samplers")
     def __init__(self, channels, samplers, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.key   = -1
@@ -376,9 +1234,42 @@ class Animation(Object):
         result["channels"] = [channel.togltf() for channel in self.channels]
         result["samplers"] = [sampler.togltf() for sampler in self.samplers]
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        channels = [AnimationChannel.fromgltf(item, document) for item in data["channels"]]
+        samplers = [AnimationSampler.fromgltf(item, document) for item in data["samplers"]]
+        return cls(channels, samplers, **objectargs(data))
+    def sample(self, time):
+        # Samples every channel at time (a scalar or an array of times) and returns {channel: values}.
+        # Channels sharing keyframes and interpolation are interpolated together in one batch.
+        time = np.asarray(time, np.float64)
+        groups = collections.defaultdict(list)
+        for channel in self.channels:
+            sampler = self.samplers[channel.sampler]
+            groups[(sampler.input, sampler.interpolation, channel.target.path == TargetPath.ROTATION)].append(channel)
+        result = {}
+        for (input, interpolation, rotation), channels in groups.items():
+            keys = input.as_array().astype(np.float64)
+            width = 3 if interpolation == Interpolation.CUBICSPLINE else 1
+            outputs = [self.samplers[channel.sampler].output.as_array().reshape(len(keys), width, -1) for channel in channels]
+            values = interpolate(keys, np.concatenate(outputs, axis=-1).astype(np.float64), time.reshape(-1), interpolation, rotation)
+            offsets = np.cumsum([0] + [output.shape[-1] for output in outputs])
+            for channel, start, stop in zip(channels, offsets[:-1], offsets[1:]):
+                result[channel] = values[:, start:stop].reshape(time.shape + (stop - start,))
+        return result
+    def apply(self, time):
+        # Writes the values at a single time into the targeted nodes' translation, rotation, scale and weights, or into
+        # the columns of NodeTable rows.
+        for channel, value in self.sample(time).items():
+            node = channel.target.node
+            if isinstance(node, NodeRef):
+                node.table.assign(channel.target.path.value, node.index, value)
+            elif node is not None:
+                setattr(node, channel.target.path.value, value.tolist())
 
 
 class AnimationChannel(object):
+    __slots__ = ("sampler", "target", "cache")
     def __init__(self, sampler, target, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.sampler = sampler
@@ -386,13 +1277,37 @@ class AnimationChannel(object):
     def togltf(self):
         result = {}
         result["sampler"] = self.sampler
-        result["target"] = self.target.key
+        result["target"] = self.target.togltf()
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        return cls(data["sampler"], AnimationChannelTarget.fromgltf(data["target"], document))
     
 Animation.Channel = AnimationChannel
 
 
+class AnimationChannelTarget(object):
+    __slots__ = ("node", "path", "cache")
+    def __init__(self, node, path, *args, **kwargs):
+        super().__init__(*args, **kwargs) 
+        self.node = node
+        self.path = path
+    def togltf(self):
+        result = {}
+        if self.node:
+            result["node"] = self.node.key
+        result["path"] = self.path.value
+        return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        node = document.nodes[data["node"]] if "node" in data else None
+        return cls(node, TargetPath(data["path"]))
+
+Animation.Channel.Target = AnimationChannelTarget
+
+
 class AnimationSampler(Object):
+    __slots__ = ("input", "output", "interpolation")
     def __init__(self, input, output, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.input = input
@@ -404,25 +1319,36 @@ class AnimationSampler(Object):
         result["output"] = self.output.key
         result["interpolation"] = self.interpolation.value
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        input = document.accessors[data["input"]]
+        output = document.accessors[data["output"]]
+        return cls(input, output, interpolation=Interpolation(data.get("interpolation", "LINEAR")), **objectargs(data))
 
 Animation.Sampler = AnimationSampler
 
 
 class Buffer(Object):
+    __slots__ = ("key", "byteLength", "uri", "data")
     def __init__(self, byteLength=0, uri=None, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.key   = -1
         self.byteLength = byteLength
         self.uri = uri
+        self.data = kwargs.get("data")
     def togltf(self):
         result = super().togltf()
         result["byteLength"] = self.byteLength
         if self.uri:
             result["uri"] =  self.uri
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        return cls(data["byteLength"], data.get("uri"), **objectargs(data))
 
 
 class BufferView(Object):
+    __slots__ = ("key", "buffer", "byteOffset", "byteLength", "byteStride", "target")
     def __init__(self, buffer, byteOffset=None, byteLength=0, byteStride=None, target=BufferTarget.ARRAY_BUFFER, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.key    = -1
@@ -442,11 +1368,17 @@ class BufferView(Object):
         if self.target:
             result["target"] = self.target.value
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        target = BufferTarget(data["target"]) if "target" in data else None
+        return cls(document.buffers[data["buffer"]], data.get("byteOffset"), data["byteLength"], data.get("byteStride"), target, **objectargs(data))
 
 
 class Camera(Object):
+    __slots__ = ("key", "orthographic", "perspective", "type")
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs) 
+        self.key   = -1
         self.orthographic = kwargs.get("orthographic")
         self.perspective = kwargs.get("perspective")
         self.type = kwargs.get("type")
@@ -459,9 +1391,15 @@ class Camera(Object):
         if self.type:
             result["type"] = self.type
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        orthographic = CameraOrthographic.fromgltf(data["orthographic"], document) if "orthographic" in data else None
+        perspective = CameraPerspective.fromgltf(data["perspective"], document) if "perspective" in data else None
+        return cls(orthographic=orthographic, perspective=perspective, type=data.get("type"), **objectargs(data))
 
 
 class CameraOrthographic(Object):
+    __slots__ = ("xmag", "ymag", "zfar", "znear")
     def __init__(self, xmag, ymag, zfar, znear, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.xmag = xmag
@@ -475,11 +1413,15 @@ class CameraOrthographic(Object):
         result["zfar"] = self.zfar
         result["znear"] = self.znear
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        return cls(data["xmag"], data["ymag"], data["zfar"], data["znear"], **objectargs(data))
 
 Camera.Orthographic = CameraOrthographic
 
 
 class CameraPerspective(Object):
+    __slots__ = ("aspectRatio", "yfov", "zfar", "znear")
     def __init__(self, yfov, znear, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.aspectRatio = kwargs.get("aspectRatio")
@@ -495,11 +1437,15 @@ class CameraPerspective(Object):
             result["zfar"] = self.zfar
         result["znear"] = self.znear
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        return cls(data["yfov"], data["znear"], aspectRatio=data.get("aspectRatio"), zfar=data.get("zfar"), **objectargs(data))
 
 Camera.Perspective = CameraPerspective
 
 
 class Image(Object):
+    __slots__ = ("key", "uri", "mimeType", "bufferView")
     def __init__(self, uri=None, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.key  = -1
@@ -515,9 +1461,14 @@ class Image(Object):
         if self.bufferView:
             result["bufferView"] = self.bufferView.key
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        bufferView = document.bufferViews[data["bufferView"]] if "bufferView" in data else None
+        return cls(data.get("uri"), mimeType=data.get("mimeType"), bufferView=bufferView, **objectargs(data))
 
 
 class Material(Object):
+    __slots__ = ("key", "pbrMetallicRoughness", "normalTexture", "occlusionTexture", "emissiveTexture", "emissiveFactor", "alphaMode", "alphaCutoff", "doubleSided")
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.key  = -1
@@ -539,16 +1490,33 @@ class Material(Object):
             result["occlusionTexture"] = self.occlusionTexture.togltf()
         if self.emissiveTexture:
             result["emissiveTexture"] = self.emissiveTexture.togltf()
+        if self.emissiveFactor:
+            result["emissiveFactor"] = self.emissiveFactor
         if self.alphaMode:
             result["alphaMode"] = self.alphaMode.value
-        if self.alphaCutoff:
+        if self.alphaCutoff is not None:
             result["alphaCutoff"] = self.alphaCutoff
         if self.doubleSided:
             result["doubleSided"] = self.doubleSided
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        kwargs = objectargs(data)
+        if "pbrMetallicRoughness" in data:
+            kwargs["pbrMetallicRoughness"] = PBRMetallicRoughness.fromgltf(data["pbrMetallicRoughness"], document)
+        for key in ["normalTexture", "occlusionTexture", "emissiveTexture"]:
+            if key in data:
+                kwargs[key] = TextureInfo.fromgltf(data[key], document)
+        if "alphaMode" in data:
+            kwargs["alphaMode"] = AlphaMode(data["alphaMode"])
+        for key in ["emissiveFactor", "alphaCutoff", "doubleSided"]:
+            if key in data:
+                kwargs[key] = data[key]
+        return cls(**kwargs)
 
 
 class PBRMetallicRoughness(object):
+    __slots__ = ("baseColorFactor", "baseColorTexture", "metallicFactor", "roughnessFactor", "metallicRoughnessTexture", "extensions", "extras", "cache")
     def __init__(self, *args, **kwargs):
         self.baseColorFactor = kwargs.get("baseColorFactor")
         self.baseColorTexture = kwargs.get("baseColorTexture")
@@ -563,9 +1531,9 @@ class PBRMetallicRoughness(object):
             result["baseColorFactor"] = self.baseColorFactor
         if self.baseColorTexture:
             result["baseColorTexture"] = self.baseColorTexture.togltf()
-        if self.metallicFactor:
+        if self.metallicFactor is not None:
             result["metallicFactor"] = self.metallicFactor
-        if self.roughnessFactor:
+        if self.roughnessFactor is not None:
             result["roughnessFactor"] = self.roughnessFactor
         if self.metallicRoughnessTexture:
             result["metallicRoughnessTexture"] = self.metallicRoughnessTexture.togltf()
@@ -574,10 +1542,21 @@ class PBRMetallicRoughness(object):
         if self.extras:
             result["extras"] = self.extras
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        kwargs = objectargs(data)
+        for key in ["baseColorTexture", "metallicRoughnessTexture"]:
+            if key in data:
+                kwargs[key] = TextureInfo.fromgltf(data[key], document)
+        for key in ["baseColorFactor", "metallicFactor", "roughnessFactor"]:
+            if key in data:
+                kwargs[key] = data[key]
+        return cls(**kwargs)
 
 Material.PBRMetallicRoughness = PBRMetallicRoughness
 
 class Mesh(Object):
+    __slots__ = ("key", "primitives", "weights")
     def __init__(self, primitives, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.key  = -1
@@ -589,9 +1568,14 @@ class Mesh(Object):
         if self.weights:
             result["weights"] =  self.weights
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        primitives = [Primitive.fromgltf(item, document) for item in data["primitives"]]
+        return cls(primitives, weights=data.get("weights"), **objectargs(data))
 
 
 class Primitive(object):
+    __slots__ = ("attributes", "indices", "material", "mode", "targets", "extensions", "extras", "cache")
     def __init__(self, attributes, indices, material, mode=PrimitiveMode.TRIANGLES, **kwargs):
         self.attributes = attributes
         self.indices = indices
@@ -611,20 +1595,130 @@ class Primitive(object):
         if self.mode:
             result["mode"] = self.mode.value
         if self.targets:
-            result["targets"] = self.targets
+            result["targets"] = [{key.value: accessor.key for key, accessor in target.items()} for target in self.targets]
         if self.extensions:
             result["extensions"] = self.extensions
         if self.extras:
             result["extras"] = self.extras
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        attributes = {asenum(Attribute, key): document.accessors[value] for key, value in data["attributes"].items()}
+        indices = document.accessors[data["indices"]] if "indices" in data else None
+        material = document.materials[data["material"]] if "material" in data else None
+        mode = PrimitiveMode(data.get("mode", PrimitiveMode.TRIANGLES.value))
+        targets = [{asenum(Attribute, key): document.accessors[value] for key, value in target.items()} for target in data["targets"]] if "targets" in data else None
+        return cls(attributes, indices, material, mode, targets=targets, extensions=data.get("extensions"), extras=data.get("extras"))
+    def add_target(self, builder, values, epsilon=None, name=None):
+        # Appends a morph target given the morphed (absolute) values of some attributes, see BufferBuilder.add_target.
+        # Copies, since builder may append to the buffer the base streams are read from.
+        base = {key: np.array(self.attributes[asenum(Attribute, key)].as_array()) for key in values}
+        target = builder.add_target(base, values, epsilon, name)
+        self.targets = (self.targets or []) + [target]
+        return target
+    def influences(self):
+        # Stacks all JOINTS_n/WEIGHTS_n sets into (vertices, 4 * sets) arrays.
+        joints, weights = [], []
+        while True:
+            key = len(joints)
+            joint = self.attributes.get(asenum(Attribute, "JOINTS_{}".format(key)))
+            weight = self.attributes.get(asenum(Attribute, "WEIGHTS_{}".format(key)))
+            if joint is None or weight is None:
+                break
+            joints.append(joint.as_array().astype(np.intp))
+            weights.append(weight.as_array().astype(np.float32))
+        if not joints:
+            raise ValueError("Primitive has no JOINTS_0 and WEIGHTS_0 attributes.")
+        return np.concatenate(joints, axis=1), np.concatenate(weights, axis=1)
+    def skinned(self, jointMatrices, chunk=1 << 16):
+        # Returns the posed POSITION, NORMAL and TANGENT streams for (joints, 4, 4) joint matrices, see Skin.joint_matrices.
+        joints, weights = self.influences()
+        jointMatrices = np.asarray(jointMatrices, np.float32)[:, :3, :]
+        streams = {key: self.attributes[key].as_array() for key in [Attribute.POSITION, Attribute.NORMAL, Attribute.TANGENT] if key in self.attributes}
+        result = {key: np.empty(value.shape, np.float32) for key, value in streams.items()}
+        for start in range(0, len(joints), chunk):
+            stop = start + chunk
+            # Weighted sum of the (3, 4) joint matrices, one influence column at a time to bound temporary memory.
+            blend = np.zeros((len(joints[start:stop]), 3, 4), np.float32)
+            for column in range(joints.shape[1]):
+                blend += weights[start:stop, column, None, None] * jointMatrices[joints[start:stop, column]]
+            # Normals take the inverse transpose, as the cofactor matrix with the sign of the determinant: it has the
+            # same direction and stays finite for singular blends.
+            linear = blend[:, :, :3]
+            cofactor = np.cross(linear[:, [1, 2, 0]], linear[:, [2, 0, 1]])
+            cofactor *= np.where(np.linalg.det(linear) < 0, -1.0, 1.0).astype(np.float32)[:, None, None]
+            for key, value in streams.items():
+                vectors = np.einsum("nij,nj->ni", cofactor if key == Attribute.NORMAL else linear, value[start:stop, :3])
+                if key == Attribute.POSITION:
+                    result[key][start:stop] = vectors + blend[:, :, 3]
+                else:
+                    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                    result[key][start:stop, :3] = vectors
+                    result[key][start:stop, 3:] = value[start:stop, 3:]
+        return result
+    def weld(self, builder, epsilon=None):
+        # Collapses vertices whose attribute streams are all bitwise equal, or equal after rounding floats to epsilon.
+        # The surviving vertices keep their first-use order; the new streams and indices are written with builder.
+        # Morph target displacements take part in the comparison. Returns the old-to-new vertex index map.
+        # Copies, not views, since builder may be the one writing the buffer they are read from.
+        streams = {key: np.array(accessor.as_array(normalized=False)) for key, accessor in self.attributes.items()}
+        targets = [{key: np.array(accessor.as_array(normalized=False)) for key, accessor in target.items()} for target in self.targets or []]
+        count = len(next(iter(streams.values())))
+        columns = []
+        for value in list(streams.values()) + [value for target in targets for value in target.values()]:
+            value = value.reshape(count, -1)
+            if value.dtype.kind == "f":
+                value = np.round(value / epsilon).astype(np.int64) if epsilon else value + 0.0
+            columns.append(np.ascontiguousarray(value).view(np.uint8).reshape(count, -1))
+        rows = np.ascontiguousarray(np.concatenate(columns, axis=1))
+        rows = rows.view(np.dtype((np.void, rows.shape[1]))).ravel()
+        _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        remap = rank[inverse.ravel()]
+        kept = first[order]
+        
+        indices = remap if self.indices is None else remap[self.indices.as_array()]
+        indices = indices.astype(np.uint16 if len(kept) <= np.iinfo(np.uint16).max else np.uint32)
+        self.attributes = {key: builder.add_array(streams[key][kept], BufferTarget.ARRAY_BUFFER, accessor.normalized, name=accessor.name)
+            for key, accessor in self.attributes.items()}
+        if self.targets:
+            self.targets = [{key: builder.add_sparse_array(values[key][kept], None, BufferTarget.ARRAY_BUFFER, accessor.normalized, name=accessor.name)
+                for key, accessor in target.items()} for target, values in zip(self.targets, targets)]
+        self.indices = builder.add_array(indices, BufferTarget.ELEMENT_ARRAY_BUFFER, bounds=False, name=self.indices.name if self.indices else None)
+        return remap
 
 Mesh.Primitive = Primitive
 
 
+def skin_primitives(items, max_workers=None):
+    # Skins many (primitive, jointMatrices) pairs on a thread pool, numpy releases the GIL in the heavy loops.
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        return list(executor.map(lambda item: item[0].skinned(item[1]), items))
+
+
+def revised(name):
+    # A property that counts assignments in Node.revision, so cached transforms know what changed.
+    attribute = "_" + name
+    def fget(self):
+        return getattr(self, attribute)
+    def fset(self, value):
+        setattr(self, attribute, value)
+        self.revision += 1
+    return property(fget, fset)
+
+
 class Node(Object):
+    __slots__ = ("key", "camera", "children", "skin", "_matrix", "mesh", "_rotation", "_scale", "_translation", "weights", "instances", "lods", "revision")
+    matrix      = revised("matrix")
+    rotation    = revised("rotation")
+    scale       = revised("scale")
+    translation = revised("translation")
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.key         = -1
+        self.revision    = 0
         self.camera      = kwargs.get('camera')
         self.children    = kwargs.get('children', [])
         self.skin        = kwargs.get('skin')
@@ -634,8 +1728,15 @@ class Node(Object):
         self.scale       = kwargs.get('scale')
         self.translation = kwargs.get('translation')
         self.weights     = kwargs.get('weights')
+        self.instances   = kwargs.get('instances')
+        self.lods        = kwargs.get('lods')
     def togltf(self):
         result = super().togltf()
+        if self.instances:
+            instancing = {"attributes": {key: accessor.key for key, accessor in self.instances.items()}}
+            result["extensions"] = dict(result.get("extensions", {}), EXT_mesh_gpu_instancing=instancing)
+        if self.lods:
+            result["extensions"] = dict(result.get("extensions", {}), MSFT_lod={"ids": [node.key for node in self.lods]})
         if self.children:
             result["children"] = [child.key for child in self.children]
         if self.camera:
@@ -655,9 +1756,167 @@ class Node(Object):
         if self.weights:
             result["weights"] = self.weights
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        # Children and skin may refer forward, they are resolved by Document.fromgltf.
+        camera = document.cameras[data["camera"]] if "camera" in data else None
+        mesh = document.meshes[data["mesh"]] if "mesh" in data else None
+        # Extensions with typed attributes are taken out of extensions; MSFT_lod ids are resolved by Document.fromgltf.
+        args = objectargs(data)
+        if "extensions" in args:
+            extensions = dict(args["extensions"])
+            instancing = extensions.pop("EXT_mesh_gpu_instancing", None)
+            extensions.pop("MSFT_lod", None)
+            args["extensions"] = extensions or None
+            if instancing:
+                args["instances"] = {key: document.accessors[value] for key, value in instancing["attributes"].items()}
+        return cls(camera=camera, mesh=mesh, matrix=data.get("matrix"), rotation=data.get("rotation"), scale=data.get("scale"),
+            translation=data.get("translation"), weights=data.get("weights"), **args)
+
+
+class NodeTable(object):
+    # Columnar storage for many nodes: one row per node, children derived from the parent column.
+    # The mesh and camera columns index into the meshes and cameras lists, -1 meaning none.
+    def __init__(self, count=None, *args, **kwargs):
+        columns = [kwargs.get(key) for key in ["parent", "translation", "rotation", "scale", "matrix", "mesh", "camera", "name"]]
+        if count is None:
+            count = next(len(column) for column in columns if column is not None)
+        self.key         = -1
+        self.count       = count
+        self.parent      = self.column(kwargs.get("parent"), (), np.int64, -1)
+        self.translation = self.column(kwargs.get("translation"), (3,), np.float64)
+        self.rotation    = self.column(kwargs.get("rotation"), (4,), np.float64)
+        self.scale       = self.column(kwargs.get("scale"), (3,), np.float64)
+        self.matrix      = self.column(kwargs.get("matrix"), (16,), np.float64)
+        self.mesh        = self.column(kwargs.get("mesh"), (), np.int64, -1)
+        self.camera      = self.column(kwargs.get("camera"), (), np.int64, -1)
+        self.meshes      = kwargs.get("meshes", [])
+        self.cameras     = kwargs.get("cameras", [])
+        self.name        = kwargs.get("name")
+    def column(self, value, shape, dtype, default=None):
+        if value is None:
+            return None if default is None else np.full(self.count, default, dtype)
+        return np.ascontiguousarray(np.broadcast_to(np.asarray(value, dtype), (self.count,) + shape))
+    def __len__(self):
+        return self.count
+    def node(self, index):
+        return NodeRef(self, index)
+    def roots(self):
+        return [NodeRef(self, index) for index in np.flatnonzero(self.parent < 0).tolist()]
+    def children(self):
+        # CSR layout: the children of row i are indices[offsets[i]:offsets[i + 1]], in row order.
+        order = np.argsort(self.parent, kind="stable")
+        indices = order[np.count_nonzero(self.parent < 0):]
+        offsets = np.zeros(self.count + 1, np.int64)
+        np.cumsum(np.bincount(self.parent[indices], minlength=self.count), out=offsets[1:])
+        return offsets, indices
+    def assign(self, name, index, value):
+        # Writes rows of the translation, rotation or scale column, creating it with default values if needed.
+        if name not in TRS_DEFAULTS:
+            raise TypeError("NodeTable rows have no {} column.".format(name))
+        if getattr(self, name) is None:
+            setattr(self, name, self.column(TRS_DEFAULTS[name], (len(TRS_DEFAULTS[name]),), np.float64))
+        getattr(self, name)[index] = value
+    def keys(self, objects, column):
+        return np.array([value.key for value in objects] + [-1], np.int64)[column]
+    def levels(self):
+        offsets, indices = self.children()
+        level = np.flatnonzero(self.parent < 0)
+        while len(level):
+            yield level
+            counts = offsets[level + 1] - offsets[level]
+            starts = np.repeat(offsets[level] - np.cumsum(counts) + counts, counts)
+            level = indices[starts + np.arange(counts.sum())]
+    def local_matrices(self):
+        if self.matrix is not None:
+            return np.swapaxes(self.matrix.reshape(-1, 4, 4), 1, 2).copy()
+        translation = np.zeros((self.count, 3)) if self.translation is None else self.translation
+        rotation = np.broadcast_to([0.0, 0.0, 0.0, 1.0], (self.count, 4)) if self.rotation is None else self.rotation
+        scale = np.ones((self.count, 3)) if self.scale is None else self.scale
+        return trs_matrices(translation, rotation, scale)
+    def world_matrices(self):
+        # World matrices of all rows as an (n, 4, 4) array, relative to the parent of the table roots.
+        local = self.local_matrices()
+        world = np.empty_like(local)
+        propagate(self.parent, list(self.levels()), local, world)
+        return world
+    def subtree_world_matrices(self, rows, parents):
+        # World matrices of rows and all rows below them, with each of rows placed under the matching (4, 4) matrix of
+        # parents instead of under its parent row. Returns the row indices in breadth-first order and the matrices.
+        world = self.world_matrices()
+        offsets, indices = self.children()
+        above = self.parent[rows]
+        inner = above >= 0
+        parents = np.array(parents, np.float64)
+        parents[inner] = parents[inner] @ np.linalg.inv(world[above[inner]])
+        result, labels = [], []
+        level, label = np.asarray(rows, np.int64), np.arange(len(rows))
+        while len(level):
+            result.append(level)
+            labels.append(label)
+            counts = offsets[level + 1] - offsets[level]
+            starts = np.repeat(offsets[level] - np.cumsum(counts) + counts, counts)
+            level, label = indices[starts + np.arange(counts.sum())], np.repeat(label, counts)
+        result, labels = np.concatenate(result), np.concatenate(labels)
+        return result, parents[labels] @ world[result]
+    def togltf(self):
+        return list(self.iter_gltf())
+    def iter_gltf(self):
+        # Columns are converted to Python lists in bulk, default values are omitted like in Node.togltf.
+        count = self.count
+        offsets, indices = self.children()
+        offsets, indices = offsets.tolist(), (indices + self.key).tolist()
+        cameras = self.keys(self.cameras, self.camera).tolist()
+        meshes = self.keys(self.meshes, self.mesh).tolist()
+        names = [None] * count if self.name is None else self.name
+        empty = [None] * count
+        def values(column, default):
+            if column is None:
+                return empty
+            mask = np.any(column != default, axis=1).tolist()
+            return [value if present else None for value, present in zip(column.tolist(), mask)]
+        matrix = values(self.matrix, np.eye(4).ravel())
+        rotation = values(self.rotation, [0.0, 0.0, 0.0, 1.0])
+        scale = values(self.scale, [1.0, 1.0, 1.0])
+        translation = values(self.translation, [0.0, 0.0, 0.0])
+        for index in range(count):
+            result = {}
+            if names[index]:
+                result["name"] = names[index]
+            if offsets[index] != offsets[index + 1]:
+                result["children"] = indices[offsets[index]:offsets[index + 1]]
+            if cameras[index] >= 0:
+                result["camera"] = cameras[index]
+            if meshes[index] >= 0:
+                result["mesh"] = meshes[index]
+            if matrix[index]:
+                result["matrix"] = matrix[index]
+            if rotation[index]:
+                result["rotation"] = rotation[index]
+            if scale[index]:
+                result["scale"] = scale[index]
+            if translation[index]:
+                result["translation"] = translation[index]
+            yield result
+
+
+class NodeRef(object):
+    # Stands in for a NodeTable row wherever a Node is referenced, e.g. in Scene.nodes or Node.children.
+    __slots__ = ("table", "index")
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+    @property
+    def key(self):
+        return self.table.key + self.index
+    def __eq__(self, other):
+        return isinstance(other, NodeRef) and other.table is self.table and other.index == self.index
+    def __hash__(self):
+        return hash((id(self.table), self.index))
 
 
 class Sampler(Object):
+    __slots__ = ("key", "magFilter", "minFilter", "wrapS", "wrapT")
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.key   = -1
@@ -676,20 +1935,89 @@ class Sampler(Object):
         if self.wrapT:
             result["wrapT"] = self.wrapT.value
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        kwargs = objectargs(data)
+        for key, type in [("magFilter", Filter), ("minFilter", Filter), ("wrapS", Wrap), ("wrapT", Wrap)]:
+            if key in data:
+                kwargs[key] = type(data[key])
+        return cls(**kwargs)
 
 
 class Scene(Object):
+    __slots__ = ("key", "nodes", "worldCache")
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.key   = -1
         self.nodes = kwargs.get('nodes', [])
+        self.worldCache = None
     def togltf(self):
         result = super().togltf()
         result["nodes"] = [node.key for node in self.nodes]
         return result
+    def world_matrices(self):
+        # Returns the nodes of the scene in breadth-first order and their world matrices as an (n, 4, 4) array.
+        # Results are cached; only nodes whose transform was assigned since, and their descendants, are recomputed.
+        # NodeTable rows come after all nodes, as NodeRefs, and are recomputed every time.
+        order, parent, levels, rows = [], [], [], []
+        frontier, parents = [], []
+        for node in self.nodes:
+            if isinstance(node, NodeRef):
+                rows.append((node, -1))
+            else:
+                frontier.append(node)
+                parents.append(-1)
+        while frontier:
+            start = len(order)
+            order.extend(frontier)
+            parent.extend(parents)
+            levels.append(np.arange(start, len(order)))
+            frontier, parents = [], []
+            for index, node in enumerate(order[start:], start):
+                for child in node.children:
+                    if isinstance(child, NodeRef):
+                        rows.append((child, index))
+                    else:
+                        frontier.append(child)
+                        parents.append(index)
+        parent = np.array(parent, np.int64)
+        revisions = np.fromiter((node.revision for node in order), np.int64, len(order))
+        
+        cache = self.worldCache
+        if cache is not None and cache[0] == order and np.array_equal(cache[1], parent):
+            local, world = cache[3], cache[4]
+            dirty = revisions != cache[2]
+            if dirty.any():
+                local, world = local.copy(), world.copy()
+                local[dirty] = local_matrices([order[index] for index in np.flatnonzero(dirty)])
+                propagate(parent, levels, local, world, dirty)
+        else:
+            local = local_matrices(order)
+            world = np.empty_like(local)
+            propagate(parent, levels, local, world)
+        self.worldCache = (order, parent, revisions, local, world)
+        
+        if rows:
+            tables = collections.defaultdict(list)
+            for node, index in rows:
+                tables[node.table].append((node.index, index))
+            order, world = list(order), [world]
+            for table, items in tables.items():
+                indices, parents = np.array(items, np.int64).T
+                matrices = np.tile(np.eye(4), (len(items), 1, 1))
+                matrices[parents >= 0] = world[0][parents[parents >= 0]]
+                indices, matrices = table.subtree_world_matrices(indices, matrices)
+                order.extend(table.node(index) for index in indices.tolist())
+                world.append(matrices)
+            world = np.concatenate(world)
+        return order, world
+    @classmethod
+    def fromgltf(cls, data, document):
+        return cls(nodes=[document.nodes[index] for index in data.get("nodes", [])], **objectargs(data))
 
 
 class Skin(Object):
+    __slots__ = ("key", "inverseBindMatrices", "joints", "skeleton")
     def __init__(self, joints, *args, **kwargs):
         super().__init__(*args, **kwargs) 
         self.key   = -1
@@ -705,11 +2033,27 @@ class Skin(Object):
         if self.skeleton:
             result["skeleton"] = self.skeleton.key
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        joints = [document.nodes[index] for index in data["joints"]]
+        inverseBindMatrices = document.accessors[data["inverseBindMatrices"]] if "inverseBindMatrices" in data else None
+        skeleton = document.nodes[data["skeleton"]] if "skeleton" in data else None
+        return cls(joints, inverseBindMatrices=inverseBindMatrices, skeleton=skeleton, **objectargs(data))
+    def joint_matrices(self, scene):
+        # World matrix of each joint times its inverse bind matrix; skinned vertices end up in world space.
+        nodes, world = scene.world_matrices()
+        index = {node: key for key, node in enumerate(nodes)}
+        result = world[[index[joint] for joint in self.joints]]
+        if self.inverseBindMatrices:
+            result = result @ self.inverseBindMatrices.as_array()
+        return result
 
 
 class Texture(Object):
+    __slots__ = ("key", "sampler", "source")
     def __init__(self, sampler=None, source=None, *args, **kwargs):
         super().__init__(*args, **kwargs) 
+        self.key    = -1
         self.sampler = sampler
         self.source = source
     def togltf(self):
@@ -719,16 +2063,206 @@ class Texture(Object):
         if self.source:
             result["source"] = self.source.key
         return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        sampler = document.samplers[data["sampler"]] if "sampler" in data else None
+        source = document.images[data["source"]] if "source" in data else None
+        return cls(sampler, source, **objectargs(data))
 
 
 class TextureInfo(Object):
+    __slots__ = ("index", "texCoord", "scale", "strength")
     def __init__(self, index, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.index = index
         self.texCoord = kwargs.get("texCoord")
+        self.scale = kwargs.get("scale")
+        self.strength = kwargs.get("strength")
     def togltf(self):
         result = super().togltf()
         result["index"] = self.index.key
         if self.texCoord:
             result["texCoord"] = self.texCoord
+        if self.scale is not None:
+            result["scale"] = self.scale
+        if self.strength is not None:
+            result["strength"] = self.strength
+        return result
+    @classmethod
+    def fromgltf(cls, data, document):
+        return cls(document.textures[data["index"]], texCoord=data.get("texCoord"), scale=data.get("scale"), strength=data.get("strength"), **objectargs(data))
+
+
+# Objects serialized inside a top-level object.
+
+NESTED_TYPES = (AccessorSparse, AccessorSparseIndices, AccessorSparseValues, AnimationChannel, AnimationChannelTarget, AnimationSampler,
+    CameraOrthographic, CameraPerspective, PBRMetallicRoughness, Primitive, TextureInfo)
+
+# The slots that may hold nested objects, by class.
+NESTED_SLOTS = {
+    Accessor:             ("sparse",),
+    AccessorSparse:       ("indices", "values"),
+    Animation:            ("channels", "samplers"),
+    AnimationChannel:     ("target",),
+    Camera:               ("orthographic", "perspective"),
+    Material:             ("pbrMetallicRoughness", "normalTexture", "occlusionTexture", "emissiveTexture"),
+    PBRMetallicRoughness: ("baseColorTexture", "metallicRoughnessTexture"),
+    Mesh:                 ("primitives",),
+}
+
+
+class BufferBuilder(object):
+    def __init__(self, document, buffer=None, alignment=4):
+        self.document = document
+        self.alignment = alignment
+        self.data = bytearray()
+        if buffer is None:
+            buffer = Buffer()
+            document.add_buffer(buffer)
+        self.buffer = buffer
+        self.buffer.data = self.data
+    
+    def append(self, array, byteStride=None):
+        # Copies array into the buffer at an aligned offset, in the layout strided_view reads back.
+        itemsize, _ = element_strides(array.dtype, array.shape[1:])
+        if array.ndim <= 2 and byteStride in (None, itemsize):
+            data = memoryview(np.ascontiguousarray(array)).cast("B")
+        else:
+            byteStride = itemsize if byteStride is None else byteStride
+            data = np.zeros(len(array) * byteStride, np.uint8)
+            strided_view(data, 0, len(array), array.dtype, array.shape[1:], byteStride)[...] = array
+            data = memoryview(data)
+        if self.buffer.data is not self.data:
+            # The buffer was rewritten since the last append, e.g. by Document.compact_buffers: continue after its bytes.
+            self.data = self.buffer.data if isinstance(self.buffer.data, bytearray) else bytearray(self.buffer.data or b"")
+        offset = len(self.data) + padding(len(self.data), self.alignment)
+        try:
+            self.data += bytes(offset - len(self.data))
+            self.data += data
+        except BufferError:
+            # Arrays still view the current bytes, which must not move: they keep them, and appends go to a copy.
+            self.data = bytearray(self.data)
+            self.data += bytes(offset - len(self.data))
+            self.data += data
+        self.buffer.data = self.data
+        self.buffer.byteLength = len(self.data)
+        return offset
+    
+    def add_buffer_view(self, array, target=None, byteStride=None, name=None):
+        offset = self.append(array, byteStride)
+        result = BufferView(self.buffer, offset, len(self.data) - offset, byteStride, target, name=name)
+        self.document.add_buffer_view(result)
+        return result
+    
+    def add_array(self, array, target=None, normalized=False, bounds=True, name=None):
+        array, type, componentType = accessor_format(array)
+        
+        # Vertex attribute elements must start on 4-byte boundaries within a bufferView.
+        itemsize, _ = element_strides(array.dtype, array.shape[1:])
+        byteStride = None
+        if target == BufferTarget.ARRAY_BUFFER and padding(itemsize):
+            byteStride = itemsize + padding(itemsize)
+        bufferView = self.add_buffer_view(array, target, byteStride, name=name)
+        
+        result = Accessor(bufferView, None, len(array), type, componentType, normalized=normalized, name=name)
+        if bounds and len(array):
+            result.min, result.max = bounds_of(array)
+        self.document.add_accessor(result)
+        return result
+    
+    def add_arrays(self, arrays, target=None, normalized=False, bounds=True):
+        return {key: self.add_array(value, target, normalized, bounds, name=str(key)) for key, value in arrays.items()}
+    
+    def add_sparse_array(self, array, base=None, target=None, normalized=False, bounds=True, epsilon=None, name=None):
+        # Stores array as a sparse accessor over base (an Accessor with the same layout, or zeros when None) if the changed
+        # rows and their indices take fewer bytes than a dense copy; otherwise falls back to add_array.
+        # Rows whose components all lie within epsilon of base count as unchanged.
+        array, type, componentType = accessor_format(array)
+        if base is None:
+            reference = np.zeros_like(array)
+        elif base.type != type or base.componentType.value != componentType.value or base.count != len(array):
+            raise ValueError("Base accessor does not have the layout of array {} {}.".format(array.dtype, array.shape))
+        else:
+            reference = Accessor(base.bufferView, base.byteOffset, base.count, type, componentType).as_array(normalized=False)
+        
+        if epsilon:
+            differs = np.abs(array.astype(np.float64) - reference) > epsilon
+        else:
+            differs = array != reference
+        changed = np.flatnonzero(differs.reshape(len(array), -1).any(axis=1))
+        # The smallest index type that holds the largest changed row.
+        largest = changed.max() if len(changed) else 0
+        indices = changed.astype(np.uint8 if largest < 1 << 8 else np.uint16 if largest < 1 << 16 else np.uint32)
+        itemsize, _ = element_strides(array.dtype, array.shape[1:])
+        dense = len(array) * (itemsize + padding(itemsize) if target == BufferTarget.ARRAY_BUFFER else itemsize)
+        sparse = len(changed) * (indices.itemsize + itemsize) + padding(len(changed) * indices.itemsize)
+        if len(changed) and dense <= sparse:
+            return self.add_array(array, target, normalized, bounds, name)
+        
+        bufferView, byteOffset = (base.bufferView, base.byteOffset) if base else (None, None)
+        result = Accessor(bufferView, byteOffset, len(array), type, componentType, normalized=normalized, name=name)
+        if len(changed):
+            indices = AccessorSparseIndices(self.add_buffer_view(indices), None, COMPONENT_TYPE_BY_DTYPE[(indices.dtype.kind, indices.itemsize)])
+            values = AccessorSparseValues(self.add_buffer_view(array[changed]))
+            result.sparse = AccessorSparse(len(changed), indices, values)
+        if bounds and len(array):
+            reference = reference.copy()
+            reference[changed] = array[changed]
+            result.min, result.max = bounds_of(reference)
+        self.document.add_accessor(result)
+        return result
+    
+    def add_target(self, base, target, epsilon=None, name=None):
+        # A morph target from morphed attribute values: each stream of target is stored as its displacement from the
+        # stream of base with the same key, sparse when only some vertices move. Returns {Attribute: Accessor}.
+        result = {}
+        for key, value in target.items():
+            value = np.asarray(value, np.float32)
+            displacement = value - np.asarray(base[key], np.float32)[:, :value.shape[1]]
+            key = asenum(Attribute, key)
+            result[key] = self.add_sparse_array(displacement, None, BufferTarget.ARRAY_BUFFER, epsilon=epsilon, name=name and "{} {}".format(name, key.value))
         return result
+    
+    def add_structured_array(self, array, target=BufferTarget.ARRAY_BUFFER, normalized=False, bounds=True, name=None):
+        # Interleaves all fields in a single bufferView, one accessor per field.
+        name = "{key}" if name is None else name
+        fields = {}
+        for key, (dtype, byteOffset) in array.dtype.fields.items():
+            dtype, shape = dtype.subdtype if dtype.subdtype else (dtype, ())
+            componentType = COMPONENT_TYPE_BY_DTYPE.get((dtype.kind, dtype.itemsize))
+            type = ACCESSOR_TYPE_BY_SHAPE.get(shape)
+            if componentType is None or type is None or len(shape) == 2 or byteOffset % dtype.itemsize:
+                raise ValueError("Unsupported field {!r} with dtype {} and shape {}.".format(key, dtype, shape))
+            fields[key] = (byteOffset, type, componentType)
+        
+        itemsize = array.dtype.itemsize
+        byteStride = itemsize + padding(itemsize)
+        rows = np.ascontiguousarray(array).view(np.dtype((np.void, itemsize)))
+        bufferView = self.add_buffer_view(rows, target, byteStride, name=name.format(key="Interleaved"))
+        
+        result = {}
+        for key, (byteOffset, type, componentType) in fields.items():
+            accessor = Accessor(bufferView, byteOffset, len(array), type, componentType, normalized=normalized, name=name.format(key=key))
+            if bounds and len(array):
+                accessor.min, accessor.max = bounds_of(array[key])
+            self.document.add_accessor(accessor)
+            result[key] = accessor
+        return result
+
+
+def accessor_format(array):
+    # The array in little-endian (count,) + shape layout, with its AccessorType and ComponentType.
+    array = np.asarray(array)
+    dtype = array.dtype.newbyteorder("<") if array.dtype.byteorder == ">" else array.dtype
+    componentType = COMPONENT_TYPE_BY_DTYPE.get((dtype.kind, dtype.itemsize))
+    type = ACCESSOR_TYPE_BY_SHAPE.get(array.shape[1:])
+    if componentType is None or type is None:
+        raise ValueError("Unsupported array dtype {} and shape {}.".format(array.dtype, array.shape))
+    return array.astype(dtype, copy=False).reshape((len(array),) + SHAPE_BY_ACCESSOR_TYPE[type]), type, componentType
+
+def bounds_of(array):
+    # Per-component bounds, flattened column-major for matrices. They are the stored values, also for normalized
+    # accessors.
+    array = array.reshape(len(array), -1) if array.ndim != 3 else np.swapaxes(array, 1, 2).reshape(len(array), -1)
+    lower, upper = array.min(axis=0), array.max(axis=0)
+    return lower.tolist(), upper.tolist()
@@ -0,0 +1,396 @@
+import collections
+import concurrent.futures
+
+import numpy as np
+
+from . import gltf2 as gltf
+
+# EXT_meshopt_compression encoder.
+# https://github.com/KhronosGroup/glTF/tree/main/extensions/2.0/Vendor/EXT_meshopt_compression
+
+EXTENSION = "EXT_meshopt_compression"
+
+class Mode(object):
+    ATTRIBUTES = "ATTRIBUTES"
+    TRIANGLES  = "TRIANGLES"
+    INDICES    = "INDICES"
+
+class MeshoptFilter(object):
+    NONE        = "NONE"
+    OCTAHEDRAL  = "OCTAHEDRAL"
+    QUATERNION  = "QUATERNION"
+    EXPONENTIAL = "EXPONENTIAL"
+
+VERTEX_HEADER = 0xa0
+VERTEX_BLOCK_SIZE_BYTES = 8192
+VERTEX_BLOCK_MAX_SIZE = 256
+VERTEX_TAIL_SIZE = 32
+VERTEX_BATCH_BYTES = 1 << 20
+BYTE_GROUP_SIZE = 16
+
+INDEX_HEADER = 0xe1
+SEQUENCE_HEADER = 0xd1
+TRIANGLE_INDEX_ORDER = ((0, 1, 2), (1, 2, 0), (2, 0, 1))
+CODEAUX_TABLE = bytes([0x00, 0x76, 0x87, 0x56, 0x67, 0x78, 0xa9, 0x86, 0x65, 0x89, 0x68, 0x98, 0x01, 0x69, 0x00, 0x00])
+
+
+# Attribute codec, version 0.
+
+def vertex_block_size(byteStride):
+    return min((VERTEX_BLOCK_SIZE_BYTES // byteStride) & ~15, VERTEX_BLOCK_MAX_SIZE)
+
+def encode_vertex_blocks(deltas, blockSize):
+    # Each block stores, for every byte of the vertex, a 2-bit header per group of 16 deltas followed by the groups
+    # packed with 0, 2, 4 or 8 bits per delta; deltas that do not fit are escaped as whole bytes after their group.
+    count, byteStride = deltas.shape
+    blocks = -(-count // blockSize)
+    groups = blockSize // BYTE_GROUP_SIZE
+    padded = np.zeros((blocks * blockSize, byteStride), np.uint8)
+    padded[:count] = deltas
+    values = padded.reshape(blocks, groups, BYTE_GROUP_SIZE, byteStride).transpose(0, 3, 1, 2).reshape(-1, BYTE_GROUP_SIZE)
+
+    used = -(-np.minimum(count - np.arange(blocks) * blockSize, blockSize) // BYTE_GROUP_SIZE)
+    valid = np.broadcast_to((np.arange(groups) < used[:, None])[:, None, :], (blocks, byteStride, groups)).ravel()
+    escape2, escape4 = values >= 3, values >= 15
+    sizes = np.stack([np.where(values.any(axis=1), 255, 0), 4 + escape2.sum(axis=1), 8 + escape4.sum(axis=1), np.full(len(values), 16)], axis=1)
+    bits = np.where(valid, sizes.argmin(axis=1), 0)
+    lengths = np.where(valid, sizes[np.arange(len(values)), bits], 0)
+
+    slots = np.zeros((len(values), 24), np.uint8)
+    for bitslog2, escape, width in ((1, escape2, 2), (2, escape4, 4)):
+        selected = bits == bitslog2
+        packed = np.minimum(values[selected], (1 << width) - 1).reshape(-1, 2 * width, 8 // width)
+        shifts = np.arange(8 - width, -1, -width, dtype=np.uint8)
+        slots[selected, :2 * width] = np.bitwise_or.reduce(packed << shifts, axis=2)
+        escape = escape & selected[:, None]
+        rows, columns = np.nonzero(escape)
+        slots[rows, 2 * width + np.cumsum(escape, axis=1)[rows, columns] - 1] = values[rows, columns]
+    selected = bits == 3
+    slots[selected, :BYTE_GROUP_SIZE] = values[selected]
+
+    codes = np.zeros((blocks, byteStride, -(-groups // 4) * 4), np.uint8)
+    codes[:, :, :groups] = bits.reshape(blocks, byteStride, groups)
+    headers = np.zeros((blocks, byteStride, 1, 24), np.uint8)
+    headers[:, :, 0, :codes.shape[2] // 4] = np.bitwise_or.reduce(codes.reshape(blocks, byteStride, -1, 4) << np.array([0, 2, 4, 6], np.uint8), axis=3)
+    items = np.concatenate([headers, slots.reshape(blocks, byteStride, groups, 24)], axis=2)
+    lengths = np.concatenate([np.broadcast_to(((used + 3) // 4)[:, None, None], (blocks, byteStride, 1)), lengths.reshape(blocks, byteStride, groups)], axis=2)
+    return items[np.arange(24) < lengths[..., None]].tobytes()
+
+def encode_vertex_buffer(data):
+    # data is a (count, byteStride) uint8 array. Every byte is predicted by the same byte of the previous vertex, and the
+    # first vertex, which predicts itself, is stored in the tail.
+    count, byteStride = data.shape
+    blockSize = vertex_block_size(byteStride)
+    deltas = np.diff(data, axis=0, prepend=data[:1])
+    deltas = (deltas << 1) ^ (deltas.view(np.int8) >> 7).view(np.uint8)
+
+    batch = blockSize * max(1, VERTEX_BATCH_BYTES // (blockSize * byteStride))
+    chunks = [bytes([VERTEX_HEADER])]
+    chunks.extend(encode_vertex_blocks(deltas[start:start + batch], blockSize) for start in range(0, count, batch))
+    tail = max(VERTEX_TAIL_SIZE, byteStride)
+    chunks.append(bytes(tail - byteStride) + (data[0].tobytes() if count else bytes(byteStride)))
+    return b"".join(chunks)
+
+
+# Triangle and index sequence codecs, version 1.
+
+def encode_vbyte(data, value):
+    while value > 127:
+        data.append(value & 127 | 128)
+        value >>= 7
+    data.append(value)
+
+def encode_delta(data, index, last):
+    delta = (index - last) & 0xffffffff
+    encode_vbyte(data, ((delta << 1) ^ -(delta >> 31)) & 0xffffffff)
+
+def encode_index_buffer(indices):
+    # Triangles are coded against a FIFO of 16 recent edges and one of 16 recent vertices; one code byte per triangle
+    # is followed by a stream of auxiliary bytes and varint index deltas.
+    indices = np.asarray(indices, np.uint32).tolist()
+    if len(indices) % 3:
+        raise ValueError("Triangle list length {} is not a multiple of 3.".format(len(indices)))
+    edges = [(-1, -1)] * 16
+    vertices = [-1] * 16
+    edgeOffset = vertexOffset = 0
+    nextVertex = lastVertex = 0
+    codes = bytearray()
+    data = bytearray()
+
+    for i in range(0, len(indices), 3):
+        triangle = indices[i:i + 3]
+        found = -1
+        for age in range(15):
+            e0, e1 = edges[(edgeOffset - 1 - age) & 15]
+            for rotation, (x, y) in enumerate(((0, 1), (1, 2), (2, 0))):
+                if e0 == triangle[x] and e1 == triangle[y]:
+                    found = age << 2 | rotation
+                    break
+            if found >= 0:
+                break
+
+        if found >= 0:
+            a, b, c = (triangle[k] for k in TRIANGLE_INDEX_ORDER[found & 3])
+            fc = next((age for age in range(16) if vertices[(vertexOffset - 1 - age) & 15] == c), -1)
+            if 1 <= fc < 13:
+                fec = fc
+            elif c == nextVertex:
+                fec = 0
+                nextVertex += 1
+            else:
+                fec = 15
+                if c + 1 == lastVertex:
+                    fec, lastVertex = 13, c
+                if c == lastVertex + 1:
+                    fec, lastVertex = 14, c
+            codes.append((found >> 2) << 4 | fec)
+            if fec == 15:
+                encode_delta(data, c, lastVertex)
+                lastVertex = c
+            if fec == 0 or fec >= 13:
+                vertices[vertexOffset] = c
+                vertexOffset = (vertexOffset + 1) & 15
+            edges[edgeOffset] = (c, b)
+            edges[(edgeOffset + 1) & 15] = (a, c)
+            edgeOffset = (edgeOffset + 2) & 15
+        else:
+            rotation = 1 if triangle[1] == nextVertex else 2 if triangle[2] == nextVertex else 0
+            a, b, c = (triangle[k] for k in TRIANGLE_INDEX_ORDER[rotation])
+            reset = (a, b, c) == (0, 1, 2) and nextVertex > 0
+            if reset:
+                nextVertex = 0
+                vertexOffset = 0
+                vertices = [-1] * 16
+            fe = []
+            for vertex in (a, b, c):
+                fv = -1 if not fe else next((age for age in range(16) if vertices[(vertexOffset - 1 - age) & 15] == vertex), -1)
+                if 0 <= fv < 14:
+                    fe.append(fv + 1)
+                elif vertex == nextVertex:
+                    fe.append(0)
+                    nextVertex += 1
+                else:
+                    fe.append(15)
+            fea, feb, fec = fe
+            codeaux = feb << 4 | fec
+            auxIndex = CODEAUX_TABLE.find(bytes([codeaux]))
+            if fea == 0 and 0 <= auxIndex < 14 and not reset:
+                codes.append(0xf0 | auxIndex)
+            else:
+                codes.append(0xf0 | 14 | fea)
+                data.append(codeaux)
+            for vertex, fv in ((a, fea), (b, feb), (c, fec)):
+                if fv == 15:
+                    encode_delta(data, vertex, lastVertex)
+                    lastVertex = vertex
+            for vertex, fv in ((a, fea), (b, feb), (c, fec)):
+                if fv == 0 or fv == 15:
+                    vertices[vertexOffset] = vertex
+                    vertexOffset = (vertexOffset + 1) & 15
+            for edge in ((b, a), (c, b), (a, c)):
+                edges[edgeOffset] = edge
+                edgeOffset = (edgeOffset + 1) & 15
+
+    return bytes([INDEX_HEADER]) + bytes(codes) + bytes(data) + CODEAUX_TABLE
+
+def encode_index_sequence(indices):
+    # Each index is a zigzag varint delta from one of two baselines, the low bit naming the baseline.
+    indices = np.asarray(indices, np.uint32).tolist()
+    data = bytearray([SEQUENCE_HEADER])
+    last = [0, 0]
+    current = 0
+    for index in indices:
+        distance = ((index - last[current] + 0x80000000) & 0xffffffff) - 0x80000000
+        if abs(distance) >= 30:
+            current ^= 1
+        delta = (index - last[current]) & 0xffffffff
+        encode_vbyte(data, ((((delta << 1) ^ -(delta >> 31)) << 1) | current) & 0xffffffff)
+        last[current] = index
+    data += bytes(4)
+    return bytes(data)
+
+
+# Filters, applied before the attribute codec and undone by the decoder.
+
+def quantize_snorm(value, bits):
+    scale = (1 << (bits - 1)) - 1
+    value = np.asarray(value, np.float64)
+    return np.trunc(np.clip(value, -1.0, 1.0) * scale + np.where(value >= 0.0, 0.5, -0.5)).astype(np.int32)
+
+def encode_filter_oct(value, bits, byteStride):
+    # value is (count, 4): a unit vector and a w component such as the tangent sign. byteStride 4 stores 8-bit
+    # components, 8 stores 16-bit ones.
+    value = np.asarray(value, np.float64)
+    length = np.abs(value[:, :3]).sum(axis=1)
+    scale = np.divide(1.0, length, out=np.zeros_like(length), where=length != 0.0)
+    x, y, z = value[:, 0] * scale, value[:, 1] * scale, value[:, 2]
+    u = np.where(z >= 0.0, x, (1.0 - np.abs(y)) * np.where(x >= 0.0, 1.0, -1.0))
+    v = np.where(z >= 0.0, y, (1.0 - np.abs(x)) * np.where(y >= 0.0, 1.0, -1.0))
+    result = np.empty((len(value), 4), np.int8 if byteStride == 4 else np.int16)
+    result[:, 0] = quantize_snorm(u, bits)
+    result[:, 1] = quantize_snorm(v, bits)
+    result[:, 2] = quantize_snorm(1.0, bits)
+    result[:, 3] = quantize_snorm(value[:, 3], byteStride * 2)
+    return result
+
+def encode_filter_quat(value, bits):
+    # Drops the largest component of each unit quaternion (its sign by double cover) and stores its position in the low
+    # bits of the fourth 16-bit component.
+    value = np.asarray(value, np.float64)
+    largest = np.abs(value).argmax(axis=1)
+    sign = np.where(value[np.arange(len(value)), largest] < 0.0, -1.0, 1.0)
+    others = np.take_along_axis(value, (largest[:, None] + np.arange(1, 4)) & 3, axis=1)
+    result = np.empty((len(value), 4), np.int16)
+    result[:, :3] = quantize_snorm(others * np.sqrt(2.0) * sign[:, None], bits)
+    result[:, 3] = (int(quantize_snorm(1.0, bits)) & ~3) | largest
+    return result
+
+def encode_filter_exp(value, bits):
+    # Each float becomes a signed 24-bit mantissa with bits significant bits and an 8-bit exponent.
+    value = np.asarray(value, np.float64)
+    _, exponent = np.frexp(value)
+    exponent = np.maximum(exponent - (bits - 1), -100)
+    mantissa = np.trunc(np.ldexp(value, -exponent) + np.where(value >= 0.0, 0.5, -0.5)).astype(np.int32)
+    return ((mantissa & 0xffffff) | (exponent.astype(np.int32) << 24)).astype(np.uint32)
+
+
+def encode(mode, data):
+    # data is a (count, byteStride) uint8 array for ATTRIBUTES and an index array otherwise.
+    if mode == Mode.ATTRIBUTES:
+        return encode_vertex_buffer(data)
+    if mode == Mode.TRIANGLES:
+        return encode_index_buffer(data)
+    return encode_index_sequence(data)
+
+def compression_plan(document, filters=True, quaternion_bits=12, exponential_bits=None):
+    # Returns {bufferView: (mode, filter, byteStride, data)} for every bufferView that can be compressed; data is the
+    # filtered payload where a filter applies. Views used by sparse accessors or images are left alone.
+    users = collections.defaultdict(list)
+    for accessor in document.accessors:
+        if accessor.bufferView is not None:
+            users[accessor.bufferView].append(accessor)
+    excluded = {image.bufferView for image in document.images if image.bufferView is not None}
+    for accessor in document.accessors:
+        if accessor.sparse:
+            excluded.update((accessor.sparse.indices.bufferView, accessor.sparse.values.bufferView))
+
+    triangles, indices, directions, vertices = set(), set(), set(), set()
+    for mesh in document.meshes:
+        for primitive in mesh.primitives:
+            if primitive.indices is not None:
+                indices.add(primitive.indices)
+                if primitive.mode == gltf.PrimitiveMode.TRIANGLES:
+                    triangles.add(primitive.indices)
+            for key, accessor in primitive.attributes.items():
+                vertices.add(accessor)
+                if key in (gltf.Attribute.NORMAL, gltf.Attribute.TANGENT):
+                    directions.add(accessor)
+            for target in primitive.targets or []:
+                vertices.update(target.values())
+    rotations = set()
+    for animation in document.animations:
+        for channel in animation.channels:
+            sampler = animation.samplers[channel.sampler]
+            if channel.target.path == gltf.TargetPath.ROTATION and sampler.interpolation != gltf.Interpolation.CUBICSPLINE:
+                rotations.add(sampler.output)
+
+    result = {}
+    for bufferView, accessors in users.items():
+        if bufferView in excluded:
+            continue
+        raw = np.frombuffer(bufferView.buffer.data, np.uint8, bufferView.byteLength, bufferView.byteOffset or 0)
+        sizes = {gltf.element_strides(gltf.DTYPE_BY_COMPONENT_TYPE[accessor.componentType.value], gltf.SHAPE_BY_ACCESSOR_TYPE[accessor.type])[0] for accessor in accessors}
+        single = len(accessors) == 1 and not accessors[0].byteOffset
+        accessor = accessors[0]
+
+        if all(accessor in indices for accessor in accessors):
+            # Both index codecs need 2- or 4-byte indices.
+            if sizes not in ({2}, {4}) or bufferView.byteLength % min(sizes):
+                continue
+            data = raw.view(np.uint16 if sizes == {2} else np.uint32)
+            mode = Mode.TRIANGLES if single and accessor in triangles and accessor.count == len(data) and len(data) % 3 == 0 else Mode.INDICES
+            result[bufferView] = (mode, MeshoptFilter.NONE, min(sizes), data)
+            continue
+        if any(accessor in indices for accessor in accessors):
+            continue
+
+        byteStride = bufferView.byteStride or (sizes.pop() if len(sizes) == 1 else None)
+        if not byteStride or byteStride % 4 or byteStride > 256 or bufferView.byteLength % byteStride:
+            continue
+        count = bufferView.byteLength // byteStride
+        mode, filter, data = Mode.ATTRIBUTES, MeshoptFilter.NONE, raw.reshape(count, byteStride)
+        if filters and single and accessor in directions and accessor.normalized and byteStride in (4, 8) and \
+                accessor.componentType.value in (gltf.ComponentType.BYTE.value, gltf.ComponentType.SHORT.value) and accessor.count == count:
+            value = accessor.as_array()
+            value = np.concatenate([value, np.zeros((count, 1))], axis=1) if value.shape[1] == 3 else value
+            filter, data = MeshoptFilter.OCTAHEDRAL, encode_filter_oct(value, byteStride * 2, byteStride).view(np.uint8)
+        elif filters and single and accessor in rotations and accessor.type == gltf.AccessorType.VEC4 and not bufferView.byteStride and accessor.count == count:
+            if accessor.componentType.value == gltf.ComponentType.FLOAT.value or (accessor.componentType.value == gltf.ComponentType.SHORT.value and accessor.normalized):
+                value = accessor.as_array()
+                byteStride, filter, data = 8, MeshoptFilter.QUATERNION, encode_filter_quat(value, quaternion_bits).view(np.uint8)
+        elif exponential_bits and all(accessor in vertices and accessor.componentType.value == gltf.ComponentType.FLOAT.value for accessor in accessors):
+            filter, data = MeshoptFilter.EXPONENTIAL, encode_filter_exp(data.view(np.float32), exponential_bits).view(np.uint8)
+        result[bufferView] = (mode, filter, byteStride, data)
+    return result
+
+def compress(document, filters=True, fallback=False, quaternion_bits=12, exponential_bits=None, max_workers=None):
+    # Rewrites every buffer of the document as one buffer of compressed streams, plus the bytes of views that cannot be
+    # compressed, and a fallback buffer that the compressed bufferViews point into.
+    # Without fallback the fallback buffer has no data and the extension is required; filters (lossy) only apply then.
+    # Octahedral and quaternion filters are used for normalized NORMAL/TANGENT and rotation outputs, the exponential
+    # filter for float vertex attributes when exponential_bits is given. Rotation outputs become normalized SHORT.
+    if any(bufferView.buffer.data is None for bufferView in document.bufferViews):
+        raise ValueError("All buffers need their data to be compressed.")
+    plan = compression_plan(document, filters and not fallback, quaternion_bits, exponential_bits)
+    views = list(plan)
+    modes = [plan[bufferView][0] for bufferView in views]
+    payloads = [plan[bufferView][3] for bufferView in views]
+    if max_workers == 1 or len(views) <= 1:
+        streams = list(map(encode, modes, payloads))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+            streams = list(executor.map(encode, modes, payloads))
+
+    bufferViews = [bufferView for bufferView in document.bufferViews if bufferView not in plan]
+    raws = [np.frombuffer(bufferView.buffer.data, np.uint8, bufferView.byteLength, bufferView.byteOffset or 0) for bufferView in bufferViews]
+    originals = [np.frombuffer(bufferView.buffer.data, np.uint8, bufferView.byteLength, bufferView.byteOffset or 0) for bufferView in views] if fallback else None
+
+    document.buffers = []
+    builder = gltf.BufferBuilder(document)
+    if fallback:
+        spare = gltf.BufferBuilder(document)
+    else:
+        spare = gltf.Buffer(extensions={EXTENSION: {"fallback": True}})
+        document.add_buffer(spare)
+
+    for bufferView, raw in zip(bufferViews, raws):
+        bufferView.buffer, bufferView.byteOffset = builder.buffer, builder.append(raw)
+
+    byteLength = 0
+    for index, (bufferView, stream) in enumerate(zip(views, streams)):
+        mode, filter, byteStride, data = plan[bufferView]
+        extension = {
+            "buffer": builder.buffer.key,
+            "byteOffset": builder.append(np.frombuffer(stream, np.uint8)),
+            "byteLength": len(stream),
+            "byteStride": byteStride,
+            "count": len(data),
+            "mode": mode,
+        }
+        if filter != MeshoptFilter.NONE:
+            extension["filter"] = filter
+        bufferView.extensions = dict(bufferView.extensions or {}, **{EXTENSION: extension})
+        if filter == MeshoptFilter.QUATERNION:
+            accessor = next(accessor for accessor in document.accessors if accessor.bufferView is bufferView)
+            accessor.componentType, accessor.normalized = gltf.ComponentType.SHORT, True
+        if fallback:
+            bufferView.buffer, bufferView.byteOffset = spare.buffer, spare.append(originals[index])
+        else:
+            byteLength += gltf.padding(byteLength)
+            bufferView.buffer, bufferView.byteOffset = spare, byteLength
+            byteLength += len(data) * byteStride
+        bufferView.byteLength = len(data) * byteStride
+    if not fallback:
+        spare.byteLength = byteLength
+
+    document.use_extension(EXTENSION, required=not fallback)
@@ -0,0 +1,663 @@
+import collections
+import hashlib
+import json
+
+import numpy as np
+
+from . import gltf2 as gltf
+
+# Optimization passes over a gltf2.Document.
+
+MERGEABLE_MODES = [gltf.PrimitiveMode.POINTS, gltf.PrimitiveMode.LINES, gltf.PrimitiveMode.TRIANGLES]
+
+BAKED_ATTRIBUTES = [gltf.Attribute.POSITION.value, gltf.Attribute.NORMAL.value, gltf.Attribute.TANGENT.value]
+
+
+def animated_nodes(document, scene):
+    # Nodes whose world transform or weights can change at runtime: animation targets, skinned nodes and their descendants.
+    targets = {channel.target.node for animation in document.animations for channel in animation.channels}
+    result = set()
+    stack = [(node, False) for node in scene.nodes]
+    while stack:
+        node, animated = stack.pop()
+        if isinstance(node, gltf.NodeRef):
+            # Table rows cannot be skinned and have no Node children.
+            if animated or node in targets:
+                result.add(node)
+            continue
+        animated = animated or node in targets or node.skin is not None
+        if animated:
+            result.add(node)
+        stack.extend((child, animated) for child in node.children)
+    return result
+
+def primitive_key(primitive):
+    # Streams of different accessor types, such as VEC3 and VEC4 colors, cannot be concatenated.
+    return (primitive.material, frozenset((key.value, accessor.type) for key, accessor in primitive.attributes.items()), primitive.mode)
+
+def mergeable(node, animated):
+    # NodeTable rows are left to the table.
+    if isinstance(node, gltf.NodeRef):
+        return False
+    mesh = node.mesh
+    if mesh is None or node in animated or mesh.weights or node.instances or node.lods:
+        return False
+    return all(primitive.mode in MERGEABLE_MODES and not primitive.targets for primitive in mesh.primitives)
+
+def bake(attributes, matrices, member):
+    # Transforms the concatenated attribute streams of a group by the world matrix of the node each vertex came from.
+    linear = matrices[:, :3, :3]
+    normal = np.linalg.inv(linear).transpose(0, 2, 1)
+    # Mirroring transforms flip the handedness of the tangent frame, the sign in TANGENT w.
+    handedness = np.where(np.linalg.det(linear) < 0, -1.0, 1.0)
+    result = dict(attributes)
+    for key, value in attributes.items():
+        if key not in BAKED_ATTRIBUTES:
+            continue
+        if key == gltf.Attribute.POSITION.value:
+            value = np.einsum("nij,nj->ni", linear[member], value) + matrices[member, :3, 3]
+        else:
+            vectors = np.einsum("nij,nj->ni", (normal if key == gltf.Attribute.NORMAL.value else linear)[member], value[:, :3])
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            rest = value[:, 3:] * handedness[member, None] if key == gltf.Attribute.TANGENT.value else value[:, 3:]
+            value = np.concatenate([vectors, rest], axis=1)
+        result[key] = value.astype(np.float32)
+    return result
+
+def merge_primitives(document, scene=None):
+    # Bakes static mesh nodes into world space and concatenates their primitives per (material, attribute set, mode).
+    # Returns the new node holding the merged mesh, or None when nothing could be merged.
+    scene = (document.scene or document.scenes[0]) if scene is None else scene
+    nodes, world = scene.world_matrices()
+    animated = animated_nodes(document, scene)
+
+    groups = collections.defaultdict(list)
+    for index, node in enumerate(nodes):
+        if mergeable(node, animated):
+            for primitive in node.mesh.primitives:
+                groups[primitive_key(primitive)].append((index, primitive))
+    if all(len(members) < 2 for members in groups.values()):
+        return None
+
+    builder = gltf.BufferBuilder(document)
+    mesh = gltf.Mesh([], name="Merged Mesh")
+    for (material, keys, mode), members in groups.items():
+        counts = np.array([primitive.attributes[gltf.Attribute.POSITION].count for _, primitive in members])
+        member = np.repeat(np.arange(len(members)), counts)
+        matrices = world[[index for index, _ in members]].astype(np.float32)
+
+        # Streams that are not transformed keep their component type when all members agree on it.
+        attributes, normalized = {}, {}
+        for key, _ in keys:
+            accessors = [primitive.attributes[gltf.asenum(gltf.Attribute, key)] for _, primitive in members]
+            formats = {(accessor.componentType.value, accessor.normalized) for accessor in accessors}
+            if key in BAKED_ATTRIBUTES or len(formats) > 1:
+                attributes[key] = np.concatenate([accessor.as_array().astype(np.float32) for accessor in accessors])
+                normalized[key] = False
+            else:
+                attributes[key] = np.concatenate([accessor.as_array(normalized=False) for accessor in accessors])
+                normalized[key] = accessors[0].normalized
+        attributes = bake(attributes, matrices, member)
+
+        # Rebase every primitive's indices by the number of vertices before it, in one pass.
+        indices = [primitive.indices.as_array() if primitive.indices else np.arange(count) for (_, primitive), count in zip(members, counts)]
+        sizes = np.array([len(value) for value in indices])
+        offsets = np.cumsum(counts) - counts
+        indices = np.concatenate(indices).astype(np.uint32) + np.repeat(offsets, sizes).astype(np.uint32)
+        if mode == gltf.PrimitiveMode.TRIANGLES:
+            # Mirroring transforms flip the winding order, swap two corners to restore it.
+            flipped = np.repeat(np.linalg.det(matrices[:, :3, :3]) < 0, sizes // 3)
+            triangles = indices.reshape(-1, 3)
+            triangles[flipped] = triangles[flipped][:, [0, 2, 1]]
+        if len(member) <= np.iinfo(np.uint16).max:
+            indices = indices.astype(np.uint16)
+
+        accessors = {gltf.asenum(gltf.Attribute, key): builder.add_array(value, gltf.BufferTarget.ARRAY_BUFFER, normalized[key], name=key) for key, value in attributes.items()}
+        index = builder.add_array(indices, gltf.BufferTarget.ELEMENT_ARRAY_BUFFER, bounds=False, name="Indices")
+        mesh.primitives.append(gltf.Primitive(accessors, index, material, mode))
+
+    for node in nodes:
+        if mergeable(node, animated):
+            node.mesh = None
+    node = gltf.Node(name="Merged Node", mesh=mesh)
+    document.add_mesh(mesh)
+    document.add_node(node)
+    scene.nodes.append(node)
+    document.invalidate(scene)
+    return node
+
+
+# Vertex cache optimization after Tom Forsyth, "Linear-Speed Vertex Cache Optimisation" (2006).
+
+FORSYTH_CACHE_DECAY_POWER = 1.5
+FORSYTH_LAST_TRIANGLE_SCORE = 0.75
+FORSYTH_VALENCE_BOOST_SCALE = 2.0
+FORSYTH_VALENCE_BOOST_POWER = 0.5
+
+def forsyth_scores(cache_size, valence):
+    # Score tables indexed by cache position (the last entry meaning "not cached") and by remaining valence.
+    position = [FORSYTH_LAST_TRIANGLE_SCORE] * 3 + [(1.0 - (index - 3) / (cache_size - 3)) ** FORSYTH_CACHE_DECAY_POWER for index in range(3, cache_size)] + [0.0]
+    boost = [0.0] + [FORSYTH_VALENCE_BOOST_SCALE * count ** -FORSYTH_VALENCE_BOOST_POWER for count in range(1, valence + 1)]
+    return position, boost
+
+def optimize_vertex_cache(indices, vertex_count=None, cache_size=16):
+    # Reorders triangles so that consecutive triangles reuse recently transformed vertices.
+    # Each step scores only the live triangles around the simulated LRU cache; dead ends continue in input order.
+    indices = np.asarray(indices).reshape(-1)
+    triangles = indices.reshape(-1, 3).tolist()
+    vertex_count = int(indices.max()) + 1 if vertex_count is None else vertex_count
+    valence = np.bincount(indices, minlength=vertex_count)
+    offsets = np.concatenate([[0], np.cumsum(valence)]).tolist()
+    order = (np.argsort(indices, kind="stable") // 3).tolist()
+    adjacency = [order[offsets[vertex]:offsets[vertex + 1]] for vertex in range(vertex_count)]
+    valence = valence.tolist()
+    position, boost = forsyth_scores(cache_size, max(valence, default=0))
+    score = [boost[count] for count in valence]
+    
+    emitted = bytearray(len(triangles))
+    cache = []
+    result = []
+    best, best_score, cursor = -1, -1.0, 0
+    for _ in range(len(triangles)):
+        if best < 0:
+            while emitted[cursor]:
+                cursor += 1
+            best = cursor
+        triangle = triangles[best]
+        result.append(best)
+        emitted[best] = 1
+        for vertex in triangle:
+            adjacency[vertex].remove(best)
+            valence[vertex] -= 1
+        
+        evicted = cache[cache_size - 3:]
+        cache = triangle + [vertex for vertex in cache if vertex not in triangle]
+        for vertex in evicted:
+            score[vertex] = boost[valence[vertex]]
+        del cache[cache_size:]
+        for index, vertex in enumerate(cache):
+            score[vertex] = position[index] + boost[valence[vertex]] if valence[vertex] else -1.0
+        
+        best, best_score = -1, -1.0
+        for vertex in cache:
+            for candidate in adjacency[vertex]:
+                a, b, c = triangles[candidate]
+                value = score[a] + score[b] + score[c]
+                if value > best_score:
+                    best, best_score = candidate, value
+    return np.asarray(triangles, indices.dtype).reshape(-1, 3)[result].reshape(-1)
+
+def optimize_vertex_fetch(indices, vertex_count=None):
+    # Renumbers vertices in order of first use. Returns the new indices and, for each new vertex, its old index.
+    # Vertices that no index refers to are dropped.
+    indices = np.asarray(indices).reshape(-1)
+    vertex_count = int(indices.max()) + 1 if vertex_count is None else vertex_count
+    first = np.full(vertex_count, len(indices), np.int64)
+    np.minimum.at(first, indices, np.arange(len(indices)))
+    order = np.argsort(first, kind="stable")[:len(np.unique(indices))]
+    remap = np.empty(vertex_count, np.int64)
+    remap[order] = np.arange(len(order))
+    return remap[indices].astype(indices.dtype), order
+
+def cache_miss_ratio(indices, cache_size=16):
+    # Average transformed vertices per triangle (ACMR) for a FIFO post-transform cache.
+    cache = collections.deque(maxlen=cache_size)
+    misses = 0
+    for vertex in np.asarray(indices).reshape(-1).tolist():
+        if vertex not in cache:
+            cache.append(vertex)
+            misses += 1
+    return misses / max(len(indices) // 3, 1)
+
+def reorder_mesh(indices, attributes, cache_size=16):
+    # Cache and fetch optimization for a triangle list held in numpy arrays, e.g. before BufferBuilder.add_array.
+    vertex_count = len(next(iter(attributes.values())))
+    indices = optimize_vertex_cache(indices, vertex_count, cache_size)
+    indices, order = optimize_vertex_fetch(indices, vertex_count)
+    return indices, {key: value[order] for key, value in attributes.items()}
+
+def optimize_primitive(primitive, builder, cache_size=16):
+    # Rewrites the streams and morph targets of a TRIANGLES primitive in cache and fetch optimized order with builder.
+    if primitive.mode != gltf.PrimitiveMode.TRIANGLES:
+        raise ValueError("Only triangle lists can be reordered.")
+    count = primitive.attributes[next(iter(primitive.attributes))].count
+    indices = np.arange(count, dtype=np.uint32) if primitive.indices is None else primitive.indices.as_array()
+    indices = optimize_vertex_cache(indices, count, cache_size)
+    indices, order = optimize_vertex_fetch(indices, count)
+    primitive.attributes = {key: builder.add_array(accessor.as_array(normalized=False)[order], gltf.BufferTarget.ARRAY_BUFFER, accessor.normalized, name=accessor.name)
+        for key, accessor in primitive.attributes.items()}
+    if primitive.targets:
+        primitive.targets = [{key: builder.add_sparse_array(accessor.as_array(normalized=False)[order], None, gltf.BufferTarget.ARRAY_BUFFER, accessor.normalized, name=accessor.name)
+            for key, accessor in target.items()} for target in primitive.targets]
+    primitive.indices = builder.add_array(indices, gltf.BufferTarget.ELEMENT_ARRAY_BUFFER, bounds=False, name=primitive.indices.name if primitive.indices else None)
+
+
+# Attribute quantization, see KHR_mesh_quantization.
+
+def quantize_unit(value, bits):
+    # Signed normalized encoding of values in [-1, 1].
+    dtype = np.int8 if bits <= 8 else np.int16
+    limit = (1 << (bits - 1)) - 1
+    return np.round(np.clip(value, -1.0, 1.0) * limit).astype(dtype)
+
+def fold_dequantization(document, node, offset, scale, fixed):
+    # Applies translate(offset) * scale(scale) after the node's own transform, so quantized positions land where they were.
+    # Nodes with children or a transform in fixed get a new child node for the mesh instead.
+    if node.children or node in fixed:
+        child = gltf.Node(name=node.name, mesh=node.mesh, translation=offset.tolist(), scale=[scale] * 3)
+        document.add_node(child)
+        node.children.append(child)
+        node.mesh = None
+        document.invalidate(node)
+    elif node.matrix:
+        matrix = np.reshape(node.matrix, (4, 4)).T @ gltf.trs_matrices([offset], [(0.0, 0.0, 0.0, 1.0)], [[scale] * 3])[0]
+        node.matrix = matrix.T.ravel().tolist()
+    else:
+        translation = np.array(node.translation or (0.0, 0.0, 0.0))
+        linear = gltf.trs_matrices([(0.0, 0.0, 0.0)], [node.rotation or (0.0, 0.0, 0.0, 1.0)], [node.scale or (1.0, 1.0, 1.0)])[0, :3, :3]
+        node.translation = (translation + linear @ offset).tolist()
+        node.scale = (np.array(node.scale or (1.0, 1.0, 1.0)) * scale).tolist()
+
+def quantize(document, builder=None, position_bits=14, normal_bits=8):
+    # Converts float POSITION, NORMAL, TANGENT and TEXCOORD_n streams to integers as allowed by KHR_mesh_quantization.
+    # Positions become unsigned integers on a per-mesh grid; the uniform dequantization scale and offset are folded into
+    # every node using the mesh, or into a new child of it when its transform must not change. Meshes that cannot carry a node transform (skinned, morphed, used by a NodeTable or by
+    # no node) keep float positions. Texture coordinates are only quantized when they lie in [0, 1].
+    builder = gltf.BufferBuilder(document) if builder is None else builder
+    users = collections.defaultdict(list)
+    for node in document.nodes:
+        if node.mesh is not None:
+            users[node.mesh].append(node)
+    tabled = {mesh for table in document.nodeTables for mesh in table.meshes}
+    # Transforms that must stay as they are: animation targets, and skin joints and the nodes below them, whose world
+    # matrices pose skinned meshes.
+    fixed = {channel.target.node for animation in document.animations for channel in animation.channels}
+    stack = [joint for skin in document.skins for joint in skin.joints] + [skin.skeleton for skin in document.skins if skin.skeleton is not None]
+    jointed = set()
+    while stack:
+        node = stack.pop()
+        if isinstance(node, gltf.Node) and node not in jointed:
+            jointed.add(node)
+            stack.extend(node.children)
+    fixed |= jointed
+    
+    converted = {}
+    def convert(accessor, encode, normalized):
+        if accessor not in converted:
+            converted[accessor] = builder.add_array(encode(accessor.as_array()), gltf.BufferTarget.ARRAY_BUFFER, normalized, name=accessor.name)
+        return converted[accessor]
+    
+    for mesh in document.meshes:
+        for primitive in mesh.primitives:
+            for key, accessor in primitive.attributes.items():
+                if accessor.componentType != gltf.ComponentType.FLOAT:
+                    continue
+                if key in (gltf.Attribute.NORMAL, gltf.Attribute.TANGENT):
+                    primitive.attributes[key] = convert(accessor, lambda value: quantize_unit(value, normal_bits), True)
+                elif key.value.startswith("TEXCOORD_"):
+                    value = accessor.as_array()
+                    if len(value) and value.min() >= 0.0 and value.max() <= 1.0:
+                        primitive.attributes[key] = convert(accessor, lambda value: np.round(value * 65535.0).astype(np.uint16), True)
+            document.invalidate(primitive)
+        
+        positions = [primitive.attributes.get(gltf.Attribute.POSITION) for primitive in mesh.primitives]
+        nodes = users.get(mesh, [])
+        if not nodes or mesh in tabled or any(node.skin or node.instances for node in nodes) or any(primitive.targets for primitive in mesh.primitives):
+            continue
+        if any(accessor is None or accessor.componentType != gltf.ComponentType.FLOAT for accessor in positions):
+            continue
+        # Copies, since builder may append to the buffer the positions are read from.
+        values = [np.array(accessor.as_array()) for accessor in positions]
+        lower = np.min([value.min(axis=0) for value in values if len(value)], axis=0)
+        upper = np.max([value.max(axis=0) for value in values if len(value)], axis=0)
+        steps = (1 << position_bits) - 1
+        scale = float(np.max(upper - lower)) / steps or 1.0
+        dtype = np.uint8 if position_bits <= 8 else np.uint16
+        for primitive, value in zip(mesh.primitives, values):
+            grid = np.clip(np.round((value - lower) / scale), 0, steps).astype(dtype)
+            primitive.attributes[gltf.Attribute.POSITION] = builder.add_array(grid, gltf.BufferTarget.ARRAY_BUFFER, name=primitive.attributes[gltf.Attribute.POSITION].name)
+            document.invalidate(primitive)
+        for node in nodes:
+            fold_dequantization(document, node, lower.astype(np.float64), scale, fixed)
+        converted[mesh] = True
+    
+    if converted:
+        document.use_extension("KHR_mesh_quantization", required=True)
+
+
+# Content-addressed deduplication.
+
+HASH_CHUNK = 1 << 20
+
+def digest(view):
+    # Streaming hash of a memoryview, fed in chunks without copying.
+    result = hashlib.blake2b(digest_size=16)
+    for start in range(0, view.nbytes, HASH_CHUNK):
+        result.update(view[start:start + HASH_CHUNK])
+    return result.digest()
+
+def signature(value, ignored=("name",)):
+    # Objects whose references have been made canonical are interchangeable when their glTF is equal, names aside.
+    data = value.togltf()
+    for key in ignored:
+        data.pop(key, None)
+    return json.dumps(data, sort_keys=True)
+
+def canonical_objects(values, key):
+    # Maps every object to the first one with the same key.
+    first = {}
+    return {value: first.setdefault(key(value), value) for value in values}
+
+def compact_buffers(document):
+    # See Document.compact_buffers.
+    return document.compact_buffers()
+
+def deduplicate(document):
+    # Merges bufferViews with identical bytes, then accessors, meshes and images that have become identical, rewrites
+    # every reference to the survivors and compacts the buffers. Returns the number of objects removed per array and
+    # the number of buffer bytes saved.
+    if "EXT_meshopt_compression" in document.extensionsUsed:
+        raise ValueError("Deduplicate before compressing, compressed streams are not bufferViews.")
+    contents = {}
+    def content(bufferView):
+        if bufferView.buffer.data is None:
+            return bufferView
+        view = memoryview(bufferView.buffer.data).cast("B")
+        view = view[bufferView.byteOffset or 0:(bufferView.byteOffset or 0) + bufferView.byteLength]
+        key = (digest(view), signature(bufferView, ("name", "buffer", "byteOffset")))
+        # Equal digests are confirmed byte for byte.
+        if key in contents and contents[key][1] != view:
+            return bufferView
+        return contents.setdefault(key, (bufferView, view))[0]
+    bufferViews = canonical_objects(document.bufferViews, content)
+    for accessor in document.accessors:
+        if accessor.bufferView is not None:
+            accessor.bufferView = bufferViews[accessor.bufferView]
+        if accessor.sparse:
+            accessor.sparse.indices.bufferView = bufferViews[accessor.sparse.indices.bufferView]
+            accessor.sparse.values.bufferView = bufferViews[accessor.sparse.values.bufferView]
+    for image in document.images:
+        if image.bufferView is not None:
+            image.bufferView = bufferViews[image.bufferView]
+
+    accessors = canonical_objects(document.accessors, signature)
+    for mesh in document.meshes:
+        for primitive in mesh.primitives:
+            primitive.attributes = {key: accessors[accessor] for key, accessor in primitive.attributes.items()}
+            if primitive.indices is not None:
+                primitive.indices = accessors[primitive.indices]
+            if primitive.targets:
+                primitive.targets = [{key: accessors[accessor] for key, accessor in target.items()} for target in primitive.targets]
+    for animation in document.animations:
+        for sampler in animation.samplers:
+            sampler.input, sampler.output = accessors[sampler.input], accessors[sampler.output]
+    for skin in document.skins:
+        if skin.inverseBindMatrices is not None:
+            skin.inverseBindMatrices = accessors[skin.inverseBindMatrices]
+    for node in document.nodes:
+        if node.instances:
+            node.instances = {key: accessors[accessor] for key, accessor in node.instances.items()}
+
+    meshes = canonical_objects(document.meshes, signature)
+    for node in document.nodes:
+        if node.mesh is not None:
+            node.mesh = meshes[node.mesh]
+    for table in document.nodeTables:
+        table.meshes = [meshes[mesh] for mesh in table.meshes]
+
+    images = canonical_objects(document.images, signature)
+    for texture in document.textures:
+        if texture.source is not None:
+            texture.source = images[texture.source]
+
+    result = {}
+    for name, canonical in (("bufferViews", bufferViews), ("accessors", accessors), ("meshes", meshes), ("images", images)):
+        values = [value for value in getattr(document, name) if canonical[value] is value]
+        for key, value in enumerate(values):
+            value.key = key
+        result[name] = len(getattr(document, name)) - len(values)
+        setattr(document, name, values)
+    result["bytes"] = document.compact_buffers()
+    return result
+
+
+# GPU instancing, see EXT_mesh_gpu_instancing.
+
+def instance_nodes(document, builder=None, scene=None, min_count=2):
+    # Replaces sibling leaf nodes drawing the same mesh, at least min_count of them, with one instanced node in place of
+    # the first. Nodes that are animated, skinned, joints, cameras, roots of other scenes, carry morph weights,
+    # extensions or a sheared matrix are kept, and so are nodes referenced from anywhere but their one parent: animation
+    # targets, LOD levels and nodes listed as a child or root more than once. The replaced nodes are removed from the
+    # document. Returns the new nodes.
+    builder = gltf.BufferBuilder(document) if builder is None else builder
+    scene = scene or document.scene or document.scenes[0]
+    animated = animated_nodes(document, scene)
+    kept = {joint for skin in document.skins for joint in skin.joints} | {skin.skeleton for skin in document.skins}
+    kept.update(node for other in document.scenes if other is not scene for node in other.nodes)
+    kept.update(channel.target.node for animation in document.animations for channel in animation.channels)
+    kept.update(level for node in document.nodes for level in node.lods or ())
+    references = collections.Counter(child for node in document.nodes for child in node.children)
+    references.update(node for other in document.scenes for node in other.nodes)
+    def eligible(node):
+        return isinstance(node, gltf.Node) and node.mesh is not None and not node.children and node not in animated and node not in kept \
+            and references[node] <= 1 and node.camera is None and not node.weights and not node.instances and not node.lods and not node.extensions
+
+    result = []
+    removed = set()
+    def rewrite(children):
+        groups = collections.defaultdict(list)
+        for node in children:
+            if eligible(node):
+                groups[node.mesh].append(node)
+        replacements = {}
+        for mesh, nodes in groups.items():
+            translation, rotation, scale, valid = gltf.decompose(gltf.local_matrices(nodes))
+            nodes = [node for node, ok in zip(nodes, valid) if ok]
+            if len(nodes) < min_count:
+                continue
+            node = document.add_instances(builder, mesh, translation[valid], rotation[valid], scale[valid], name=mesh.name)
+            replacements[nodes[0]] = node
+            removed.update(nodes)
+            result.append(node)
+        return [replacements.get(node, node) for node in children if node in replacements or node not in removed]
+
+    scene.nodes = rewrite(scene.nodes)
+    stack = list(scene.nodes)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, gltf.Node) and node.children:
+            node.children = rewrite(node.children)
+            stack.extend(node.children)
+
+    if removed:
+        document.nodes = [node for node in document.nodes if node not in removed]
+        for key, node in enumerate(document.nodes):
+            node.key = key
+        offset = len(document.nodes)
+        for table in document.nodeTables:
+            table.key = offset
+            offset += len(table)
+    return result
+
+
+# Simplification after Garland and Heckbert, "Surface Simplification Using Quadric Error Metrics" (1997), and level of
+# detail chains, see MSFT_lod.
+
+# Fraction of the candidate collapses, cheapest first, that compete in each simplification round.
+SIMPLIFY_BATCH = 2
+
+def plane_quadrics(positions, triangles):
+    # Area-weighted plane quadrics of triangles, as the 10 unique coefficients of each symmetric 4x4 matrix.
+    p0, p1, p2 = (positions[triangles[:, k]] for k in range(3))
+    normal = np.cross(p1 - p0, p2 - p0)
+    length = np.linalg.norm(normal, axis=1)
+    a, b, c = (normal / np.maximum(length, 1e-300)[:, None]).T
+    d = -(a * p0[:, 0] + b * p0[:, 1] + c * p0[:, 2])
+    return 0.5 * length[:, None] * np.stack([a * a, a * b, a * c, a * d, b * b, b * c, b * d, c * c, c * d, d * d], axis=1)
+
+def quadric_error(quadrics, points):
+    q, (x, y, z) = quadrics.T, points.T
+    return q[0] * x * x + q[4] * y * y + q[7] * z * z + 2.0 * (q[1] * x * y + q[2] * x * z + q[5] * y * z + q[3] * x + q[6] * y + q[8] * z) + q[9]
+
+def edge_keys(triangles, count):
+    a, b = triangles, np.roll(triangles, -1, axis=1)
+    return (np.minimum(a, b) * count + np.maximum(a, b)).ravel()
+
+def spread_minimum(values, corners):
+    # The minimum of values over each vertex and the vertices sharing a triangle with it, corners being the three
+    # columns of the triangles.
+    result = values.copy()
+    minimum = np.minimum(np.minimum(values[corners[0]], values[corners[1]]), values[corners[2]])
+    for corner in corners:
+        np.minimum.at(result, corner, minimum)
+    return result
+
+def simplify(indices, positions, target_count, target_error=None):
+    # Reduces a triangle list to about target_count triangles by half-edge collapses: a vertex moves onto a neighbour,
+    # so the attributes of the surviving vertices stay valid. Vertices on borders, which include attribute seams, and on
+    # non-manifold edges are locked. target_error, relative to the mesh extent, stops the collapses earlier.
+    # Instead of popping one collapse at a time from a heap, every round costs all edges and applies at once a maximal
+    # set of non-interacting collapses among the cheapest, after the link condition and a normal flip test, so that
+    # meshes of millions of triangles take a few dozen vectorized rounds.
+    # Returns the new indices and the error reached, relative to the mesh extent.
+    positions = np.asarray(positions, np.float64)
+    triangles = np.asarray(indices, np.int64).reshape(-1, 3)
+    triangles = triangles[(triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) & (triangles[:, 2] != triangles[:, 0])]
+    count = len(positions)
+    extent = float(np.ptp(positions, axis=0).max()) if count else 0.0
+    extent = extent or 1.0
+    limit = np.inf if target_error is None else (target_error * extent) ** 2
+
+    planes = plane_quadrics(positions, triangles)
+    quadrics = np.stack([np.bincount(triangles.ravel(), np.repeat(planes[:, k], 3), count) for k in range(10)], axis=1)
+    keys, counts = np.unique(edge_keys(triangles, count), return_counts=True)
+    locked = np.zeros(count, bool)
+    locked[keys[counts != 2] // count] = True
+    locked[keys[counts != 2] % count] = True
+
+    random = np.random.default_rng(0)
+    rejected = np.zeros(0, np.int64)
+    error = 0.0
+    while len(triangles) > target_count:
+        keys, counts = np.unique(edge_keys(triangles, count), return_counts=True)
+        u, v = keys // count, keys % count
+        merged = quadrics[u] + quadrics[v]
+        forward = quadric_error(merged, positions[v])
+        backward = quadric_error(merged, positions[u])
+        forward[locked[u] | np.isin(u * count + v, rejected)] = np.inf
+        backward[locked[v] | np.isin(v * count + u, rejected)] = np.inf
+        cost = np.maximum(np.minimum(forward, backward), 0.0)
+        source, target = np.where(forward <= backward, u, v), np.where(forward <= backward, v, u)
+        candidate = np.flatnonzero((cost < np.inf) & (cost <= limit))
+        if not len(candidate):
+            break
+        batch = max(min(len(candidate) // SIMPLIFY_BATCH, 2 * (len(triangles) - target_count)), 1)
+        if batch < len(candidate):
+            candidate = candidate[np.argpartition(cost[candidate], batch - 1)[:batch]]
+        source, target, cost, counts = source[candidate], target[candidate], cost[candidate], counts[candidate]
+
+        # Positions never move, so a collapse only depends on the ring of triangles around its source: two collapses
+        # can run in the same round unless one has an end in the ring of the other. Picking the collapses that rank
+        # first among those they conflict with, then repeating for the collapses still free, gives a maximal set.
+        rank = random.permutation(len(candidate)).astype(np.int32)
+        corners = [np.ascontiguousarray(column) for column in triangles.T]
+        free = np.ones(len(candidate), bool)
+        chosen = np.zeros(len(candidate), bool)
+        while free.any():
+            ends, rings = np.full(count, len(candidate), np.int32), np.full(count, len(candidate), np.int32)
+            np.minimum.at(ends, source[free], rank[free])
+            np.minimum.at(ends, target[free], rank[free])
+            np.minimum.at(rings, source[free], rank[free])
+            ends, rings = spread_minimum(ends, corners), spread_minimum(rings, corners)
+            picked = free & (ends[source] == rank) & (rings[source] == rank) & (rings[target] == rank)
+            chosen |= picked
+            ends, rings = np.zeros(count, np.int8), np.zeros(count, np.int8)
+            ends[source[picked]] = ends[target[picked]] = -1
+            rings[source[picked]] = -1
+            ends, rings = spread_minimum(ends, corners) < 0, spread_minimum(rings, corners) < 0
+            free &= ~(ends[source] | rings[source] | rings[target])
+        chosen = np.flatnonzero(chosen)
+        chosen = chosen[np.argsort(cost[chosen], kind="stable")]
+        source, target, cost, counts = source[chosen], target[chosen], cost[chosen], counts[chosen]
+
+        # Link condition: the vertices adjacent to both ends are exactly those opposite the collapsed edge.
+        directed = np.sort(np.concatenate([keys, keys % count * count + keys // count]))
+        starts, stops = np.searchsorted(directed, source * count), np.searchsorted(directed, (source + 1) * count)
+        lengths = stops - starts
+        owner = np.repeat(np.arange(len(source)), lengths)
+        neighbour = directed[np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - starts, lengths)] % count
+        query = target[owner] * count + neighbour
+        found = directed[np.minimum(np.searchsorted(directed, query), len(directed) - 1)] == query
+        valid = np.bincount(owner[found], minlength=len(source)) == counts
+
+        # Triangles that survive the collapse must not flip or degenerate.
+        collapse = np.full(count, -1)
+        collapse[source] = np.arange(len(source))
+        moved = collapse[triangles]
+        touched = np.flatnonzero(moved.max(axis=1) >= 0)
+        column = moved[touched].argmax(axis=1)
+        which = moved[touched, column]
+        before = triangles[touched]
+        after = before.copy()
+        after[np.arange(len(touched)), column] = target[which]
+        surviving = (after[:, 0] != after[:, 1]) & (after[:, 1] != after[:, 2]) & (after[:, 2] != after[:, 0])
+        normals = [np.cross(positions[t[:, 1]] - positions[t[:, 0]], positions[t[:, 2]] - positions[t[:, 0]]) for t in (before, after)]
+        cosine = (normals[0] * normals[1]).sum(axis=1)
+        flipped = surviving & (cosine <= 0.25 * np.linalg.norm(normals[0], axis=1) * np.linalg.norm(normals[1], axis=1))
+        valid[which[flipped]] = False
+
+        rejected = np.concatenate([rejected, source[~valid] * count + target[~valid]])
+        source, target, cost, counts = source[valid], target[valid], cost[valid], counts[valid]
+        keep = np.cumsum(counts) - counts < len(triangles) - target_count
+        source, target, cost = source[keep], target[keep], cost[keep]
+        if len(source):
+            remap = np.arange(count)
+            remap[source] = target
+            quadrics[target] += quadrics[source]
+            triangles = remap[triangles]
+            triangles = triangles[(triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) & (triangles[:, 2] != triangles[:, 0])]
+            error = max(error, float(cost.max()))
+    return triangles.ravel(), np.sqrt(error) / extent
+
+def simplify_primitive(primitive, builder, target_count, target_error=None):
+    # A copy of a TRIANGLES primitive with about target_count triangles. It shares the vertex streams and morph targets
+    # of primitive; only the indices are new. Returns the primitive and the relative error reached.
+    positions = primitive.attributes[gltf.Attribute.POSITION].as_array()
+    indices = np.arange(len(positions)) if primitive.indices is None else primitive.indices.as_array()
+    indices, error = simplify(indices, positions, target_count, target_error)
+    indices = indices.astype(np.uint16 if len(positions) <= np.iinfo(np.uint16).max else np.uint32)
+    name = primitive.indices.name if primitive.indices else None
+    indices = builder.add_array(indices, gltf.BufferTarget.ELEMENT_ARRAY_BUFFER, bounds=False, name=name)
+    result = gltf.Primitive(dict(primitive.attributes), indices, primitive.material, primitive.mode, targets=primitive.targets,
+        extensions=primitive.extensions, extras=primitive.extras)
+    return result, error
+
+def generate_lods(document, node, builder=None, ratios=(0.5, 0.25, 0.125), coverage=0.5, target_error=None):
+    # Adds one node per ratio, drawing a copy of node's mesh with that fraction of the triangles, and links them from
+    # node with MSFT_lod. Each level is simplified from the previous one. The MSFT_screencoverage hints keep triangles
+    # per pixel roughly constant: the full mesh is used down to coverage, level i down to coverage * ratios[i].
+    # Returns the new nodes, which are not part of any scene.
+    builder = gltf.BufferBuilder(document) if builder is None else builder
+    mesh = node.mesh
+    primitives = mesh.primitives
+    result = []
+    for level, ratio in enumerate(ratios, 1):
+        simplified = []
+        for primitive, original in zip(primitives, mesh.primitives):
+            if primitive.mode != gltf.PrimitiveMode.TRIANGLES or gltf.Attribute.POSITION not in primitive.attributes:
+                simplified.append(primitive)
+                continue
+            triangles = (original.indices.count if original.indices else original.attributes[gltf.Attribute.POSITION].count) // 3
+            simplified.append(simplify_primitive(primitive, builder, int(triangles * ratio), target_error)[0])
+        primitives = simplified
+        name = "{} LOD{}".format(mesh.name or "Mesh", level)
+        lod = gltf.Mesh(primitives, name=name, weights=mesh.weights)
+        document.add_mesh(lod)
+        lod = gltf.Node(name=name, mesh=lod, skin=node.skin, weights=node.weights, matrix=node.matrix, translation=node.translation,
+            rotation=node.rotation, scale=node.scale)
+        document.add_node(lod)
+        result.append(lod)
+    node.lods = result
+    node.extras = dict(node.extras or {}, MSFT_screencoverage=[coverage] + [coverage * ratio for ratio in ratios])
+    document.use_extension("MSFT_lod")
+    return result
@@ -13,4 +13,7 @@ setup(
     packages = [
         'pygltf',
     ],
+    extras_require = {
+        'numpy': ['numpy'],
+    },
 )
\ No newline at end of file
@@ -0,0 +1,616 @@
+import base64
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from pygltf import gltf2 as gltf
+from pygltf import meshopt
+
+
+class BufferBuilderTest(unittest.TestCase):
+    def test_views_survive_appends(self):
+        # Arrays returned by as_array must keep their values while the same builder keeps growing the buffer.
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        expected = np.arange(3000, dtype=np.float32).reshape(-1, 3)
+        view = builder.add_array(expected, gltf.BufferTarget.ARRAY_BUFFER).as_array()
+        for _ in range(20):
+            builder.add_array(np.ones((4096, 3), np.float32), gltf.BufferTarget.ARRAY_BUFFER)
+        np.testing.assert_array_equal(view, expected)
+        np.testing.assert_array_equal(document.accessors[0].as_array(), expected)
+    
+    def test_rewrite_from_views(self):
+        # Reads through views and writes back through the same builder, like weld and quantize do.
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        values = np.random.default_rng(0).random((5000, 3)).astype(np.float32)
+        accessors = [builder.add_array(values + i, gltf.BufferTarget.ARRAY_BUFFER) for i in range(4)]
+        views = [accessor.as_array() for accessor in accessors]
+        copies = [builder.add_array(view * 2.0, gltf.BufferTarget.ARRAY_BUFFER) for view in views]
+        for i, copy in enumerate(copies):
+            np.testing.assert_array_equal(copy.as_array(), (values + i) * 2.0)
+        self.assertEqual(document.buffers[0].byteLength, len(document.buffers[0].data))
+    
+    def test_offsets_aligned(self):
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        builder.add_array(np.arange(3, dtype=np.uint8))
+        view = document.accessors[0].as_array()
+        accessor = builder.add_array(np.arange(3, dtype=np.float32))
+        self.assertEqual(accessor.bufferView.byteOffset % 4, 0)
+        np.testing.assert_array_equal(view, [0, 1, 2])
+        np.testing.assert_array_equal(accessor.as_array(), [0, 1, 2])
+
+    
+    def test_normalized_bounds_are_stored_values(self):
+        # min and max hold the stored integers, normalized or not.
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        accessor = builder.add_array(np.array([[0, 100], [65535, 200]], np.uint16), normalized=True)
+        self.assertEqual(accessor.min, [0, 100])
+        self.assertEqual(accessor.max, [65535, 200])
+
+    def test_sparse_index_type(self):
+        # The index type follows the largest changed row, not the length of the array.
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        for rows, componentType in [([0, 3, 255], gltf.ComponentType.UNSIGNED_BYTE), ([10, 256], gltf.ComponentType.UNSIGNED_SHORT),
+                ([65535], gltf.ComponentType.UNSIGNED_SHORT), ([5, 65536], gltf.ComponentType.UNSIGNED_INT)]:
+            values = np.zeros((70000, 3), np.float32)
+            values[rows] = 1.0
+            accessor = builder.add_sparse_array(values)
+            self.assertEqual(accessor.sparse.indices.componentType, componentType)
+            np.testing.assert_array_equal(accessor.sparse.indices.as_array(len(rows)), rows)
+            np.testing.assert_array_equal(accessor.as_array(), values)
+
+
+class AccessorTest(unittest.TestCase):
+    def test_unloaded_buffer(self):
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        accessor = builder.add_array(np.zeros(3, np.float32))
+        document.buffers[0].data = None
+        with self.assertRaises(ValueError):
+            accessor.as_array()
+
+
+class PrimitiveTest(unittest.TestCase):
+    def test_weld_with_same_builder(self):
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        rng = np.random.default_rng(0)
+        vertices = np.zeros(50000, [("POSITION", np.float32, 3), ("NORMAL", np.float32, 3), ("TEXCOORD_0", np.float32, 2)])
+        for key in vertices.dtype.names:
+            vertices[key] = rng.random(vertices[key].shape)
+        vertices[25000:] = vertices[:25000]
+        attributes = {gltf.Attribute(key): value for key, value in builder.add_structured_array(vertices).items()}
+        primitive = gltf.Primitive(attributes, None, None)
+        remap = primitive.weld(builder)
+        np.testing.assert_array_equal(remap[25000:], remap[:25000])
+        for key in vertices.dtype.names:
+            np.testing.assert_array_equal(primitive.attributes[gltf.Attribute(key)].as_array(), vertices[key][:25000])
+    
+    def test_weld(self):
+        # Vertices 3 and 4 repeat 1 and 0, vertex 5 has the position of 0 with another normal.
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        position = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 0, 0], [0, 0, 0], [0, 0, 0]], np.float32)
+        normal = np.array([[0, 0, 1]] * 5 + [[0, 1, 0]], np.float32)
+        attributes = {gltf.Attribute.POSITION: builder.add_array(position), gltf.Attribute.NORMAL: builder.add_array(normal, name="normals")}
+        primitive = gltf.Primitive(attributes, builder.add_array(np.array([0, 1, 2, 3, 4, 5], np.uint8)), None)
+        remap = primitive.weld(builder)
+        np.testing.assert_array_equal(remap, [0, 1, 2, 1, 0, 3])
+        np.testing.assert_array_equal(primitive.attributes[gltf.Attribute.POSITION].as_array(), position[[0, 1, 2, 5]])
+        np.testing.assert_array_equal(primitive.attributes[gltf.Attribute.NORMAL].as_array(), normal[[0, 1, 2, 5]])
+        self.assertEqual(primitive.attributes[gltf.Attribute.NORMAL].name, "normals")
+        self.assertEqual(primitive.attributes[gltf.Attribute.POSITION].max, [1, 1, 0])
+        indices = primitive.indices.as_array()
+        self.assertEqual(indices.dtype, np.uint16)
+        np.testing.assert_array_equal(indices, [0, 1, 2, 1, 0, 3])
+
+    def test_weld_epsilon_and_targets(self):
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        position = np.array([[0, 0, 0], [1, 0, 0], [1e-7, 0, 0], [1, 1e-7, 0]], np.float32)
+        primitive = gltf.Primitive({gltf.Attribute.POSITION: builder.add_array(position)}, None, None)
+        primitive.add_target(builder, {"POSITION": position + [[0, 0, 1], [0, 0, 0], [0, 0, 1], [0, 0, 2]]})
+        remap = primitive.weld(builder, epsilon=1e-5)
+        # Vertex 2 is within epsilon of 0 and moves with it, vertex 3 is near 1 but its target differs.
+        np.testing.assert_array_equal(remap, [0, 1, 0, 2])
+        np.testing.assert_array_equal(primitive.indices.as_array(), [0, 1, 0, 2])
+        np.testing.assert_allclose(primitive.targets[0][gltf.Attribute.POSITION].as_array(), [[0, 0, 1], [0, 0, 0], [0, 0, 2]], atol=1e-6)
+        np.testing.assert_array_equal(primitive.weld(builder), [0, 1, 2])
+
+    def test_skinned_normals_under_nonuniform_scale(self):
+        # The plane x + y = 1 scaled by (2, 1, 1) becomes x / 2 + y = 1.
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        normal = np.tile(np.array([1.0, 1.0, 0.0]) / np.sqrt(2.0), (3, 1)).astype(np.float32)
+        attributes = {
+            gltf.Attribute.POSITION: builder.add_array(np.array([[1, 0, 0], [0, 1, 0], [1, 0, 1]], np.float32)),
+            gltf.Attribute.NORMAL: builder.add_array(normal),
+            gltf.Attribute.JOINTS_0: builder.add_array(np.zeros((3, 4), np.uint8)),
+            gltf.Attribute.WEIGHTS_0: builder.add_array(np.tile(np.array([1, 0, 0, 0], np.float32), (3, 1))),
+        }
+        primitive = gltf.Primitive(attributes, None, None)
+        result = primitive.skinned(np.diag([2.0, 1.0, 1.0, 1.0])[None])
+        np.testing.assert_allclose(result[gltf.Attribute.POSITION], [[2, 0, 0], [0, 1, 0], [2, 0, 1]])
+        np.testing.assert_allclose(result[gltf.Attribute.NORMAL], np.tile(np.array([0.5, 1.0, 0.0]) / np.sqrt(1.25), (3, 1)), atol=1e-6)
+    
+    def test_add_target_with_same_builder(self):
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        rng = np.random.default_rng(0)
+        position, normal = rng.random((1000, 3)).astype(np.float32), rng.random((1000, 3)).astype(np.float32)
+        attributes = {gltf.Attribute.POSITION: builder.add_array(position), gltf.Attribute.NORMAL: builder.add_array(normal)}
+        primitive = gltf.Primitive(attributes, None, None)
+        for _ in range(3):
+            target = primitive.add_target(builder, {"POSITION": position + 1, "NORMAL": normal + 1})
+            np.testing.assert_allclose(target[gltf.Attribute.POSITION].as_array(), 1, atol=1e-6)
+            np.testing.assert_allclose(target[gltf.Attribute.NORMAL].as_array(), 1, atol=1e-6)
+
+
+class SceneTest(unittest.TestCase):
+    def test_world_matrices_with_node_table(self):
+        # Table rows under the scene and under a node, placed after the nodes.
+        table = gltf.NodeTable(parent=[-1, 0, 1, -1], translation=[[1.0, 0.0, 0.0], [0.0, 2.0, 0.0], [0.0, 0.0, 3.0], [4.0, 0.0, 0.0]])
+        node = gltf.Node(translation=[10.0, 0.0, 0.0], scale=[2.0, 2.0, 2.0], children=[table.node(1)])
+        scene = gltf.Scene(nodes=[node] + table.roots())
+        nodes, world = scene.world_matrices()
+        self.assertEqual(nodes, [node, table.node(0), table.node(3), table.node(1), table.node(1), table.node(2), table.node(2)])
+        origins = world[:, :3, 3]
+        np.testing.assert_allclose(origins[0], [10, 0, 0])
+        np.testing.assert_allclose(origins[1], [1, 0, 0])
+        np.testing.assert_allclose(origins[2], [4, 0, 0])
+        np.testing.assert_allclose(origins[3:5], [[10, 4, 0], [1, 2, 0]])
+        np.testing.assert_allclose(origins[5:7], [[10, 4, 6], [1, 2, 3]])
+        np.testing.assert_allclose(world[3, :3, :3], np.eye(3) * 2)
+
+
+class DocumentTest(unittest.TestCase):
+    def tile(self, value):
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        positions = builder.add_array(np.full((3, 3), value, np.float32), gltf.BufferTarget.ARRAY_BUFFER)
+        mesh = gltf.Mesh([gltf.Primitive({gltf.Attribute.POSITION: positions}, None, None)])
+        document.add_mesh(mesh)
+        node = gltf.Node(mesh=mesh)
+        document.add_node(node)
+        document.add_scene(gltf.Scene(nodes=[node]))
+        return document
+    
+    def test_merge(self):
+        document = self.tile(0.0)
+        tiles = [self.tile(value) for value in (1.0, 2.0)]
+        tiles[0].add_node_table(gltf.NodeTable(2, mesh=0, meshes=tiles[0].meshes))
+        tiles[1].use_extension("KHR_materials_unlit", required=True)
+        document.use_extension("KHR_materials_unlit")
+        meshes = [tile.meshes[0] for tile in tiles]
+        document.merge(*tiles)
+        for name in gltf.GLTF_ARRAYS:
+            self.assertEqual([value.key for value in getattr(document, name)], list(range(len(getattr(document, name)))))
+        self.assertEqual(len(document.buffers), 3)
+        self.assertEqual(document.meshes[1:], meshes)
+        self.assertEqual(len(document.scenes), 3)
+        self.assertIs(document.scene, None)
+        self.assertEqual(document.nodeTables[0].key, 3)
+        self.assertEqual(document.extensionsUsed, ["KHR_materials_unlit"])
+        self.assertEqual(document.extensionsRequired, ["KHR_materials_unlit"])
+        output = document.togltf()
+        self.assertEqual([scene["nodes"] for scene in output["scenes"]], [[0], [1], [2]])
+        self.assertEqual([node.get("mesh") for node in output["nodes"]], [0, 1, 2, 1, 1])
+        self.assertEqual([output["accessors"][output["meshes"][mesh]["primitives"][0]["attributes"]["POSITION"]]["bufferView"] for mesh in range(3)], [0, 1, 2])
+        self.assertEqual([bufferView["buffer"] for bufferView in output["bufferViews"]], [0, 1, 2])
+        for accessor, value in zip(document.accessors, (0.0, 1.0, 2.0)):
+            np.testing.assert_array_equal(accessor.as_array(), np.full((3, 3), value))
+        with self.assertRaises(ValueError):
+            document.merge(document)
+
+    def test_merge_scenes(self):
+        document = gltf.Document()
+        tiles = [self.tile(value) for value in (1.0, 2.0)]
+        nodes = [tile.nodes[0] for tile in tiles]
+        document.merge(*tiles, merge_scenes=True)
+        self.assertEqual(len(document.scenes), 1)
+        self.assertIs(document.scene, document.scenes[0])
+        self.assertEqual(document.scene.nodes, nodes)
+        self.assertEqual(document.togltf()["scenes"], [{"nodes": [0, 1]}])
+
+    def test_merge_rebases_uris(self):
+        # Tiles loaded from two directories, each with a tile.bin next to it.
+        with tempfile.TemporaryDirectory() as directory:
+            for name, value in (("a", 1.0), ("b", 2.0)):
+                tile = self.tile(value)
+                os.mkdir(os.path.join(directory, name))
+                with open(os.path.join(directory, name, "tile.bin"), "wb") as fp:
+                    fp.write(tile.buffers[0].data)
+                tile.buffers[0].uri = "tile.bin"
+                tile.add_images([gltf.Image("data:image/png;base64,AAAA"), gltf.Image("https://example.com/a%20b.png"), gltf.Image("../textures/my%20image.png")])
+                with open(os.path.join(directory, name, "tile.gltf"), "w") as fp:
+                    tile.write_json(fp)
+            document = gltf.Document.load(os.path.join(directory, "a", "tile.gltf"))
+            document.merge(gltf.Document.load(os.path.join(directory, "b", "tile.gltf")))
+            self.assertEqual([buffer.uri for buffer in document.buffers], ["tile.bin", "../b/tile.bin"])
+            self.assertEqual([image.uri for image in document.images[3:]], ["data:image/png;base64,AAAA", "https://example.com/a%20b.png", "../textures/my%20image.png"])
+            merged = gltf.Document(base=directory)
+            merged.merge(document)
+            self.assertEqual([buffer.uri for buffer in merged.buffers], ["a/tile.bin", "b/tile.bin"])
+            self.assertEqual([image.uri for image in merged.images][2::3], ["textures/my%20image.png"] * 2)
+            path = os.path.join(directory, "merged.gltf")
+            with open(path, "w") as fp:
+                merged.write_json(fp)
+            del document, merged
+            loaded = gltf.Document.load(path)
+            for accessor, value in zip(loaded.accessors, (1.0, 2.0)):
+                np.testing.assert_array_equal(accessor.as_array(), np.full((3, 3), value))
+            del loaded, accessor
+
+    def test_merge_renumbers_extension_references(self):
+        def textured(uri):
+            document = self.tile(0.0)
+            image = gltf.Image(uri)
+            document.add_images([image, image])
+            texture = gltf.Texture(source=image, extensions={"KHR_texture_basisu": {"source": 1}})
+            document.add_texture(texture)
+            clearcoat = {"clearcoatFactor": 1.0, "clearcoatTexture": {"index": 0, "texCoord": 1}, "clearcoatNormalTexture": {"index": 0, "scale": 2}}
+            document.add_material(gltf.Material(extensions={"KHR_materials_clearcoat": clearcoat}, extras={"index": 7}))
+            return document
+        document = textured("a.png")
+        document.merge(textured("b.png"), textured("c.png"))
+        output = document.togltf()
+        self.assertEqual([texture["extensions"]["KHR_texture_basisu"]["source"] for texture in output["textures"]], [1, 3, 5])
+        clearcoats = [material["extensions"]["KHR_materials_clearcoat"] for material in output["materials"]]
+        self.assertEqual([clearcoat["clearcoatTexture"] for clearcoat in clearcoats], [{"index": 0, "texCoord": 1}, {"index": 1, "texCoord": 1}, {"index": 2, "texCoord": 1}])
+        self.assertEqual([clearcoat["clearcoatNormalTexture"]["index"] for clearcoat in clearcoats], [0, 1, 2])
+        self.assertEqual([material["extras"] for material in output["materials"]], [{"index": 7}] * 3)
+
+    def test_merge_compressed(self):
+        tiles = [self.tile(value) for value in (1.0, 2.0)]
+        for tile in tiles:
+            meshopt.compress(tile, max_workers=1)
+        document = tiles[0]
+        document.merge(tiles[1])
+        output = document.togltf()
+        self.assertEqual([bufferView["buffer"] for bufferView in output["bufferViews"]], [1, 3])
+        self.assertEqual([bufferView["extensions"]["EXT_meshopt_compression"]["buffer"] for bufferView in output["bufferViews"]], [0, 2])
+
+    def test_save_glb_after_merge(self):
+        # Every tile's buffer ends up in the BIN chunk, the document itself is left as it was.
+        document = gltf.Document()
+        document.merge(*(self.tile(value) for value in (1.0, 2.0, 3.0)), merge_scenes=True)
+        offsets = [bufferView.byteOffset for bufferView in document.bufferViews]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "merged.glb")
+            document.save_glb(path)
+            loaded = gltf.Document.load(path)
+            self.assertEqual(len(loaded.buffers), 1)
+            self.assertLessEqual(loaded.buffers[0].byteLength, len(loaded.buffers[0].data))
+            for accessor, value in zip(loaded.accessors, (1.0, 2.0, 3.0)):
+                np.testing.assert_array_equal(accessor.as_array(), np.full((3, 3), value))
+            del loaded, accessor
+        self.assertEqual([buffer.key for buffer in document.buffers], [0, 1, 2])
+        self.assertEqual([bufferView.buffer for bufferView in document.bufferViews], document.buffers)
+        self.assertEqual([bufferView.byteOffset for bufferView in document.bufferViews], offsets)
+        self.assertEqual([buffer.byteLength for buffer in document.buffers], [36, 36, 36])
+
+class PruneTest(unittest.TestCase):
+    def test_prune(self):
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        unused = builder.add_array(np.zeros(100, np.float32))
+        positions = builder.add_array(np.eye(3, dtype=np.float32), gltf.BufferTarget.ARRAY_BUFFER)
+        image = gltf.Image("albedo.png")
+        document.add_images([gltf.Image("unused.png"), image])
+        texture = gltf.Texture(source=image)
+        document.add_texture(texture)
+        material = gltf.Material(pbrMetallicRoughness=gltf.PBRMetallicRoughness(baseColorTexture=gltf.TextureInfo(texture)))
+        document.add_materials([gltf.Material(name="unused"), material])
+        mesh = gltf.Mesh([gltf.Primitive({gltf.Attribute.POSITION: positions}, None, material)])
+        document.add_meshes([gltf.Mesh([gltf.Primitive({gltf.Attribute.POSITION: unused}, None, None)]), mesh])
+        joint = gltf.Node(name="joint")
+        skin = gltf.Skin([joint], inverseBindMatrices=builder.add_array(np.eye(4, dtype=np.float32)[None]))
+        document.add_skin(skin)
+        node = gltf.Node(mesh=mesh, skin=skin)
+        orphan = gltf.Node(mesh=document.meshes[0])
+        document.add_nodes([orphan, joint, node])
+        document.add_node_table(gltf.NodeTable(5))
+        document.add_scene(gltf.Scene(nodes=[node]))
+        input = builder.add_array(np.zeros(1, np.float32))
+        samplers = [gltf.AnimationSampler(input, builder.add_array(np.zeros((1, 3), np.float32)), interpolation=gltf.Interpolation.STEP) for _ in range(2)]
+        channels = [gltf.AnimationChannel(0, gltf.AnimationChannelTarget(orphan, gltf.TargetPath.SCALE)),
+            gltf.AnimationChannel(1, gltf.AnimationChannelTarget(joint, gltf.TargetPath.TRANSLATION))]
+        document.add_animation(gltf.Animation(channels, samplers))
+        byteLength = document.buffers[0].byteLength
+
+        result = document.prune()
+        self.assertEqual(result, {"accessors": 2, "animations": 0, "buffers": 0, "bufferViews": 2, "cameras": 0, "images": 1,
+            "materials": 1, "meshes": 1, "nodes": 1, "samplers": 0, "skins": 0, "textures": 0, "nodeTables": 1, "bytes": 412})
+        self.assertEqual(document.buffers[0].byteLength, byteLength - 412)
+        self.assertEqual(document.nodes, [joint, node])
+        self.assertEqual(document.meshes, [mesh])
+        self.assertEqual(document.images, [image])
+        self.assertEqual(document.nodeTables, [])
+        animation = document.animations[0]
+        self.assertEqual([channel.target.node for channel in animation.channels], [joint])
+        self.assertEqual(animation.channels[0].sampler, 0)
+        self.assertEqual(animation.samplers, samplers[1:])
+        for name in gltf.GLTF_ARRAYS:
+            self.assertEqual([value.key for value in getattr(document, name)], list(range(len(getattr(document, name)))))
+        output = document.togltf()
+        self.assertEqual(output["nodes"][1], {"skin": 0, "mesh": 0})
+        self.assertEqual(output["skins"][0]["joints"], [0])
+        self.assertEqual(output["textures"][0]["source"], 0)
+        np.testing.assert_array_equal(positions.as_array(), np.eye(3))
+        np.testing.assert_array_equal(skin.inverseBindMatrices.as_array(), np.eye(4)[None])
+        self.assertEqual(document.prune()["bytes"], 0)
+
+    def test_prune_compressed(self):
+        document = gltf.Document()
+        document.use_extension("EXT_meshopt_compression")
+        with self.assertRaises(ValueError):
+            document.prune()
+
+
+class JsonTest(unittest.TestCase):
+    def build(self, incremental=False):
+        document = gltf.Document(incremental=incremental)
+        document.use_extension("KHR_materials_unlit")
+        builder = gltf.BufferBuilder(document)
+        positions = builder.add_array(np.eye(3, dtype=np.float32), gltf.BufferTarget.ARRAY_BUFFER, name="positions \u00e9")
+        indices = builder.add_array(np.arange(3, dtype=np.uint16), gltf.BufferTarget.ELEMENT_ARRAY_BUFFER, bounds=False)
+        material = gltf.Material(name="unlit", extensions={"KHR_materials_unlit": {}}, doubleSided=True)
+        document.add_material(material)
+        mesh = gltf.Mesh([gltf.Primitive({gltf.Attribute.POSITION: positions}, indices, material)], extras={"tile": [1, 2]})
+        document.add_mesh(mesh)
+        child = gltf.Node(mesh=mesh, scale=[1.0, 2.0, 0.5])
+        node = gltf.Node(name="root", children=[child], translation=[0.1, 0.0, 1e-30])
+        document.add_nodes([node, child])
+        document.add_node_table(gltf.NodeTable(2, mesh=0, meshes=[mesh], translation=[[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]))
+        document.scene = gltf.Scene(nodes=[node], name="scene")
+        document.add_scene(document.scene)
+        return document
+
+    def test_iter_json_matches_dumps(self):
+        for incremental in (False, True):
+            document = self.build(incremental)
+            expected = json.dumps(document.togltf())
+            self.assertEqual("".join(document.iter_json()), expected)
+            self.assertEqual("".join(document.iter_json()), expected)
+            self.assertEqual("".join(document.iter_json(separators=(",", ":"))), json.dumps(document.togltf(), separators=(",", ":")))
+
+    def test_write_json(self):
+        document = self.build()
+        fp = io.StringIO()
+        document.write_json(fp)
+        self.assertEqual(fp.getvalue(), json.dumps(document.togltf()))
+
+    def test_empty_document(self):
+        document = gltf.Document()
+        self.assertEqual("".join(document.iter_json()), json.dumps(document.togltf()))
+
+
+class LoadTest(unittest.TestCase):
+    def build(self):
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        vertices = np.zeros(4, [("POSITION", np.float32, 3), ("COLOR_0", np.uint8, 4)])
+        vertices["POSITION"] = np.arange(12).reshape(4, 3)
+        vertices["COLOR_0"] = np.arange(16).reshape(4, 4) * 16
+        attributes = {gltf.Attribute(key): value for key, value in builder.add_structured_array(vertices).items()}
+        indices = builder.add_array(np.array([0, 1, 2, 2, 1, 3], np.uint16), gltf.BufferTarget.ELEMENT_ARRAY_BUFFER, bounds=False)
+        moved = np.zeros((300, 3), np.float32)
+        moved[[5, 250]] = [[1, 2, 3], [4, 5, 6]]
+        sparse = builder.add_sparse_array(moved)
+        mesh = gltf.Mesh([gltf.Primitive(attributes, indices, None)], name="quad")
+        document.add_mesh(mesh)
+        child = gltf.Node(mesh=mesh, translation=[1.0, 0.0, 0.0])
+        node = gltf.Node(name="root", children=[child])
+        document.add_nodes([node, child])
+        document.scene = gltf.Scene(nodes=[node])
+        document.add_scene(document.scene)
+        return document, builder, vertices, moved
+
+    def check(self, path, vertices, moved):
+        loaded = gltf.Document.load(path)
+        self.assertEqual(loaded.scene, loaded.scenes[0])
+        self.assertEqual(loaded.scene.nodes, loaded.nodes[:1])
+        self.assertEqual(loaded.nodes[0].children, loaded.nodes[1:])
+        primitive = loaded.nodes[1].mesh.primitives[0]
+        position = primitive.attributes[gltf.Attribute.POSITION]
+        color = primitive.attributes[gltf.Attribute.COLOR_0]
+        self.assertEqual(position.bufferView, color.bufferView)
+        self.assertEqual(position.bufferView.byteStride, 16)
+        self.assertEqual(color.byteOffset, 12)
+        # Dense accessors are views of the mapped file, sparse ones are materialized.
+        view = position.as_array()
+        self.assertFalse(view.flags.owndata)
+        np.testing.assert_array_equal(view, vertices["POSITION"])
+        np.testing.assert_array_equal(color.as_array(normalized=False), vertices["COLOR_0"])
+        np.testing.assert_array_equal(primitive.indices.as_array(), [0, 1, 2, 2, 1, 3])
+        sparse = loaded.accessors[-1]
+        self.assertIsNone(sparse.bufferView)
+        self.assertEqual(sparse.sparse.count, 2)
+        np.testing.assert_array_equal(sparse.as_array(), moved)
+        self.assertEqual(json.dumps(loaded.togltf()), json.dumps(self.expected))
+        del loaded, primitive, position, color, view, sparse
+
+    def test_load_gltf(self):
+        document, builder, vertices, moved = self.build()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "quad.gltf")
+            document.buffers[0].uri = "quad%20data.bin"
+            with open(os.path.join(directory, "quad data.bin"), "wb") as fp:
+                fp.write(builder.data)
+            with open(path, "w") as fp:
+                document.write_json(fp)
+            self.expected = document.togltf()
+            self.assertEqual(self.expected["buffers"][0]["uri"], "quad%20data.bin")
+            self.check(path, vertices, moved)
+
+    def test_load_glb(self):
+        document, _, vertices, moved = self.build()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "quad.glb")
+            document.save_glb(path)
+            self.expected = document.togltf()
+            self.check(path, vertices, moved)
+
+    def test_load_data_uri(self):
+        document, builder, vertices, moved = self.build()
+        document.buffers[0].uri = "data:application/octet-stream;base64," + base64.b64encode(builder.data).decode("ascii")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "quad.gltf")
+            with open(path, "w") as fp:
+                document.write_json(fp)
+            self.expected = document.togltf()
+            self.check(path, vertices, moved)
+
+
+class AnimationTest(unittest.TestCase):
+    def animation(self, outputs):
+        # One channel per (path, interpolation, values) on its own node, all sharing the keyframes 0, 1 and 2.
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        input = builder.add_array(np.array([0.0, 1.0, 2.0], np.float32))
+        samplers, channels = [], []
+        for path, interpolation, values in outputs:
+            output = builder.add_array(np.asarray(values, np.float32))
+            samplers.append(gltf.AnimationSampler(input, output, interpolation=interpolation))
+            channels.append(gltf.AnimationChannel(len(channels), gltf.AnimationChannelTarget(gltf.Node(), path)))
+        return gltf.Animation(channels, samplers)
+
+    def test_linear_and_step(self):
+        values = [[0, 0, 0], [2, 4, 6], [2, 0, 0]]
+        animation = self.animation([(gltf.TargetPath.TRANSLATION, gltf.Interpolation.LINEAR, values),
+            (gltf.TargetPath.SCALE, gltf.Interpolation.STEP, values)])
+        linear, step = animation.sample([-1.0, 0.0, 0.25, 1.0, 1.5, 2.0, 3.0]).values()
+        np.testing.assert_allclose(linear, [[0, 0, 0], [0, 0, 0], [0.5, 1, 1.5], [2, 4, 6], [2, 2, 3], [2, 0, 0], [2, 0, 0]])
+        np.testing.assert_allclose(step, [[0, 0, 0], [0, 0, 0], [0, 0, 0], [2, 4, 6], [2, 4, 6], [2, 0, 0], [2, 0, 0]])
+        self.assertEqual(animation.sample(0.5)[animation.channels[0]].shape, (3,))
+
+    def test_cubicspline(self):
+        # In-tangent, value and out-tangent per keyframe; at u = 0.5 the Hermite weights are 0.5, 0.125, 0.5 and -0.125.
+        values = [[[0], [0], [1]], [[2], [1], [0]], [[0], [1], [0]]]
+        animation = self.animation([(gltf.TargetPath.WEIGHTS, gltf.Interpolation.CUBICSPLINE, np.reshape(values, (9, 1)))])
+        result = animation.sample([0.0, 0.5, 1.0, 1.5, 2.0])[animation.channels[0]]
+        np.testing.assert_allclose(result.ravel(), [0, 0.125 + 0.5 - 0.25, 1, 1, 1])
+
+    def test_slerp(self):
+        half = np.sqrt(0.5)
+        values = [[0, 0, 0, 1], [0, 0, half, half], [0, 0, -half, -half]]
+        animation = self.animation([(gltf.TargetPath.ROTATION, gltf.Interpolation.LINEAR, values)])
+        result = animation.sample([0.5, 1.0, 1.5])[animation.channels[0]]
+        eighth = [0, 0, np.sin(np.pi / 8), np.cos(np.pi / 8)]
+        # The second half runs between the same rotation written with opposite signs, so it stays put.
+        np.testing.assert_allclose(result[0], eighth, atol=1e-6)
+        np.testing.assert_allclose(np.abs(result[1:]), np.abs([values[1], values[1]]), atol=1e-6)
+        np.testing.assert_allclose(np.linalg.norm(result, axis=1), 1, atol=1e-6)
+
+    def test_cubicspline_rotation_is_normalized(self):
+        half = np.sqrt(0.5)
+        values = [[0, 0, 0, 0], [0, 0, 0, 1], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, half, half], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 1, 0], [0, 0, 0, 0]]
+        animation = self.animation([(gltf.TargetPath.ROTATION, gltf.Interpolation.CUBICSPLINE, values)])
+        result = animation.sample(np.linspace(0, 2, 9))[animation.channels[0]]
+        np.testing.assert_allclose(np.linalg.norm(result, axis=1), 1, atol=1e-6)
+        np.testing.assert_allclose(result[[0, 4, 8]], [values[1], values[4], values[7]], atol=1e-6)
+
+    def test_apply(self):
+        animation = self.animation([(gltf.TargetPath.TRANSLATION, gltf.Interpolation.LINEAR, [[0, 0, 0], [2, 4, 6], [2, 0, 0]])])
+        node = animation.channels[0].target.node
+        revision = node.revision
+        animation.apply(0.5)
+        np.testing.assert_allclose(node.translation, [1, 2, 3])
+        self.assertGreater(node.revision, revision)
+
+    def test_apply_to_node_table_rows(self):
+        animation = self.animation([(gltf.TargetPath.TRANSLATION, gltf.Interpolation.LINEAR, [[0, 0, 0], [2, 4, 6], [2, 0, 0]]),
+            (gltf.TargetPath.ROTATION, gltf.Interpolation.STEP, [[0, 0, 0, 1], [0, 0, 1, 0], [0, 0, 1, 0]])])
+        table = gltf.NodeTable(parent=[-1, 0, -1], scale=[[2.0, 2.0, 2.0]] * 3)
+        scene = gltf.Scene(nodes=table.roots())
+        _, before = scene.world_matrices()
+        animation.channels[0].target.node = table.node(1)
+        animation.channels[1].target.node = table.node(2)
+        animation.apply(1.5)
+        np.testing.assert_allclose(table.translation, [[0, 0, 0], [2, 2, 3], [0, 0, 0]])
+        np.testing.assert_allclose(table.rotation, [[0, 0, 0, 1], [0, 0, 0, 1], [0, 0, 1, 0]])
+        nodes, after = scene.world_matrices()
+        self.assertEqual(nodes, [table.node(0), table.node(2), table.node(1)])
+        np.testing.assert_allclose(after[2, :3, 3], [4, 4, 6])
+        np.testing.assert_allclose(after[1, :3, :3], np.diag([-2.0, -2.0, 2.0]), atol=1e-12)
+        np.testing.assert_allclose(before[1, :3, 3], 0)
+
+    def test_apply_weights_to_node_table_row(self):
+        animation = self.animation([(gltf.TargetPath.WEIGHTS, gltf.Interpolation.LINEAR, [[0], [1], [0]])])
+        animation.channels[0].target.node = gltf.NodeTable(1).node(0)
+        with self.assertRaises(TypeError):
+            animation.apply(0.5)
+
+
+class InstrumentationTest(unittest.TestCase):
+    def build(self):
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        positions = builder.add_array(np.eye(3, dtype=np.float32), gltf.BufferTarget.ARRAY_BUFFER)
+        mesh = gltf.Mesh([gltf.Primitive({gltf.Attribute.POSITION: positions}, None, None)])
+        document.add_mesh(mesh)
+        node = gltf.Node(mesh=mesh)
+        document.add_node(node)
+        document.add_node_table(gltf.NodeTable(2))
+        document.add_scene(gltf.Scene(nodes=[node]))
+        return document
+
+    def test_save_glb(self):
+        document = self.build()
+        metrics = []
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "scene.glb")
+            with document.instrumented(lambda *metric: metrics.append(metric)) as instrumentation:
+                self.assertIs(document.instrumentation, instrumentation)
+                with instrumentation.phase("build", stage=1):
+                    pass
+                document.save_glb(path)
+            size = os.path.getsize(path)
+        self.assertIsNone(document.instrumentation)
+        names = [metric for metric, _, _ in metrics]
+        self.assertEqual(names, ["phase.build", "phase.json", "phase.write", "count.buffers", "count.bufferViews", "count.accessors",
+            "count.meshes", "count.nodes", "count.scenes", "bytes.json", "bytes.buffer", "bytes.file"])
+        values = {metric: (value, tags) for metric, value, tags in metrics}
+        self.assertEqual(values["phase.build"][1], {"stage": 1})
+        self.assertGreaterEqual(values["phase.write"][0], 0.0)
+        self.assertEqual(values["count.nodes"], (3, {}))
+        self.assertEqual(values["bytes.buffer"], (36, {"buffer": 0}))
+        self.assertEqual(values["bytes.file"], (size, {}))
+        self.assertEqual(values["bytes.file"][0], 12 + 8 + values["bytes.json"][0] + 8 + 36)
+
+    def test_togltf_and_write_json(self):
+        document = self.build()
+        metrics = []
+        with document.instrumented(lambda metric, value, tags: metrics.append(metric)):
+            document.togltf()
+            self.assertEqual(metrics[0], "phase.togltf")
+            del metrics[:]
+            document.write_json(io.StringIO())
+        self.assertEqual(metrics[0], "phase.json")
+        self.assertIn("count.accessors", metrics)
+
+    def test_load_and_log_sink(self):
+        document = self.build()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "scene.glb")
+            document.save_glb(path)
+            gltf.Document.instrumentation = gltf.Instrumentation(gltf.log_sink())
+            try:
+                with self.assertLogs("pygltf") as logs:
+                    gltf.Document.load(path)
+            finally:
+                gltf.Document.instrumentation = None
+        self.assertTrue(logs.output[0].startswith("INFO:pygltf:phase.load "))
+        self.assertIn("INFO:pygltf:count.nodes 3", logs.output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from pygltf import gltf2 as gltf
+from pygltf import __main__ as cli
+
+
+class ConvertTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.positions = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]], np.float64)
+        self.npz = os.path.join(self.directory.name, "indexed.npz")
+        np.savez(self.npz, position=self.positions, texCoord=self.positions[:, :2], indices=np.array([0, 1, 2, 2, 1, 0]))
+        vertices = np.zeros(6, [("position", np.float32, 3), ("normal", np.float32, 3)])
+        vertices["position"] = np.tile(self.positions, (2, 1))
+        vertices["normal"] = [0, 0, 1]
+        self.npy = os.path.join(self.directory.name, "triangles.npy")
+        np.save(self.npy, vertices)
+
+    def assertConverted(self, path, name, attributes, indices):
+        document = gltf.Document.load(path)
+        self.assertEqual(len(document.scenes), 1)
+        self.assertEqual(document.scenes[0].nodes, document.nodes)
+        self.assertEqual(document.nodes[0].name, name)
+        primitive = document.nodes[0].mesh.primitives[0]
+        self.assertEqual(set(primitive.attributes), attributes)
+        self.assertEqual(primitive.indices.count if primitive.indices else 0, indices)
+        np.testing.assert_array_equal(primitive.attributes[gltf.Attribute.POSITION].as_array()[:3], self.positions)
+        del document, primitive
+
+    def test_convert_npz(self):
+        for format in cli.FORMATS:
+            target = os.path.join(self.directory.name, "indexed." + format)
+            _, vertices, indices = cli.convert(self.npz, target, format)
+            self.assertEqual((vertices, indices), (3, 6))
+            self.assertConverted(target, "indexed", {gltf.Attribute.POSITION, gltf.Attribute.TEXCOORD_0}, 6)
+
+    def test_convert_npy(self):
+        target = os.path.join(self.directory.name, "triangles.glb")
+        self.assertEqual(cli.convert(self.npy, target)[1:], (6, 0))
+        self.assertConverted(target, "triangles", {gltf.Attribute.POSITION, gltf.Attribute.NORMAL}, 0)
+
+    def test_run(self):
+        output = os.path.join(self.directory.name, "out")
+        missing = os.path.join(self.directory.name, "missing.npz")
+        out, err = io.StringIO(), io.StringIO()
+        failed = cli.run([self.npz, self.npy, missing], output, jobs=1, out=out, err=err)
+        self.assertEqual(failed, 1)
+        self.assertIn("missing.npz", err.getvalue())
+        self.assertIn("2 converted, 1 failed", out.getvalue())
+        self.assertConverted(os.path.join(output, "indexed.glb"), "indexed", {gltf.Attribute.POSITION, gltf.Attribute.TEXCOORD_0}, 6)
+        self.assertConverted(os.path.join(output, "triangles.glb"), "triangles", {gltf.Attribute.POSITION, gltf.Attribute.NORMAL}, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from pygltf import gltf2 as gltf
+from pygltf import meshopt
+
+try:
+    import meshoptimizer
+except ImportError:
+    meshoptimizer = None
+
+
+def rotated_triangles(indices):
+    # Triangles rotated to start at their smallest index: the triangle codec keeps winding, not the first corner.
+    triangles = np.asarray(indices, np.int64).reshape(-1, 3)
+    first = triangles.argmin(axis=1)[:, None]
+    return np.take_along_axis(triangles, (first + np.arange(3)) % 3, axis=1)
+
+def grid_triangles(size):
+    rows, columns = np.divmod(np.arange(size * size), size)
+    corner = (rows * (size + 1) + columns)[:, None]
+    return np.concatenate([corner + [0, 1, size + 1], corner + [1, size + 2, size + 1]]).ravel()
+
+def decode_bufferView(document, bufferView):
+    # Reference decoding of one compressed bufferView, returning its bytes.
+    extension = bufferView.extensions[meshopt.EXTENSION]
+    count, byteStride = extension["count"], extension["byteStride"]
+    start = extension["byteOffset"]
+    stream = bytes(document.buffers[extension["buffer"]].data[start:start + extension["byteLength"]])
+    if extension["mode"] == meshopt.Mode.ATTRIBUTES:
+        data = meshoptimizer.decode_vertex_buffer(count, byteStride, stream, dtype=np.dtype((np.void, byteStride))).view(np.uint8)
+    elif extension["mode"] == meshopt.Mode.TRIANGLES:
+        data = meshoptimizer.decode_index_buffer(count, 4, stream).astype("<u{}".format(byteStride)).view(np.uint8)
+    else:
+        data = meshoptimizer.decode_index_sequence(count, 4, stream).astype("<u{}".format(byteStride)).view(np.uint8)
+    filter = extension.get("filter", meshopt.MeshoptFilter.NONE)
+    if filter == meshopt.MeshoptFilter.OCTAHEDRAL:
+        data = meshoptimizer.decode_filter_oct(data.view(np.int8 if byteStride == 4 else np.int16), count, byteStride)
+    elif filter == meshopt.MeshoptFilter.QUATERNION:
+        data = meshoptimizer.decode_filter_quat(data.view(np.int16), count, byteStride)
+    elif filter == meshopt.MeshoptFilter.EXPONENTIAL:
+        data = meshoptimizer.decode_filter_exp(data.view(np.uint32), count, byteStride)
+    return data.view(np.uint8).tobytes()
+
+
+@unittest.skipIf(meshoptimizer is None, "meshoptimizer is not installed")
+class CodecTest(unittest.TestCase):
+    # Round trips through the decoders of the meshoptimizer reference implementation.
+    def test_vertex_buffer(self):
+        rng = np.random.default_rng(0)
+        for count, byteStride in [(1, 4), (17, 4), (1000, 12), (5000, 16), (300, 256), (70000, 8)]:
+            data = rng.integers(0, 256, (count, byteStride), dtype=np.uint8)
+            data[:, :byteStride // 2] = np.cumsum(rng.integers(-2, 3, (count, byteStride // 2)), axis=0)
+            stream = meshopt.encode_vertex_buffer(data)
+            decoded = meshoptimizer.decode_vertex_buffer(count, byteStride, stream, dtype=np.dtype((np.void, byteStride)))
+            np.testing.assert_array_equal(decoded.view(np.uint8).reshape(count, byteStride), data)
+
+    def test_index_buffer(self):
+        triangles = grid_triangles(40)
+        shuffled = triangles.reshape(-1, 3)[np.random.default_rng(0).permutation(len(triangles) // 3)].ravel()
+        restart = np.concatenate([triangles, [0, 1, 2], triangles + 5000])
+        for indices in [triangles, shuffled, restart]:
+            stream = meshopt.encode_index_buffer(indices)
+            decoded = meshoptimizer.decode_index_buffer(len(indices), 4, stream)
+            np.testing.assert_array_equal(rotated_triangles(decoded), rotated_triangles(indices))
+            self.assertEqual(stream, bytes(meshoptimizer.encode_index_buffer(indices.astype(np.uint32))))
+        with self.assertRaises(ValueError):
+            meshopt.encode_index_buffer([0, 1])
+
+    def test_index_sequence(self):
+        rng = np.random.default_rng(0)
+        for indices in [np.arange(1000), rng.integers(0, 1 << 30, 1000), np.repeat(rng.integers(0, 100, 50), 3)]:
+            stream = meshopt.encode_index_sequence(indices)
+            np.testing.assert_array_equal(meshoptimizer.decode_index_sequence(len(indices), 4, stream), indices)
+
+    def test_octahedral_filter(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(1000, 3))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        value = np.concatenate([vectors, np.where(rng.random((1000, 1)) < 0.5, -1.0, 1.0)], axis=1)
+        for byteStride, bits, tolerance in [(4, 8, 0.02), (8, 12, 1e-3), (8, 16, 1e-4)]:
+            encoded = meshopt.encode_filter_oct(value, bits, byteStride)
+            decoded = meshoptimizer.decode_filter_oct(encoded, len(value), byteStride) / np.float64(np.iinfo(encoded.dtype).max)
+            np.testing.assert_allclose(decoded[:, :3], vectors, atol=tolerance)
+            np.testing.assert_array_equal(decoded[:, 3], value[:, 3])
+
+    def test_quaternion_filter(self):
+        rotations = np.random.default_rng(0).normal(size=(1000, 4))
+        rotations /= np.linalg.norm(rotations, axis=1, keepdims=True)
+        for bits, tolerance in [(8, 1e-2), (12, 1e-3), (16, 1e-4)]:
+            decoded = meshoptimizer.decode_filter_quat(meshopt.encode_filter_quat(rotations, bits), len(rotations), 8) / 32767.0
+            # q and -q are the same rotation.
+            sign = np.sign(np.sum(decoded * rotations, axis=1))[:, None]
+            np.testing.assert_allclose(decoded, rotations * sign, atol=tolerance)
+
+    def test_exponential_filter(self):
+        rng = np.random.default_rng(0)
+        value = (rng.normal(size=(1000, 3)) * 10.0 ** rng.integers(-5, 5, (1000, 1))).astype(np.float32)
+        for bits in (10, 15, 23):
+            decoded = meshoptimizer.decode_filter_exp(meshopt.encode_filter_exp(value, bits), len(value), 12).view(np.float32)
+            np.testing.assert_array_less(np.abs(decoded - value), np.abs(value) * 2.0 ** -(bits - 1) + 1e-30)
+
+    def test_compress(self):
+        # Decodes every compressed bufferView into the fallback buffer and reads the accessors back.
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        rng = np.random.default_rng(0)
+        positions = rng.random((441, 3)).astype(np.float32)
+        normals = rng.normal(size=(441, 3))
+        normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+        rotations = rng.normal(size=(10, 4))
+        rotations /= np.linalg.norm(rotations, axis=1, keepdims=True)
+        triangles = grid_triangles(20).astype(np.uint16)
+        attributes = {
+            gltf.Attribute.POSITION: builder.add_array(positions, gltf.BufferTarget.ARRAY_BUFFER),
+            gltf.Attribute.NORMAL: builder.add_array(np.round(normals * 127).astype(np.int8), gltf.BufferTarget.ARRAY_BUFFER, normalized=True),
+        }
+        mesh = gltf.Mesh([
+            gltf.Primitive(attributes, builder.add_array(triangles, gltf.BufferTarget.ELEMENT_ARRAY_BUFFER, bounds=False), None),
+            gltf.Primitive(attributes, builder.add_array(np.arange(100, dtype=np.uint32), gltf.BufferTarget.ELEMENT_ARRAY_BUFFER, bounds=False), None, gltf.PrimitiveMode.LINES),
+        ])
+        document.add_mesh(mesh)
+        node = gltf.Node(mesh=mesh)
+        document.add_node(node)
+        document.add_scene(gltf.Scene(nodes=[node]))
+        sampler = gltf.AnimationSampler(builder.add_array(np.arange(10, dtype=np.float32)), builder.add_array(rotations.astype(np.float32)), interpolation=gltf.Interpolation.LINEAR)
+        document.add_animation(gltf.Animation([gltf.AnimationChannel(0, gltf.AnimationChannelTarget(node, gltf.TargetPath.ROTATION))], [sampler]))
+        meshopt.compress(document, max_workers=1)
+
+        self.assertEqual(document.extensionsRequired, [meshopt.EXTENSION])
+        extensions = [bufferView.extensions[meshopt.EXTENSION] for bufferView in document.bufferViews]
+        self.assertEqual([(extension["mode"], extension.get("filter")) for extension in extensions], [
+            (meshopt.Mode.ATTRIBUTES, None), (meshopt.Mode.ATTRIBUTES, meshopt.MeshoptFilter.OCTAHEDRAL), (meshopt.Mode.TRIANGLES, None),
+            (meshopt.Mode.INDICES, None), (meshopt.Mode.ATTRIBUTES, None), (meshopt.Mode.ATTRIBUTES, meshopt.MeshoptFilter.QUATERNION)])
+        fallback = document.buffers[1]
+        self.assertIsNone(fallback.data)
+        data = bytearray(fallback.byteLength)
+        for bufferView in document.bufferViews:
+            decoded = decode_bufferView(document, bufferView)
+            self.assertEqual(len(decoded), bufferView.byteLength)
+            data[bufferView.byteOffset:bufferView.byteOffset + len(decoded)] = decoded
+        fallback.data = data
+
+        np.testing.assert_array_equal(attributes[gltf.Attribute.POSITION].as_array(), positions)
+        np.testing.assert_allclose(attributes[gltf.Attribute.NORMAL].as_array(), normals, atol=0.02)
+        np.testing.assert_array_equal(rotated_triangles(mesh.primitives[0].indices.as_array()), rotated_triangles(triangles))
+        np.testing.assert_array_equal(mesh.primitives[1].indices.as_array(), np.arange(100))
+        np.testing.assert_array_equal(sampler.input.as_array(), np.arange(10))
+        self.assertEqual(sampler.output.componentType, gltf.ComponentType.SHORT)
+        decoded = sampler.output.as_array()
+        np.testing.assert_allclose(decoded * np.sign(np.sum(decoded * rotations, axis=1))[:, None], rotations, atol=1e-3)
+
+
+class CompressTest(unittest.TestCase):
+    def test_save_glb_with_fallback(self):
+        # The fallback buffer is written to the GLB along with the compressed streams.
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        positions = np.random.default_rng(0).random((100, 3)).astype(np.float32)
+        accessor = builder.add_array(positions, gltf.BufferTarget.ARRAY_BUFFER)
+        indices = builder.add_array(np.arange(99, dtype=np.uint16), gltf.BufferTarget.ELEMENT_ARRAY_BUFFER, bounds=False)
+        mesh = gltf.Mesh([gltf.Primitive({gltf.Attribute.POSITION: accessor}, indices, None)])
+        document.add_mesh(mesh)
+        node = gltf.Node(mesh=mesh)
+        document.add_node(node)
+        document.add_scene(gltf.Scene(nodes=[node]))
+        meshopt.compress(document, fallback=True, max_workers=1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "compressed.glb")
+            document.save_glb(path)
+            loaded = gltf.Document.load(path)
+            self.assertEqual(len(loaded.buffers), 1)
+            self.assertLessEqual(loaded.buffers[0].byteLength, len(loaded.buffers[0].data))
+            np.testing.assert_array_equal(loaded.accessors[0].as_array(), positions)
+            np.testing.assert_array_equal(loaded.accessors[1].as_array(), np.arange(99))
+            del loaded
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,372 @@
+import json
+import unittest
+
+import numpy as np
+
+from pygltf import gltf2 as gltf
+from pygltf import optimize
+
+
+class QuantizeTest(unittest.TestCase):
+    def test_positions_with_caller_builder(self):
+        # Two primitives of one mesh, quantized with the builder that wrote their positions.
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        rng = np.random.default_rng(0)
+        values = [rng.random((5000, 3)).astype(np.float32) for _ in range(2)]
+        mesh = gltf.Mesh([gltf.Primitive({gltf.Attribute.POSITION: builder.add_array(value, gltf.BufferTarget.ARRAY_BUFFER)}, None, None) for value in values])
+        document.add_mesh(mesh)
+        node = gltf.Node(mesh=mesh)
+        document.add_node(node)
+        document.add_scene(gltf.Scene(nodes=[node]))
+        optimize.quantize(document, builder)
+        nodes, world = document.scenes[0].world_matrices()
+        self.assertEqual(nodes, [node])
+        for primitive, value in zip(mesh.primitives, values):
+            grid = primitive.attributes[gltf.Attribute.POSITION].as_array()
+            self.assertEqual(grid.dtype, np.uint16)
+            restored = grid @ world[0, :3, :3].T + world[0, :3, 3]
+            np.testing.assert_allclose(restored, value, atol=1e-4)
+
+    def test_skin_joints_keep_their_transforms(self):
+        # A static mesh on a joint and on a node below a joint; the joint matrices must not change.
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        values = np.random.default_rng(0).random((50, 3)).astype(np.float32) * 10
+        mesh = gltf.Mesh([gltf.Primitive({gltf.Attribute.POSITION: builder.add_array(values, gltf.BufferTarget.ARRAY_BUFFER)}, None, None)])
+        document.add_mesh(mesh)
+        below = gltf.Node(mesh=mesh, translation=[0.0, 0.0, 1.0])
+        leaf = gltf.Node(mesh=mesh, translation=[0.0, 1.0, 0.0], children=[below])
+        joint = gltf.Node(mesh=mesh, translation=[1.0, 0.0, 0.0])
+        root = gltf.Node(children=[joint, leaf], rotation=[0.0, 0.0, np.sin(0.5), np.cos(0.5)])
+        skin = gltf.Skin([root, joint])
+        document.add_skin(skin)
+        skinned = gltf.Node(skin=skin)
+        document.add_nodes([root, joint, leaf, below, skinned])
+        document.add_scene(gltf.Scene(nodes=[root, skinned]))
+        scene = document.scenes[0]
+        before = skin.joint_matrices(scene)
+        transforms = [(node.translation, node.rotation, node.scale) for node in (root, joint, leaf, below)]
+        optimize.quantize(document, builder)
+        np.testing.assert_allclose(skin.joint_matrices(scene), before)
+        self.assertEqual([(node.translation, node.rotation, node.scale) for node in (root, joint, leaf, below)], transforms)
+        nodes, world = scene.world_matrices()
+        for node in (joint, leaf, below):
+            self.assertIsNone(node.mesh)
+            child = node.children[-1]
+            self.assertIs(child.mesh, mesh)
+            grid = mesh.primitives[0].attributes[gltf.Attribute.POSITION].as_array()
+            restored = grid @ world[nodes.index(child), :3, :3].T + world[nodes.index(child), :3, 3]
+            expected = values @ world[nodes.index(node), :3, :3].T + world[nodes.index(node), :3, 3]
+            np.testing.assert_allclose(restored, expected, atol=1e-3)
+
+
+
+def grid(size, seed=0):
+    # A size x size grid of quads as two triangles each, in random triangle order, and its vertex positions.
+    rows, columns = np.divmod(np.arange(size * size), size)
+    corner = (rows * (size + 1) + columns)[:, None]
+    triangles = np.concatenate([corner + [0, 1, size + 1], corner + [1, size + 2, size + 1]])
+    triangles = triangles[np.random.default_rng(seed).permutation(len(triangles))]
+    positions = np.stack(np.divmod(np.arange((size + 1) ** 2), size + 1) + (np.zeros((size + 1) ** 2),), axis=1)
+    return triangles.astype(np.uint32).ravel(), positions.astype(np.float32)
+
+def corner_positions(indices, positions):
+    # The triangles as rows of corner positions, sorted, so that two orders of the same triangles compare equal.
+    rows = positions[np.asarray(indices).reshape(-1, 3)].reshape(-1, 9)
+    return rows[np.lexsort(rows.T[::-1])]
+
+
+class VertexCacheTest(unittest.TestCase):
+    def test_optimize_vertex_cache(self):
+        indices, _ = grid(30)
+        result = optimize.optimize_vertex_cache(indices)
+        self.assertEqual(result.dtype, indices.dtype)
+        self.assertEqual(sorted(map(tuple, result.reshape(-1, 3).tolist())), sorted(map(tuple, indices.reshape(-1, 3).tolist())))
+        before, after = optimize.cache_miss_ratio(indices), optimize.cache_miss_ratio(result)
+        self.assertGreater(before, 2.0)
+        self.assertLess(after, 0.9)
+
+    def test_optimize_vertex_fetch(self):
+        indices = np.array([5, 3, 7, 7, 3, 0], np.uint16)
+        result, order = optimize.optimize_vertex_fetch(indices, 8)
+        np.testing.assert_array_equal(result, [0, 1, 2, 2, 1, 3])
+        np.testing.assert_array_equal(order, [5, 3, 7, 0])
+        self.assertEqual(result.dtype, np.uint16)
+
+    def test_reorder_mesh(self):
+        indices, positions = grid(10)
+        result, attributes = optimize.reorder_mesh(indices, {"POSITION": positions})
+        np.testing.assert_array_equal(corner_positions(result, attributes["POSITION"]), corner_positions(indices, positions))
+        first = np.unique(result, return_index=True)[1]
+        np.testing.assert_array_equal(first, np.sort(first))
+
+    def test_optimize_primitive(self):
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        indices, positions = grid(10)
+        primitive = gltf.Primitive({gltf.Attribute.POSITION: builder.add_array(positions, gltf.BufferTarget.ARRAY_BUFFER)},
+            builder.add_array(indices, gltf.BufferTarget.ELEMENT_ARRAY_BUFFER, bounds=False), None)
+        optimize.optimize_primitive(primitive, builder)
+        result = primitive.indices.as_array()
+        np.testing.assert_array_equal(corner_positions(result, primitive.attributes[gltf.Attribute.POSITION].as_array()), corner_positions(indices, positions))
+        self.assertLess(optimize.cache_miss_ratio(result), optimize.cache_miss_ratio(indices))
+        primitive.mode = gltf.PrimitiveMode.TRIANGLE_STRIP
+        with self.assertRaises(ValueError):
+            optimize.optimize_primitive(primitive, builder)
+
+
+class SimplifyTest(unittest.TestCase):
+    def test_flat_grid(self):
+        indices, positions = grid(20)
+        result, error = optimize.simplify(indices, positions, 200)
+        triangles = result.reshape(-1, 3)
+        self.assertLessEqual(len(triangles), 200)
+        self.assertGreater(len(triangles), 100)
+        self.assertLess(error, 1e-9)
+        # Border vertices are locked, and no triangle flips.
+        border = np.flatnonzero((positions[:, :2] == 0).any(axis=1) | (positions[:, :2] == 20).any(axis=1))
+        self.assertTrue(np.isin(border, result).all())
+        corners = positions[triangles]
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        self.assertTrue((normals[:, 2] < 0).all())
+        # The surface keeps its area.
+        self.assertAlmostEqual(np.abs(normals[:, 2]).sum() / 2, 400.0)
+
+    def test_target_error(self):
+        indices, positions = grid(20)
+        positions[:, 2] = np.sin(positions[:, 0]) * np.cos(positions[:, 1])
+        loose, loose_error = optimize.simplify(indices, positions, 0)
+        tight, tight_error = optimize.simplify(indices, positions, 0, target_error=0.01)
+        self.assertLessEqual(tight_error, 0.01)
+        self.assertGreater(len(tight), len(loose))
+        self.assertGreater(loose_error, tight_error)
+        self.assertEqual(len(optimize.simplify(indices, positions, len(indices) // 3)[0]), len(indices))
+
+    def test_generate_lods(self):
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        indices, positions = grid(16)
+        attributes = {gltf.Attribute.POSITION: builder.add_array(positions, gltf.BufferTarget.ARRAY_BUFFER)}
+        mesh = gltf.Mesh([gltf.Primitive(attributes, builder.add_array(indices, gltf.BufferTarget.ELEMENT_ARRAY_BUFFER, bounds=False), None)], name="terrain")
+        document.add_mesh(mesh)
+        node = gltf.Node(mesh=mesh, translation=[1.0, 2.0, 3.0])
+        document.add_node(node)
+        document.add_scene(gltf.Scene(nodes=[node]))
+        lods = optimize.generate_lods(document, node, builder)
+        self.assertEqual(node.lods, lods)
+        self.assertEqual([lod.mesh.name for lod in lods], ["terrain LOD1", "terrain LOD2", "terrain LOD3"])
+        counts = [primitive.indices.count // 3 for primitive in [mesh.primitives[0]] + [lod.mesh.primitives[0] for lod in lods]]
+        self.assertEqual(counts[0], 512)
+        for count, ratio in zip(counts[1:], (0.5, 0.25, 0.125)):
+            self.assertLessEqual(count, 512 * ratio)
+        for lod in lods:
+            self.assertIs(lod.mesh.primitives[0].attributes[gltf.Attribute.POSITION], attributes[gltf.Attribute.POSITION])
+            self.assertEqual(lod.translation, node.translation)
+        self.assertEqual(node.extras["MSFT_screencoverage"], [0.5, 0.25, 0.125, 0.0625])
+        self.assertIn("MSFT_lod", document.extensionsUsed)
+        output = document.togltf()
+        self.assertEqual(output["nodes"][0]["extensions"]["MSFT_lod"]["ids"], [1, 2, 3])
+        loaded = gltf.Document.fromgltf(output)
+        self.assertEqual(loaded.nodes[0].lods, loaded.nodes[1:])
+        self.assertIsNone(loaded.nodes[0].extensions)
+
+
+class InstanceTest(unittest.TestCase):
+    def build(self, count=4):
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        positions = builder.add_array(np.eye(3, dtype=np.float32), gltf.BufferTarget.ARRAY_BUFFER)
+        mesh = gltf.Mesh([gltf.Primitive({gltf.Attribute.POSITION: positions}, None, None)], name="tree")
+        document.add_mesh(mesh)
+        nodes = [gltf.Node(mesh=mesh, translation=[float(i), 0.0, 0.0], rotation=[0.0, 0.0, np.sin(i / 2), np.cos(i / 2)], scale=[1.0, 1.0 + i, 1.0]) for i in range(count)]
+        root = gltf.Node(name="forest", children=list(nodes))
+        document.add_nodes([root] + nodes)
+        document.scene = gltf.Scene(nodes=[root])
+        document.add_scene(document.scene)
+        return document, builder, root, nodes
+
+    def test_add_instances(self):
+        document, builder, _, nodes = self.build()
+        translation = np.arange(6, dtype=np.float64).reshape(2, 3)
+        node = document.add_instances(builder, nodes[0].mesh, translation, scale=np.ones((2, 3)), name="pair")
+        self.assertEqual(sorted(node.instances), ["SCALE", "TRANSLATION"])
+        np.testing.assert_array_equal(node.instances["TRANSLATION"].as_array(), translation)
+        self.assertEqual(node.instances["TRANSLATION"].bufferView.byteOffset % 4, 0)
+        self.assertIn("EXT_mesh_gpu_instancing", document.extensionsRequired)
+        output = node.togltf()["extensions"]["EXT_mesh_gpu_instancing"]["attributes"]
+        self.assertEqual(output, {"TRANSLATION": node.instances["TRANSLATION"].key, "SCALE": node.instances["SCALE"].key})
+        with self.assertRaises(ValueError):
+            document.add_instances(builder, nodes[0].mesh, translation, scale=np.ones((3, 3)))
+
+    def test_instance_nodes(self):
+        document, builder, root, nodes = self.build()
+        matrices = gltf.local_matrices(nodes)
+        result = optimize.instance_nodes(document, builder)
+        self.assertEqual(len(result), 1)
+        node = result[0]
+        self.assertEqual(root.children, [node])
+        self.assertEqual(document.nodes, [root, node])
+        self.assertEqual([value.key for value in document.nodes], [0, 1])
+        instances = {key: accessor.as_array() for key, accessor in node.instances.items()}
+        np.testing.assert_allclose(gltf.trs_matrices(instances["TRANSLATION"], instances["ROTATION"], instances["SCALE"]), matrices, atol=1e-6)
+        self.assertEqual(optimize.instance_nodes(document, builder), [])
+
+    def test_instance_nodes_keeps_animated_and_sheared(self):
+        document, builder, root, nodes = self.build(5)
+        nodes[1].matrix = [1.0, 0.0, 0.0, 0.0, 1.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+        sampler = gltf.AnimationSampler(builder.add_array(np.zeros(1, np.float32)), builder.add_array(np.zeros((1, 3), np.float32)), interpolation=gltf.Interpolation.STEP)
+        document.add_animation(gltf.Animation([gltf.AnimationChannel(0, gltf.AnimationChannelTarget(nodes[2], gltf.TargetPath.TRANSLATION))], [sampler]))
+        result = optimize.instance_nodes(document, builder, min_count=4)
+        self.assertEqual(len(result), 0)
+        result = optimize.instance_nodes(document, builder)
+        self.assertEqual(root.children, [result[0], nodes[1], nodes[2]])
+        self.assertEqual(result[0].instances["TRANSLATION"].count, 3)
+        self.assertEqual(nodes[2].key, document.nodes.index(nodes[2]))
+        self.assertEqual(json.loads(json.dumps(document.togltf()))["animations"][0]["channels"][0]["target"]["node"], nodes[2].key)
+
+    def test_instance_nodes_keeps_referenced_nodes(self):
+        # Node 1 is also the child of another node, node 2 an LOD level and node 3 listed twice; 0, 4 and 5 are instanced.
+        document, builder, root, nodes = self.build(6)
+        other = gltf.Node(name="other", children=[nodes[1]])
+        lodded = gltf.Node(name="lodded", mesh=nodes[0].mesh, lods=[nodes[2]])
+        root.children.append(nodes[3])
+        document.add_nodes([other, lodded])
+        result = optimize.instance_nodes(document, builder)
+        self.assertEqual(result[0].instances["TRANSLATION"].count, 3)
+        self.assertEqual(root.children, [result[0], nodes[1], nodes[2], nodes[3], nodes[3]])
+        self.assertEqual(other.children, [nodes[1]])
+        self.assertEqual(lodded.lods, [nodes[2]])
+        for node in nodes[1:4]:
+            self.assertIn(node, document.nodes)
+        output = document.togltf()["nodes"]
+        self.assertEqual(output[other.key]["children"], [nodes[1].key])
+        self.assertEqual(output[lodded.key]["extensions"]["MSFT_lod"]["ids"], [nodes[2].key])
+        self.assertEqual([node.key for node in document.nodes], list(range(len(document.nodes))))
+
+
+class CompactTest(unittest.TestCase):
+    def test_builder_after_compaction(self):
+        # A builder keeps appending to the compacted buffer.
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        builder.add_array(np.zeros(300, np.float32))
+        kept = builder.add_array(np.arange(9, dtype=np.float32))
+        mesh = gltf.Mesh([gltf.Primitive({gltf.Attribute.POSITION: kept}, None, None)])
+        document.add_mesh(mesh)
+        node = gltf.Node(mesh=mesh)
+        document.add_node(node)
+        document.add_scene(gltf.Scene(nodes=[node]))
+        document.prune()
+        added = builder.add_array(np.full(4, 7, np.float32))
+        buffer = document.buffers[0]
+        self.assertEqual(buffer.byteLength, len(buffer.data))
+        self.assertLessEqual(added.bufferView.byteOffset + added.bufferView.byteLength, buffer.byteLength)
+        np.testing.assert_array_equal(kept.as_array(), np.arange(9))
+        np.testing.assert_array_equal(added.as_array(), [7, 7, 7, 7])
+        optimize.deduplicate(document)
+        again = builder.add_array(np.full(2, 3, np.float32))
+        self.assertEqual(buffer.byteLength, len(buffer.data))
+        np.testing.assert_array_equal(again.as_array(), [3, 3])
+
+
+class MergePrimitivesTest(unittest.TestCase):
+    def test_scene_with_node_table(self):
+        # Nodes are merged, table rows are left alone.
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        positions = builder.add_array(np.eye(3, dtype=np.float32), gltf.BufferTarget.ARRAY_BUFFER)
+        mesh = gltf.Mesh([gltf.Primitive({gltf.Attribute.POSITION: positions}, None, None)])
+        document.add_mesh(mesh)
+        nodes = [gltf.Node(mesh=mesh, translation=[float(i), 0.0, 0.0]) for i in range(2)]
+        document.add_nodes(nodes)
+        table = gltf.NodeTable(3, mesh=0, meshes=[mesh])
+        document.add_node_table(table)
+        document.add_scene(gltf.Scene(nodes=nodes + table.roots()))
+        node = optimize.merge_primitives(document)
+        self.assertEqual(node.mesh.primitives[0].attributes[gltf.Attribute.POSITION].count, 6)
+        self.assertEqual(len(document.scenes[0].nodes), 6)
+
+    def test_attribute_types(self):
+        # VEC3 and VEC4 colors go to separate primitives.
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        positions = builder.add_array(np.eye(3, dtype=np.float32), gltf.BufferTarget.ARRAY_BUFFER)
+        meshes = []
+        for width in (3, 4):
+            colors = builder.add_array(np.full((3, width), 0.5, np.float32), gltf.BufferTarget.ARRAY_BUFFER)
+            meshes.append(gltf.Mesh([gltf.Primitive({gltf.Attribute.POSITION: positions, gltf.Attribute.COLOR_0: colors}, None, None)]))
+        document.add_meshes(meshes)
+        nodes = [gltf.Node(mesh=meshes[i % 2], translation=[float(i), 0.0, 0.0]) for i in range(4)]
+        document.add_nodes(nodes)
+        document.add_scene(gltf.Scene(nodes=nodes))
+        node = optimize.merge_primitives(document)
+        primitives = sorted(node.mesh.primitives, key=lambda primitive: primitive.attributes[gltf.Attribute.COLOR_0].type.value)
+        self.assertEqual([primitive.attributes[gltf.Attribute.COLOR_0].type for primitive in primitives], [gltf.AccessorType.VEC3, gltf.AccessorType.VEC4])
+        for primitive in primitives:
+            self.assertEqual(primitive.attributes[gltf.Attribute.POSITION].count, 6)
+            np.testing.assert_array_equal(primitive.attributes[gltf.Attribute.COLOR_0].as_array(), 0.5)
+
+    def test_mirrored_tangents(self):
+        document = gltf.Document()
+        builder = gltf.BufferBuilder(document)
+        attributes = {
+            gltf.Attribute.POSITION: builder.add_array(np.eye(3, dtype=np.float32), gltf.BufferTarget.ARRAY_BUFFER),
+            gltf.Attribute.NORMAL: builder.add_array(np.tile(np.array([0, 0, 1], np.float32), (3, 1)), gltf.BufferTarget.ARRAY_BUFFER),
+            gltf.Attribute.TANGENT: builder.add_array(np.tile(np.array([1, 0, 0, 1], np.float32), (3, 1)), gltf.BufferTarget.ARRAY_BUFFER),
+        }
+        mesh = gltf.Mesh([gltf.Primitive(attributes, builder.add_array(np.array([0, 1, 2], np.uint16), gltf.BufferTarget.ELEMENT_ARRAY_BUFFER), None)])
+        document.add_mesh(mesh)
+        nodes = [gltf.Node(mesh=mesh), gltf.Node(mesh=mesh, scale=[-1.0, 1.0, 1.0])]
+        document.add_nodes(nodes)
+        document.add_scene(gltf.Scene(nodes=nodes))
+        primitive = optimize.merge_primitives(document).mesh.primitives[0]
+        np.testing.assert_array_equal(primitive.attributes[gltf.Attribute.TANGENT].as_array(), [[1, 0, 0, 1]] * 3 + [[-1, 0, 0, -1]] * 3)
+        np.testing.assert_array_equal(primitive.attributes[gltf.Attribute.NORMAL].as_array(), [[0, 0, 1]] * 6)
+        np.testing.assert_array_equal(primitive.indices.as_array(), [0, 1, 2, 3, 5, 4])
+
+
+class IncrementalTest(unittest.TestCase):
+    # Passes that change lists and dicts in place must show up in the next incremental export.
+    def build(self):
+        document = gltf.Document(incremental=True)
+        builder = gltf.BufferBuilder(document)
+        positions = builder.add_array(np.eye(3, dtype=np.float32), gltf.BufferTarget.ARRAY_BUFFER)
+        normals = builder.add_array(np.eye(3, dtype=np.float32), gltf.BufferTarget.ARRAY_BUFFER)
+        mesh = gltf.Mesh([gltf.Primitive({gltf.Attribute.POSITION: positions, gltf.Attribute.NORMAL: normals}, None, None)])
+        document.add_mesh(mesh)
+        nodes = [gltf.Node(mesh=mesh, translation=[float(i), 0.0, 0.0]) for i in range(3)]
+        nodes[0].children = [nodes[2]]
+        document.add_nodes(nodes)
+        document.add_scene(gltf.Scene(nodes=nodes[:2]))
+        document.togltf()
+        return document, builder
+    
+    def assertFresh(self, document):
+        cached = "".join(document.iter_json())
+        document.incremental = False
+        self.assertEqual(cached, "".join(document.iter_json()))
+        document.incremental = True
+    
+    def test_merge_primitives(self):
+        document, _ = self.build()
+        optimize.merge_primitives(document)
+        self.assertFresh(document)
+    
+    def test_quantize(self):
+        document, builder = self.build()
+        optimize.quantize(document, builder)
+        self.assertFresh(document)
+    
+    def test_optimize_primitive(self):
+        document, builder = self.build()
+        optimize.optimize_primitive(document.meshes[0].primitives[0], builder)
+        self.assertFresh(document)
+    
+    def test_weld(self):
+        document, builder = self.build()
+        document.meshes[0].primitives[0].weld(builder)
+        self.assertFresh(document)
+
+if __name__ == "__main__":
+    unittest.main()